@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
 ]
 
@@ -49,6 +50,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Cached request.user with its profile (core/identity.py); needs a shared cache
+    'core.identity.IdentityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,6 +92,15 @@ DATABASES = {
         },
     }
 }
+# Without PGDATABASE (CI, offline development) a local SQLite file stands
+# in; search and counts fall back to their non-Postgres paths
+if not os.getenv("PGDATABASE"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
 
 
 
@@ -135,6 +147,25 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploaded files (core/storage.py): Supabase Storage, or "local" to keep
+# them under LOCAL_STORAGE_ROOT for offline development and testing
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase")
+LOCAL_STORAGE_ROOT = MEDIA_ROOT / "storage"
+# Uploads wait here until `manage.py process_uploads` stores them
+# (core/uploads.py); the uploader must run on the same disk as the web workers
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", str(MEDIA_ROOT / "spool"))
+# Per-field type and size limits are checked while the body is parsed
+# (core/upload_limits.py); anything over 512 KB goes to a temporary file
+FILE_UPLOAD_HANDLERS = [
+    "core.upload_limits.LimitedUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = 512 * 1024
+# /health/storage/ is for staff, or monitors sending
+# "Authorization: Bearer <HEALTH_CHECK_TOKEN>"; unset means staff only
+HEALTH_CHECK_TOKEN = os.getenv("HEALTH_CHECK_TOKEN", "")
+
 
 
 # Default primary key field type
@@ -143,6 +174,41 @@ MEDIA_ROOT = BASE_DIR / "media"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Listing data, the catalog version and signed-in users are cached in the
+# default cache (core/caching.py, core/identity.py), and every worker process
+# must see the same one: the versions bumped by management commands and by
+# other workers only reach a worker through it. The file-based cache shares
+# it between the processes on one host without extra services; point
+# CACHE_LOCATION at a shared volume, or configure a cache server here, when
+# running on several hosts. CACHE_BACKEND=locmem keeps it in process memory,
+# which is only right for a single process (e.g. runserver); the core.W001
+# check warns about it.
+if os.getenv("CACHE_BACKEND") == "locmem":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "studyhive",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CACHE_LOCATION", str(BASE_DIR / ".cache")),
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+
+# Map view defaults (Cebu City)
+MAP_DEFAULT_CENTER = (10.3157, 123.8854)
+MAP_DEFAULT_ZOOM = 13
+
+# Place names -> coordinates used by `manage.py geocode_spots`
+GEOCODER_GAZETTEER = BASE_DIR / "data" / "gazetteer.csv"
+
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "login"
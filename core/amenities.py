@@ -0,0 +1,64 @@
+"""
+Amenity flags packed into StudySpot.amenity_mask.
+
+Each boolean amenity column owns one bit of the mask, so any combination
+of filters becomes a single indexed ``amenity_mask IN (...)`` predicate.
+Bits are stored in the database: only ever append to AMENITIES, never
+reorder or remove entries.
+"""
+
+# filter key (as used in ?amenities= / ?filter=) -> StudySpot field
+AMENITIES = {
+    "wifi": "wifi",
+    "ac": "ac",
+    "free": "free",
+    "coffee": "coffee",
+    "open24": "open_24_7",
+    "outlets": "outlets",
+    "pastries": "pastries",
+    "trending": "is_trending",
+}
+AMENITY_BITS = {key: 1 << i for i, key in enumerate(AMENITIES)}
+AMENITY_FIELDS = tuple(AMENITIES.values())
+ALL_BITS = (1 << len(AMENITIES)) - 1
+
+
+def mask_for_spot(spot):
+    mask = 0
+    for key, field in AMENITIES.items():
+        if getattr(spot, field):
+            mask |= AMENITY_BITS[key]
+    return mask
+
+
+def mask_for(keys):
+    mask = 0
+    for key in keys:
+        mask |= AMENITY_BITS[key]
+    return mask
+
+
+def keys_for_mask(mask):
+    return [key for key, bit in AMENITY_BITS.items() if mask & bit]
+
+
+def parse_amenities(value):
+    """
+    Turn "wifi,outlets,open24" into ("wifi", "outlets", "open24"), dropping
+    unknown and duplicate keys. Order follows AMENITIES so equal filters
+    always normalise to the same tuple.
+    """
+    requested = {part.strip().lower() for part in (value or "").split(",")}
+    return tuple(key for key in AMENITIES if key in requested)
+
+
+def matching_masks(required):
+    """Every mask value that has all of the ``required`` bits set."""
+    return [mask for mask in range(ALL_BITS + 1) if mask & required == required]
+
+
+def filter_by_amenities(queryset, keys):
+    required = mask_for(keys)
+    if not required:
+        return queryset
+    return queryset.filter(amenity_mask__in=matching_masks(required))
@@ -0,0 +1,91 @@
+"""
+Catalog-versioned caching.
+
+Cached data derived from StudySpot and Review rows is keyed by the current
+catalog version, and the StudySpot and Review signals bump the version
+(once the write has committed), so invalidating everything is one cache
+increment. Stale entries are
+never read again and simply expire, so nothing has to enumerate or delete
+keys. The version lives in the default cache, which settings.CACHES
+shares between every worker (file-based by default); the core.W001 check
+warns when it is not.
+
+The in-memory spot indexes (core/indexing.py) catch up with the catalog
+version row by row; the separate index version makes them rebuild from
+scratch, and only bulk writes bump it.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = "catalog:version"
+INDEX_VERSION_KEY = "catalog:index-version"
+# Backends whose entries only the writing process sees
+PROCESS_LOCAL_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+def cache_is_shared():
+    """Whether every worker process sees the same default cache."""
+    return settings.CACHES["default"]["BACKEND"] not in PROCESS_LOCAL_BACKENDS
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so an evicted counter never reuses old keys
+        version = time.time_ns() // 1000
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Key missing (evicted or never set): _version() starts afresh
+        return _version(key)
+
+
+def catalog_version():
+    return _version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return _bump(CATALOG_VERSION_KEY)
+
+
+def index_version():
+    return _version(INDEX_VERSION_KEY)
+
+
+def bump_index_version():
+    """Make every worker rebuild its spot indexes; for bulk writes."""
+    return _bump(INDEX_VERSION_KEY)
+
+
+def versioned_key(prefix, *parts):
+    """``prefix:<version>:<digest of parts>`` for the current catalog."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f"{prefix}:{catalog_version()}:{digest}"
+
+
+def get_or_compute(prefix, parts, compute, timeout):
+    """
+    The cached value for ``parts`` in the current catalog, calling
+    ``compute()`` and caching its (non-None) result on a miss.
+    """
+    # The key is taken before computing: if the catalog changes meanwhile,
+    # the result lands under the old version and is never served.
+    key = versioned_key(prefix, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
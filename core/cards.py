@@ -0,0 +1,68 @@
+"""
+Cached HTML for the study spot cards on the listing pages.
+
+Each card is rendered once per (variant, spot id, spot.updated_at) and
+kept in the default cache; a page of cards is fetched with one get_many,
+so only spots changed since the last render go through the template
+again. Parts that depend on the viewer (owner controls with their CSRF
+token, the distance in "near me" listings) are left as ``<!--card:...-->``
+holes in the cached HTML and rendered per request from tiny templates.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template import Context
+from django.utils.safestring import mark_safe
+
+CARD_TIMEOUT = 60 * 60 * 24
+
+# variant -> (card template, {hole marker: template rendering the hole})
+VARIANTS = {
+    "home": (
+        "partials/cards/home_card.html",
+        {
+            "<!--card:distance-->": "partials/cards/home_card_distance.html",
+            "<!--card:controls-->": "partials/cards/home_card_controls.html",
+        },
+    ),
+    "map": ("partials/cards/map_card.html", {}),
+}
+
+
+def card_key(variant, spot):
+    # STATIC_VERSION changes with deploys, along with the card markup
+    return f"card:{settings.STATIC_VERSION}:{variant}:{spot.pk}:{spot.updated_at.timestamp()}"
+
+
+def render_cards(spots, variant, context):
+    """
+    [(spot, html)] for ``spots`` in ``variant``, with the holes filled in
+    from ``context`` (the calling template's context).
+    """
+    template_name, holes = VARIANTS[variant]
+    engine = context.template.engine
+    keys = {spot.pk: card_key(variant, spot) for spot in spots}
+    cached = cache.get_many(keys.values())
+
+    missing = {}
+    template = None
+    for spot in spots:
+        key = keys[spot.pk]
+        if key not in cached:
+            template = template or engine.get_template(template_name)
+            cached[key] = missing[key] = template.render(
+                Context({"spot": spot}, autoescape=context.autoescape)
+            )
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+
+    hole_templates = {marker: engine.get_template(name) for marker, name in holes.items()}
+    cards = []
+    for spot in spots:
+        html = cached[keys[spot.pk]]
+        if hole_templates:
+            with context.push(spot=spot):
+                for marker, hole in hole_templates.items():
+                    html = html.replace(marker, hole.render(context))
+        cards.append((spot, mark_safe(html)))
+    return cards
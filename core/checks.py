@@ -0,0 +1,27 @@
+"""System checks for the deployment settings the app relies on."""
+
+from django.core import checks
+
+from . import caching
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Catalog and index versions, the storage circuit state and the identity
+    cache only reach other workers through a shared default cache.
+    """
+    if caching.cache_is_shared():
+        return []
+    return [
+        checks.Warning(
+            "The default cache is local to each process.",
+            hint=(
+                "Catalog changes made by management commands or by other "
+                "workers won't reach this one, and the identity cache is "
+                "turned off. Unset CACHE_BACKEND to use the file-based cache, "
+                "or configure a cache server in settings.CACHES."
+            ),
+            id="core.W001",
+        )
+    ]
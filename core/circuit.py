@@ -0,0 +1,118 @@
+"""
+Circuit breaker for calls to an external service (Supabase Storage, see
+core/storage.py).
+
+After ``failure_threshold`` failures in a row the circuit opens: calls
+are refused at once instead of each waiting out a timeout. After
+``reset_timeout`` seconds one trial call is let through (half open); its
+outcome closes the circuit again or reopens it. The state is published
+to the default cache on every change, and again at least every
+PUBLISH_INTERVAL seconds while the breaker is in use, so other processes
+(the web workers, the health endpoint) can see how the uploader's last
+calls went. Without a shared cache each process only sees its own calls.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Seconds between republishing an unchanged state; well under the
+# published entry's lifetime
+PUBLISH_INTERVAL = 60
+
+
+def state_key(name):
+    return f"circuit:{name}"
+
+
+def published(name):
+    """The last state published for circuit ``name``, or None."""
+    return cache.get(state_key(name))
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None  # time.time(), for reporting
+        self._opened = 0.0  # time.monotonic(), for timing
+        self._trial_running = False
+        self._changed = True  # not published yet
+        self._published = 0.0  # time.monotonic() of the last publish
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead now."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                allowed = True
+            elif self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                allowed = True
+            else:
+                allowed = False
+        self.publish()
+        return allowed
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self.opened_at = None
+                self._set_state(CLOSED)
+        self.publish()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.time()
+                self._opened = time.monotonic()
+                self._set_state(OPEN)
+        self.publish()
+
+    def publish(self):
+        """Publish the state if it changed or was last published a while ago."""
+        with self._lock:
+            now = time.monotonic()
+            if not self._changed and now - self._published < PUBLISH_INTERVAL:
+                return
+            self._changed = False
+            self._published = now
+            snapshot = self.snapshot()
+        # Kept long enough to outlive the reset timeout and the publish
+        # interval, short enough that a dead process doesn't leave "open"
+        # behind for good
+        cache.set(state_key(self.name), snapshot, max(self.reset_timeout * 4, 300))
+
+    def retry_in(self):
+        """Seconds until an open circuit lets a trial call through."""
+        if self.state != OPEN:
+            return 0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened))
+
+    def snapshot(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "opened_at": self.opened_at,
+            "published_at": time.time(),
+        }
+
+    def _set_state(self, state):
+        self.state = state
+        self._changed = True
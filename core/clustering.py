@@ -0,0 +1,103 @@
+"""
+Per-zoom marker clustering for the map.
+
+Every spot with coordinates is bucketed into a 64px grid cell at each zoom
+level of the Web Mercator tile pyramid. A cell only keeps a count and
+running sums, so adding, moving or deleting a spot touches one cell per
+zoom level, and a map tile is answered from at most 16 cells however many
+spots the catalog holds.
+"""
+
+import math
+
+from .indexing import SpotIndex
+
+MIN_ZOOM = 0
+MAX_ZOOM = 18
+TILE_SIZE = 256
+CELL_SIZE = 64
+CELLS_PER_TILE = TILE_SIZE // CELL_SIZE
+MAX_LATITUDE = 85.05112878  # Web Mercator cut-off
+
+
+def project(latitude, longitude):
+    """Latitude/longitude to Web Mercator x, y in [0, 1)."""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = (longitude + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def cell_for(latitude, longitude, zoom):
+    x, y = project(latitude, longitude)
+    cells = (TILE_SIZE << zoom) // CELL_SIZE
+    return int(x * cells), int(y * cells)
+
+
+class ClusterIndex(SpotIndex):
+    fields = ("id", "name", "latitude", "longitude")
+
+    def clear(self):
+        self.spots = {}  # spot_id -> (latitude, longitude, name)
+        # zoom -> {(cell_x, cell_y): [count, sum_lat, sum_lng, sum_ids]}
+        # While count == 1, sum_ids is the id of the only spot in the cell.
+        self.levels = {zoom: {} for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)}
+
+    def _apply(self, spot_id, latitude, longitude, sign):
+        for zoom, cells in self.levels.items():
+            key = cell_for(latitude, longitude, zoom)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0, 0.0, 0.0, 0]
+            cell[0] += sign
+            cell[1] += sign * latitude
+            cell[2] += sign * longitude
+            cell[3] += sign * spot_id
+            if cell[0] == 0:
+                del cells[key]
+
+    def add(self, row):
+        if row["latitude"] is None or row["longitude"] is None:
+            return
+        self.spots[row["id"]] = (row["latitude"], row["longitude"], row["name"])
+        self._apply(row["id"], row["latitude"], row["longitude"], 1)
+
+    def discard(self, spot_id):
+        spot = self.spots.pop(spot_id, None)
+        if spot is not None:
+            self._apply(spot_id, spot[0], spot[1], -1)
+
+    def tile(self, zoom, x, y):
+        """Clusters and single spots inside slippy-map tile ``zoom/x/y``."""
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        self.ensure_built()
+
+        results = []
+        with self.lock:
+            cells = self.levels[zoom]
+            for cell_x in range(x * CELLS_PER_TILE, (x + 1) * CELLS_PER_TILE):
+                for cell_y in range(y * CELLS_PER_TILE, (y + 1) * CELLS_PER_TILE):
+                    cell = cells.get((cell_x, cell_y))
+                    if cell is None:
+                        continue
+                    count, sum_lat, sum_lng, sum_ids = cell
+                    if count == 1:
+                        latitude, longitude, name = self.spots[sum_ids]
+                        results.append({
+                            "id": sum_ids,
+                            "name": name,
+                            "latitude": latitude,
+                            "longitude": longitude,
+                            "count": 1,
+                        })
+                    else:
+                        results.append({
+                            "latitude": sum_lat / count,
+                            "longitude": sum_lng / count,
+                            "count": count,
+                        })
+        return results
+
+
+cluster_index = ClusterIndex()
@@ -0,0 +1,33 @@
+"""
+Amenity facet counts for the listing filters ("Wi-Fi (42)").
+
+All counts for a query come from one conditional aggregate and are cached
+per normalised query until the catalog changes (see core/caching.py).
+"""
+
+from django.db.models import Count, Q
+
+from . import amenities, caching, search
+
+FACET_TIMEOUT = 60 * 10
+
+
+def _count_query(queryset):
+    counts = {
+        key: Count("pk", filter=Q(**{field: True}))
+        for key, field in amenities.AMENITIES.items()
+    }
+    return queryset.order_by().aggregate(total=Count("pk"), **counts)
+
+
+def amenity_counts(spot_query):
+    """
+    {"total": n, "wifi": n, ...} for the results of ``spot_query``: how
+    many of them have each amenity, on top of the filters already applied.
+    """
+    return caching.get_or_compute(
+        "facets",
+        (" ".join(search.tokenize(spot_query.q)), spot_query.amenities),
+        lambda: _count_query(spot_query.apply()),
+        FACET_TIMEOUT,
+    )
@@ -30,7 +30,6 @@ class StudySpotForm(forms.ModelForm):
             "open_24_7",
             "outlets",
             "pastries",
-            "is_trending",
         ]
 
         widgets = {
@@ -0,0 +1,178 @@
+"""
+Plain-SQL geospatial helpers for StudySpot (no PostGIS).
+
+Spots store latitude/longitude plus a geohash. A viewport is covered by a
+handful of geohash cells and queried with indexed ``geohash LIKE 'cell%'``
+prefixes, then trimmed to the exact box. Radius queries search the
+bounding box of the circle, let the database rank the candidates by an
+approximate distance so only the nearest few are read, and give those
+their haversine distance.
+"""
+
+import math
+
+from django.db.models import F, Q
+from django.db.models.functions import Abs, Least
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5 m cells
+MAX_COVER_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    value = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        rng, coord = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = (value << 1) | 1
+            rng[0] = mid
+        else:
+            value <<= 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            bit = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height in degrees latitude, width in degrees longitude) of a cell."""
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def parse_bbox(value):
+    """
+    Parse "south,west,north,east" into a tuple of floats. Returns None if
+    the value is missing or malformed.
+    """
+    try:
+        south, west, north, east = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return None
+    return south, west, north, east
+
+
+def parse_point(value):
+    """Parse "lat,lng" into a tuple of floats, or None if malformed."""
+    try:
+        latitude, longitude = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def covering_cells(bbox, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes that together cover ``bbox``, using the finest
+    precision that needs at most ``max_cells`` cells.
+    """
+    south, west, north, east = bbox
+    if west > east:  # crosses the antimeridian
+        return covering_cells((south, west, north, 180.0), max_cells) + covering_cells(
+            (south, -180.0, north, east), max_cells
+        )
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(north / height) - math.floor(south / height) + 1
+        cols = math.floor(east / width) - math.floor(west / width) + 1
+        if rows * cols <= max_cells:
+            break
+
+    cells = set()
+    lat = (math.floor(south / height) + 0.5) * height
+    while lat - height / 2 <= north:
+        lng = (math.floor(west / width) + 0.5) * width
+        while lng - width / 2 <= east:
+            cells.add(
+                encode_geohash(max(-90.0, min(90.0, lat)), max(-180.0, min(180.0, lng)), precision)
+            )
+            lng += width
+        lat += height
+    return sorted(cells)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """Bounding box (south, west, north, east) of a circle on the sphere."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-6 or abs(latitude) + dlat >= 90:
+        return max(-90.0, latitude - dlat), -180.0, min(90.0, latitude + dlat), 180.0
+
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    west = longitude - dlng
+    east = longitude + dlng
+    if dlng >= 180:
+        west, east = -180.0, 180.0
+    else:
+        west = west + 360 if west < -180 else west
+        east = east - 360 if east > 180 else east
+    return latitude - dlat, west, latitude + dlat, east
+
+
+def filter_bbox(queryset, bbox):
+    """Spots inside ``bbox``: indexed geohash prefixes, then the exact box."""
+    south, west, north, east = bbox
+
+    cells = Q()
+    for cell in covering_cells(bbox):
+        cells |= Q(geohash__startswith=cell)
+
+    queryset = queryset.filter(cells, latitude__gte=south, latitude__lte=north)
+    if west <= east:
+        return queryset.filter(longitude__gte=west, longitude__lte=east)
+    return queryset.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+
+
+def order_by_distance(queryset, latitude, longitude):
+    """
+    ``queryset`` nearest first. The database ranks by planar distance, with
+    longitude scaled at ``latitude``: near enough to haversine for the
+    radii queried here, and cheap in plain SQL.
+    """
+    dlat = F("latitude") - latitude
+    dlng = Abs(F("longitude") - longitude)
+    dlng = Least(dlng, 360 - dlng) * math.cos(math.radians(latitude))  # across the antimeridian
+    return queryset.annotate(planar_distance=dlat * dlat + dlng * dlng).order_by(
+        "planar_distance", "id"
+    )
+
+
+def nearest(rows, latitude, longitude, radius_km=None, limit=None):
+    """
+    Attach ``distance_km`` to each row (dicts with latitude/longitude) and
+    return them nearest first, dropping anything beyond ``radius_km``.
+    """
+    results = []
+    for row in rows:
+        distance = haversine_km(latitude, longitude, row["latitude"], row["longitude"])
+        if radius_km is None or distance <= radius_km:
+            row["distance_km"] = round(distance, 3)
+            results.append(row)
+    results.sort(key=lambda row: (row["distance_km"], row["id"]))
+    return results[:limit] if limit else results
@@ -0,0 +1,105 @@
+"""
+Offline geocoding of StudySpot.location against a local gazetteer.
+
+Addresses are normalised ("Brgy. Lahug, Cebu City" -> "barangay lahug cebu
+city") and looked up in GeocodeCache, so each distinct address is resolved
+at most once. Listing views only read the cache and queue misses; the
+``geocode_spots`` command does the actual resolving in batches.
+"""
+
+import csv
+import re
+import unicodedata
+
+from django.conf import settings
+
+from .models import GeocodeCache
+
+ABBREVIATIONS = {
+    "st": "street",
+    "ave": "avenue",
+    "blvd": "boulevard",
+    "rd": "road",
+    "hwy": "highway",
+    "brgy": "barangay",
+    "bgy": "barangay",
+    "sto": "santo",
+    "sta": "santa",
+    "mt": "mount",
+    "univ": "university",
+}
+_NON_WORD = re.compile(r"[^\w]+")
+MAX_ADDRESS_LENGTH = 512  # GeocodeCache.address
+
+
+def normalize_address(address):
+    """Lowercase, strip accents and punctuation, expand abbreviations."""
+    text = unicodedata.normalize("NFKD", address or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    words = _NON_WORD.sub(" ", text).split()
+    return " ".join(ABBREVIATIONS.get(word, word) for word in words)[:MAX_ADDRESS_LENGTH]
+
+
+class Gazetteer:
+    """
+    Place names to coordinates. Addresses are written most specific part
+    first, so an address resolves to the leftmost place name it contains
+    (as whole words), taking the longest name at that position: "IT Park,
+    Lahug, Cebu City" matches "it park" rather than "lahug" or "cebu city".
+    """
+
+    def __init__(self, places=()):
+        self.places = {}
+        self.longest = 0
+        for name, latitude, longitude in places:
+            self.add(name, latitude, longitude)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Load a CSV with ``name,latitude,longitude`` columns."""
+        gazetteer = cls()
+        with open(path, newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                try:
+                    gazetteer.add(row["name"], float(row["latitude"]), float(row["longitude"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return gazetteer
+
+    def add(self, name, latitude, longitude):
+        key = normalize_address(name)
+        if key:
+            self.places[key] = (latitude, longitude)
+            self.longest = max(self.longest, len(key.split()))
+
+    def __len__(self):
+        return len(self.places)
+
+    def resolve(self, normalized):
+        """Coordinates for an already normalised address, or None."""
+        words = normalized.split()
+        for start in range(len(words)):
+            for length in range(min(self.longest, len(words) - start), 0, -1):
+                match = self.places.get(" ".join(words[start:start + length]))
+                if match:
+                    return match
+        return None
+
+
+def load_gazetteer(path=None):
+    return Gazetteer.from_csv(path or settings.GEOCODER_GAZETTEER)
+
+
+def cached_coordinates(address):
+    """
+    (latitude, longitude) for ``address`` if it has been geocoded, else
+    None. Unknown addresses are queued for the next ``geocode_spots`` run;
+    nothing here resolves an address itself.
+    """
+    key = normalize_address(address)
+    if not key:
+        return None
+    entry, _ = GeocodeCache.objects.get_or_create(address=key)
+    if entry.status != GeocodeCache.RESOLVED:
+        return None
+    return entry.latitude, entry.longitude
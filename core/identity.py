@@ -0,0 +1,84 @@
+"""
+Per-request user loading backed by a short-lived cache.
+
+``IdentityMiddleware`` replaces the lazy ``request.user`` set by
+AuthenticationMiddleware with one that reads the User, with its
+UserProfile already attached, from the default cache. A page then costs
+the session lookup and nothing else for identity, however many times the
+view and templates touch ``request.user.userprofile``. The User and
+UserProfile signals drop the cached entry (see core/signals.py).
+
+That only reaches other workers through a shared cache, or a deactivated
+user would stay logged in elsewhere until the entry expires. With a
+per-process cache (CACHE_BACKEND=locmem) the middleware turns itself off,
+the core.W001 check says so (core/checks.py), and Django's uncached
+request.user is used.
+"""
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from . import caching
+from .models import UserProfile
+
+IDENTITY_TIMEOUT = 60 * 5
+
+
+def identity_key(user_id):
+    return f"identity:{user_id}"
+
+
+def forget_user(user_id):
+    cache.delete(identity_key(user_id))
+
+
+def _session_is_valid(request, user):
+    """The checks auth.get_user() makes on the session, minus the query."""
+    session = request.session
+    if session.get(auth.BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return False
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    return bool(session_hash) and constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    )
+
+
+def load_user(request):
+    user_id = request.session.get(auth.SESSION_KEY)
+    if user_id is None:
+        return AnonymousUser()
+
+    user = cache.get(identity_key(user_id))
+    if user is not None and _session_is_valid(request, user):
+        return user
+
+    # Miss, or a session the cached copy can't vouch for (e.g. one signed
+    # with a fallback secret): let auth decide, flushing bad sessions.
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        # Load the profile onto the instance so it is cached along with it;
+        # users created before the profile signal may not have one yet
+        try:
+            user.userprofile
+        except UserProfile.DoesNotExist:
+            user.userprofile, _ = UserProfile.objects.get_or_create(user=user)
+        cache.set(identity_key(user.pk), user, IDENTITY_TIMEOUT)
+    return user
+
+
+class IdentityMiddleware:
+    """Goes right after django.contrib.auth's AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        if not caching.cache_is_shared():
+            raise MiddlewareNotUsed("The identity cache needs a cache shared by all workers.")
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.user = SimpleLazyObject(lambda: load_user(request))
+        return self.get_response(request)
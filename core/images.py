@@ -0,0 +1,224 @@
+"""
+Resized, modern-format derivatives of listing photos.
+
+When a listing image is stored (see core/uploads.py), ``build_variants``
+decodes it once and encodes each size in VARIANTS as AVIF and WebP,
+EXIF-free and upright, next to the original: ``spots/7/<sha256>.jpg``
+gets ``spots/7/<sha256>-card.avif``, ``spots/7/<sha256>-card.webp`` and so
+on. Like the original, they are immutable. The result is recorded in
+StudySpot.image_variants, which the ``{% spot_picture %}`` tag turns into
+``<picture>`` sources with srcset/sizes. The original is re-encoded
+without its metadata only when it carries some (phone photos include GPS
+coordinates).
+"""
+
+import hashlib
+import io
+import logging
+import mimetypes
+import posixpath
+import re
+
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+from .storage import StorageError, get_storage
+
+logger = logging.getLogger(__name__)
+
+# name -> target width in pixels; never upscaled
+VARIANTS = {
+    "preview": 320,  # map preview card
+    "card": 640,  # listing cards (about 300 CSS px at 2x)
+    "hero": 1600,  # detail page
+}
+# format -> (Pillow format, content type, save options), best first
+FORMATS = {
+    "avif": ("AVIF", "image/avif", {"quality": 55, "speed": 8}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+}
+# Original formats we re-encode in place to drop metadata
+ORIGINAL_FORMATS = {
+    "JPEG": ("image/jpeg", {"quality": 92, "optimize": True}),
+    "PNG": ("image/png", {"optimize": True}),
+    "WEBP": ("image/webp", {"quality": 90}),
+}
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp", "photoshop")
+# Stored file names that are the SHA-256 of their upload (core/uploads.py)
+HASHED_NAME = re.compile(r"[0-9a-f]{64}")
+# Decoded size cap (~200 MB as RGBA), checked before any pixels are decoded
+MAX_PIXELS = 50_000_000
+
+
+class ImageProcessingError(Exception):
+    pass
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if features.check(fmt)]
+
+
+def variant_path(path, name, fmt):
+    stem, _ = posixpath.splitext(path)
+    return f"{stem}-{name}.{fmt}"
+
+
+def _open(data):
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise ImageProcessingError(f"Image is too large ({image.width}x{image.height})")
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as exc:
+        raise ImageProcessingError(f"Not a usable image: {exc}") from exc
+    return image
+
+
+def _encode(image, pil_format, options):
+    out = io.BytesIO()
+    image.save(out, pil_format, **options)
+    return out.getvalue()
+
+
+def strip_metadata(data):
+    """
+    ``(data, content_type)`` with EXIF/XMP removed and the orientation
+    applied, or None if the original carries no metadata (or is a format
+    we leave alone, e.g. animated GIF).
+    """
+    image = _open(data)
+    original_format = image.format
+    has_metadata = any(key in image.info for key in METADATA_KEYS) or bool(image.getexif())
+    if original_format not in ORIGINAL_FORMATS or not has_metadata:
+        return None
+    content_type, options = ORIGINAL_FORMATS[original_format]
+    upright = ImageOps.exif_transpose(image)
+    if original_format == "JPEG" and upright.mode not in ("RGB", "L"):
+        upright = upright.convert("RGB")
+    return _encode(upright, original_format, options), content_type
+
+
+def build_variants(data, path):
+    """
+    Encode every variant of the image in ``data``. Returns a list of
+    dicts with name, format, width, height, path, content_type and data.
+    Sizes wider than the original collapse into one at its own width.
+    """
+    image = ImageOps.exif_transpose(_open(data))
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+
+    results = []
+    made_widths = set()
+    for name, width in sorted(VARIANTS.items(), key=lambda item: item[1]):
+        target = min(width, image.width)
+        if target in made_widths:
+            continue  # the original is smaller; one size covers both
+        made_widths.add(target)
+        height = max(1, round(image.height * target / image.width))
+        resized = image if target == image.width else image.resize((target, height), Image.LANCZOS)
+        for fmt in available_formats():
+            pil_format, content_type, options = FORMATS[fmt]
+            results.append({
+                "name": name,
+                "format": fmt,
+                "width": target,
+                "height": height,
+                "path": variant_path(path, name, fmt),
+                "content_type": content_type,
+                "data": _encode(resized, pil_format, options),
+            })
+    return results
+
+
+def manifest(source_url, variants, url_for):
+    """
+    The StudySpot.image_variants value for ``variants`` (as returned by
+    build_variants, already stored), with URLs from ``url_for(path)``.
+    """
+    entries = {}
+    for variant in variants:
+        entry = entries.setdefault(variant["name"], {
+            "width": variant["width"],
+            "height": variant["height"],
+        })
+        entry[variant["format"]] = url_for(variant["path"])
+    # Names skipped for a small original share its largest variant
+    if entries:
+        largest = max(entries.values(), key=lambda entry: entry["width"])
+        for name in VARIANTS:
+            entries.setdefault(name, largest)
+    return {"source": source_url, "variants": entries}
+
+
+def store_variants(storage, bucket, path, data, source_url):
+    """
+    Build the variants of the image ``data`` stored at ``bucket``/``path``,
+    upload them (immutable) next to it and return their manifest.
+    """
+    variants = build_variants(data, path)
+    for variant in variants:
+        storage.upload(
+            bucket, variant["path"], variant["data"], variant["content_type"], immutable=True
+        )
+    return manifest(source_url, variants, lambda variant_path: storage.public_url(bucket, variant_path))
+
+
+def backfill(spot_id, image_url):
+    """
+    Strip and derive the stored image of one spot; runs in a worker
+    process of ``manage.py build_image_variants``. Stored objects never
+    change, so an image that loses its metadata, or still has a pre-hash
+    path (``spots/7/main.jpg?v=...``), is stored again under the SHA-256
+    of its bytes. Returns a dict with spot_id, image_url and either error
+    or the stored bucket, path, url, size and manifest.
+    """
+    result = {"spot_id": spot_id, "image_url": image_url, "error": None}
+    storage = get_storage()
+    located = storage.locate(image_url)
+    if located is None:
+        return {**result, "error": "not in our storage"}
+    bucket, path, _ = located
+    try:
+        data = storage.download(bucket, path)
+        stripped = strip_metadata(data)
+        folder, name = posixpath.split(path)
+        stem, ext = posixpath.splitext(name)
+        url = image_url
+        if stripped is not None or not HASHED_NAME.fullmatch(stem):
+            if stripped is not None:
+                data, content_type = stripped
+            else:
+                content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            path = posixpath.join(folder, hashlib.sha256(data).hexdigest() + ext)
+            storage.upload(bucket, path, data, content_type, immutable=True)
+            url = storage.public_url(bucket, path)
+        manifest = store_variants(storage, bucket, path, data, url)
+    except (StorageError, ImageProcessingError) as exc:
+        return {**result, "error": str(exc)}
+    return {**result, "bucket": bucket, "path": path, "url": url, "size": len(data), "manifest": manifest}
+
+
+def variant_paths(path):
+    """Every path ``build_variants`` may have written for ``path``."""
+    return [variant_path(path, name, fmt) for name in VARIANTS for fmt in FORMATS]
+
+
+def current_variants(spot):
+    """The spot's variant entries, or {} if they belong to another image."""
+    data = spot.image_variants or {}
+    if not spot.image_url or data.get("source") != spot.image_url:
+        return {}
+    return data.get("variants", {})
+
+
+def srcset(variants, fmt):
+    entries = sorted(
+        {(entry["width"], entry[fmt]) for entry in variants.values() if fmt in entry}
+    )
+    return ", ".join(f"{url} {width}w" for width, url in entries)
+
+
+def variant_url(spot, name, fmt="webp"):
+    """URL of one variant, falling back to the original image."""
+    entry = current_variants(spot).get(name, {})
+    return entry.get(fmt) or spot.image_url
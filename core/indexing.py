@@ -0,0 +1,189 @@
+"""
+Per-process indexes over StudySpot rows.
+
+Each index is built lazily the first time a worker queries it and is
+patched in place from the StudySpot post_save / post_delete signals (see
+core/signals.py), so this worker's own writes show up at once. Those
+signals only fire in the worker that made the write, so an index also
+remembers the catalog version (core/caching.py) it has caught up with.
+Once another worker's write bumps it, the next query re-reads just the
+rows whose updated_at moved since, and drops spots deleted meanwhile. Only
+bulk writes (management commands) bump the index version, which makes
+every worker rebuild its indexes from scratch.
+"""
+
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import caching
+
+# Rows are re-read from a little before the last catch-up: a write may
+# commit well after it set updated_at, and clocks differ between hosts
+CATCH_UP_OVERLAP = timedelta(minutes=5)
+# More changed rows than this are cheaper to load with a rebuild
+CATCH_UP_LIMIT = 2000
+
+_registry = []
+
+
+def register(index):
+    _registry.append(index)
+    return index
+
+
+def spot_saved(spot):
+    for index in _registry:
+        index.spot_saved(spot)
+
+
+def spot_deleted(spot_id):
+    for index in _registry:
+        index.spot_deleted(spot_id)
+
+
+def spot_updated(spot_id, fields):
+    """
+    Patch the built indexes that use any of ``fields`` after an
+    ``update()`` (which sends no signals) changed them on ``spot_id``.
+    """
+    indexes = [index for index in _registry if index.built and set(fields) & set(index.fields)]
+    if not indexes:
+        return
+    from .models import StudySpot
+
+    needed = set().union(*(index.fields for index in indexes))
+    row = StudySpot.objects.filter(pk=spot_id).values(*needed).first()
+    for index in indexes:
+        if row is None:
+            index.spot_deleted(spot_id)
+        else:
+            index.patch(row)
+
+
+class SpotIndex:
+    """
+    Base class for in-memory StudySpot indexes.
+
+    Subclasses list the model ``fields`` they need and implement ``clear()``,
+    ``add(row)`` and ``discard(spot_id)``. Rows are plain dicts keyed by
+    field name, whether they come from ``values()`` or from a saved instance.
+    """
+
+    fields = ("id",)
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.version = None  # index version the index was built at
+        self.catalog_version = None  # catalog version it has caught up with
+        self.synced_at = None  # when the rows were last read
+        self.ids = set()
+        register(self)
+
+    # --- subclass hooks ---
+
+    def clear(self):
+        raise NotImplementedError
+
+    def add(self, row):
+        raise NotImplementedError
+
+    def discard(self, spot_id):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        from .models import StudySpot
+
+        return StudySpot.objects.all()
+
+    # --- lifecycle ---
+
+    def ensure_built(self):
+        version = caching.index_version()
+        catalog_version = caching.catalog_version()
+        if self._is_current(version, catalog_version):
+            return
+        with self.lock:
+            if self._is_current(version, catalog_version):
+                return
+            # Versions are taken before reading: a write committed meanwhile
+            # bumps them again and is picked up by the next query
+            if not self.built or self.version != version or not self.catch_up():
+                self.rebuild()
+            self.version = version
+            self.catalog_version = catalog_version
+
+    def _is_current(self, version, catalog_version):
+        return self.built and self.version == version and self.catalog_version == catalog_version
+
+    def rebuild(self):
+        self.built = False
+        synced_at = timezone.now()
+        self.clear()
+        self.ids = set()
+        rows = self.get_queryset().values(*self.fields)
+        for row in rows.iterator(chunk_size=2000):
+            self.add(row)
+            self.ids.add(row["id"])
+        self.synced_at = synced_at
+        self.built = True
+
+    def catch_up(self):
+        """
+        Re-read the rows changed since the last read and drop deleted
+        spots. Returns False if a rebuild would be cheaper.
+        """
+        synced_at = timezone.now()
+        queryset = self.get_queryset()
+        changed = list(
+            queryset.filter(updated_at__gte=self.synced_at - CATCH_UP_OVERLAP)
+            .values(*self.fields)[:CATCH_UP_LIMIT + 1]
+        )
+        if len(changed) > CATCH_UP_LIMIT:
+            return False
+        for row in changed:
+            self.patch(row)
+
+        if queryset.count() != len(self.ids):
+            # Spots deleted (or created) by another process
+            existing = set(queryset.values_list("id", flat=True))
+            for spot_id in self.ids - existing:
+                self.spot_deleted(spot_id)
+            for row in queryset.filter(pk__in=existing - self.ids).values(*self.fields):
+                self.patch(row)
+        self.synced_at = synced_at
+        return True
+
+    def invalidate(self):
+        with self.lock:
+            self.built = False
+            self.version = None
+            self.catalog_version = None
+            self.ids = set()
+            self.clear()
+
+    def row_from_instance(self, spot):
+        return {name: getattr(spot, name) for name in self.fields}
+
+    def patch(self, row):
+        """Replace (or add) one spot's row."""
+        # An index that has not been built yet will read the row from the
+        # database when it is first queried, so there is nothing to patch.
+        if not self.built:
+            return
+        with self.lock:
+            self.discard(row["id"])
+            self.add(row)
+            self.ids.add(row["id"])
+
+    def spot_saved(self, spot):
+        self.patch(self.row_from_instance(spot))
+
+    def spot_deleted(self, spot_id):
+        if not self.built:
+            return
+        with self.lock:
+            self.discard(spot_id)
+            self.ids.discard(spot_id)
@@ -0,0 +1,89 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import caching, images
+from core.models import StoredObject, StudySpot
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the resized WebP/AVIF variants (and strip the metadata) of "
+        "listing images stored before variants existed, or whose variants "
+        "belong to an older image."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help="Worker processes; encoding is CPU bound.",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Rebuild variants that look current."
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="List the spots without processing them."
+        )
+
+    def handle(self, *args, **options):
+        spots = (
+            StudySpot.objects.exclude(image_url__isnull=True)
+            .exclude(image_url="")
+            .only("id", "image_url", "image_variants")
+            .order_by("id")
+        )
+        todo = [
+            (spot.id, spot.image_url)
+            for spot in spots.iterator(chunk_size=2000)
+            # Spooled images get their variants from process_uploads
+            if "/uploads/spool/" not in spot.image_url
+            and (options["force"] or not images.current_variants(spot))
+        ]
+        self.stdout.write(f"{len(todo)} images to process.")
+        if options["dry_run"] or not todo:
+            return
+
+        built = failed = 0
+        # Fresh interpreters: no inherited database or HTTP connections
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max(1, options["workers"]), mp_context=context) as pool:
+            results = pool.map(images.backfill, *zip(*todo), chunksize=4)
+            for result in results:
+                if result["error"]:
+                    failed += 1
+                    self.stdout.write(f"  #{result['spot_id']}: {result['error']}")
+                    continue
+                built += self.save(result)
+
+        if built:
+            caching.bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} images, {failed} failed."))
+
+    def save(self, result):
+        """Point the spot at the (possibly moved) image and its variants."""
+        # Skip spots whose image changed while we were working
+        updated = StudySpot.objects.filter(
+            pk=result["spot_id"], image_url=result["image_url"]
+        ).update(
+            image_url=result["url"], image_variants=result["manifest"], updated_at=timezone.now()
+        )
+        if updated:
+            stored, created = StoredObject.objects.get_or_create(
+                bucket=result["bucket"],
+                path=result["path"],
+                defaults={
+                    "url": result["url"],
+                    "size": result["size"],
+                    "variants": result["manifest"],
+                    "target_model": "core.StudySpot",
+                    "target_field": "image_url",
+                },
+            )
+            if not created:
+                stored.variants = result["manifest"]
+                stored.save(update_fields=["variants"])
+        return updated
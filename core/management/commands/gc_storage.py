@@ -0,0 +1,82 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import images
+from core.models import StoredObject
+from core.storage import StorageError, get_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored uploads (and their image variants) that no row "
+        "points at any more, e.g. replaced listing photos and avatars."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Keep objects used more recently than this.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="List orphans without deleting them."
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        batch_size = options["batch_size"]
+
+        candidates = defaultdict(list)
+        for stored in StoredObject.objects.filter(last_used_at__lt=cutoff).order_by("id").iterator():
+            candidates[(stored.target_model, stored.target_field)].append(stored)
+
+        orphans = []
+        for (model_label, field), objects in candidates.items():
+            model = apps.get_model(model_label)
+            for start in range(0, len(objects), batch_size):
+                batch = objects[start:start + batch_size]
+                referenced = set(
+                    model.objects.filter(**{f"{field}__in": [stored.url for stored in batch]})
+                    .values_list(field, flat=True)
+                )
+                orphans.extend(stored for stored in batch if stored.url not in referenced)
+
+        for stored in orphans:
+            self.stdout.write(f"  {stored.bucket}/{stored.path} ({stored.size} bytes)")
+        if options["dry_run"] or not orphans:
+            self.stdout.write(self.style.SUCCESS(f"{len(orphans)} orphaned objects."))
+            return
+
+        storage = get_storage()
+        deleted = freed = 0
+        for start in range(0, len(orphans), batch_size):
+            batch = {stored.pk: stored for stored in orphans[start:start + batch_size]}
+            # Forget the rows first, skipping any handed out again meanwhile
+            gone = StoredObject.objects.filter(pk__in=batch, last_used_at__lt=cutoff)
+            ids = list(gone.values_list("id", flat=True))
+            StoredObject.objects.filter(pk__in=ids).delete()
+
+            paths = defaultdict(list)
+            for pk in ids:
+                stored = batch[pk]
+                paths[stored.bucket].append(stored.path)
+                if stored.variants:
+                    paths[stored.bucket].extend(images.variant_paths(stored.path))
+                freed += stored.size
+            try:
+                for bucket, bucket_paths in paths.items():
+                    storage.delete(bucket, bucket_paths)
+            except StorageError as exc:
+                # Untracked now; a later upload of the same bytes overwrites them
+                self.stderr.write(f"  {exc}: left {dict(paths)}")
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} orphaned objects ({freed} bytes)."
+        ))
@@ -0,0 +1,135 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core import caching, geo
+from core.geocoding import load_gazetteer, normalize_address
+from core.models import GeocodeCache, StudySpot
+
+
+class Command(BaseCommand):
+    help = (
+        "Resolve queued addresses against the local gazetteer and fill in "
+        "coordinates for study spots that have none. Every batch is committed "
+        "on its own, so an interrupted run can simply be started again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--gazetteer",
+            help="CSV file with name,latitude,longitude columns "
+            "(default: settings.GEOCODER_GAZETTEER).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--retry-not-found",
+            action="store_true",
+            help="Also retry addresses that had no match before, e.g. after "
+            "adding places to the gazetteer.",
+        )
+
+    def handle(self, *args, **options):
+        gazetteer = load_gazetteer(options["gazetteer"])
+        batch_size = options["batch_size"]
+        self.stdout.write(f"Loaded {len(gazetteer)} places.")
+
+        statuses = [GeocodeCache.PENDING]
+        if options["retry_not_found"]:
+            statuses.append(GeocodeCache.NOT_FOUND)
+        resolved, missed = self.resolve_queue(gazetteer, statuses, batch_size)
+        self.stdout.write(f"Queue: {resolved} resolved, {missed} not found.")
+
+        updated, skipped = self.fill_spots(gazetteer, batch_size)
+        if updated:
+            # bulk_update skips the signals: make cached pages and cards
+            # pick up the coordinates, and every worker rebuild its
+            # in-memory indexes rather than catch up row by row
+            caching.bump_catalog_version()
+            caching.bump_index_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Spots: {updated} geocoded, {skipped} left without coordinates."
+        ))
+
+    def resolve_queue(self, gazetteer, statuses, batch_size):
+        resolved = missed = 0
+        last_id = 0
+        while True:
+            entries = list(
+                GeocodeCache.objects.filter(status__in=statuses, id__gt=last_id)
+                .order_by("id")[:batch_size]
+            )
+            if not entries:
+                return resolved, missed
+            last_id = entries[-1].id
+
+            now = timezone.now()
+            for entry in entries:
+                self._resolve(gazetteer, entry)
+                entry.updated_at = now
+                if entry.status == GeocodeCache.RESOLVED:
+                    resolved += 1
+                else:
+                    missed += 1
+            GeocodeCache.objects.bulk_update(
+                entries, ["latitude", "longitude", "status", "updated_at"]
+            )
+
+    def fill_spots(self, gazetteer, batch_size):
+        updated = skipped = 0
+        last_id = 0
+        missing = Q(latitude__isnull=True) | Q(longitude__isnull=True)
+        while True:
+            spots = list(
+                StudySpot.objects.filter(missing, id__gt=last_id)
+                .only("id", "location", "latitude", "longitude", "geohash")
+                .order_by("id")[:batch_size]
+            )
+            if not spots:
+                return updated, skipped
+            last_id = spots[-1].id
+
+            with transaction.atomic():
+                cache = self._cache_for(gazetteer, spots)
+                now = timezone.now()
+                changed = []
+                for spot in spots:
+                    entry = cache.get(normalize_address(spot.location))
+                    if entry is None or entry.status != GeocodeCache.RESOLVED:
+                        skipped += 1
+                        continue
+                    spot.latitude = entry.latitude
+                    spot.longitude = entry.longitude
+                    spot.geohash = geo.encode_geohash(spot.latitude, spot.longitude)
+                    spot.updated_at = now
+                    changed.append(spot)
+                StudySpot.objects.bulk_update(
+                    changed, ["latitude", "longitude", "geohash", "updated_at"]
+                )
+            updated += len(changed)
+            self.stdout.write(f"  ... up to spot #{last_id}: {updated} geocoded")
+
+    def _cache_for(self, gazetteer, spots):
+        """Cache entries for the batch's addresses, resolving unseen ones."""
+        addresses = {normalize_address(spot.location) for spot in spots} - {""}
+        cache = {
+            entry.address: entry
+            for entry in GeocodeCache.objects.filter(address__in=addresses)
+        }
+        new_entries = []
+        for address in addresses - cache.keys():
+            entry = GeocodeCache(address=address)
+            self._resolve(gazetteer, entry)
+            cache[address] = entry
+            new_entries.append(entry)
+        GeocodeCache.objects.bulk_create(new_entries, ignore_conflicts=True)
+        return cache
+
+    def _resolve(self, gazetteer, entry):
+        coordinates = gazetteer.resolve(entry.address)
+        if coordinates is None:
+            entry.latitude = entry.longitude = None
+            entry.status = GeocodeCache.NOT_FOUND
+        else:
+            entry.latitude, entry.longitude = coordinates
+            entry.status = GeocodeCache.RESOLVED
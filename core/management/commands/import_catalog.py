@@ -0,0 +1,370 @@
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import amenities, caching, search
+from core.models import Review, StudySpot, UserProfile
+from core.ratings import COUNTER_FIELDS, actual_counters, counters_for
+
+TRUE_VALUES = {"1", "true", "yes", "y", "t", "on"}
+SPOT_TEXT_FIELDS = ("name", "location", "description", "image_url")
+# is_trending is derived from trending scores (update_trending), not imported
+SPOT_FLAG_FIELDS = tuple(field for field in amenities.AMENITY_FIELDS if field != "is_trending")
+
+
+class SkipRow(Exception):
+    """A record that can't be imported; the message says why."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import study spots or reviews from a CSV or JSON Lines file "
+        "(optionally gzipped, '-' for stdin). The file is read in chunks, "
+        "each chunk is written with one bulk insert in its own transaction, "
+        "and rating counters are recomputed once per affected spot at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["spots", "reviews"])
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format (default: from the file extension).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--owner",
+            help="Username owning spots whose record has no owner column.",
+        )
+        parser.add_argument(
+            "--create-users",
+            action="store_true",
+            help="Create missing owners/reviewers (with unusable passwords) "
+            "instead of skipping their records.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.create_users = options["create_users"]
+        self.default_owner = options["owner"]
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        import_chunk = self.import_spots if options["kind"] == "spots" else self.import_reviews
+
+        self.imported = self.skipped = 0
+        self.touched_spots = set()
+        self.explicit_ids = False
+        started = time.monotonic()
+        read = 0
+        with self.open(options["path"]) as handle:
+            records = self.read_records(handle, options["format"] or self.guess_format(options["path"]))
+            while True:
+                chunk = list(islice(records, batch_size))
+                if not chunk:
+                    break
+                read += len(chunk)
+                with transaction.atomic():
+                    import_chunk(chunk)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"  ... {read} records read, {self.imported} imported "
+                    f"({read / elapsed:,.0f} rows/s)"
+                )
+
+        self.finish(options["kind"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported} {options['kind']}, skipped {self.skipped}, "
+            f"in {elapsed:.1f}s ({read / max(elapsed, 1e-9):,.0f} rows/s)."
+        ))
+
+    # ---------- READING ----------
+
+    def guess_format(self, path):
+        name = path.lower().removesuffix(".gz")
+        if name.endswith(".csv"):
+            return "csv"
+        if name.endswith((".jsonl", ".ndjson")):
+            return "jsonl"
+        raise CommandError(f"Can't tell the format of {path!r}; pass --format.")
+
+    def open(self, path):
+        if path == "-":
+            return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+        try:
+            if path.lower().endswith(".gz"):
+                return gzip.open(path, "rt", encoding="utf-8", newline="")
+            return open(path, encoding="utf-8", newline="")
+        except OSError as exc:
+            raise CommandError(f"Can't read {path}: {exc}")
+
+    def read_records(self, handle, fmt):
+        """Yield one dict per record; nothing is read ahead of the caller."""
+        if fmt == "csv":
+            yield from csv.DictReader(handle)
+            return
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                yield record
+            else:
+                self.skip(f"line {number}", "not a JSON object")
+
+    def skip(self, where, reason):
+        self.skipped += 1
+        if self.verbosity >= 2:
+            self.stderr.write(f"  skipped {where}: {reason}")
+
+    # ---------- SPOTS ----------
+
+    def import_spots(self, records):
+        owners = self.user_ids(
+            parse_username(record.get("owner") or self.default_owner) for record in records
+        )
+        spots = []
+        for record in records:
+            try:
+                spots.append(self.build_spot(record, owners))
+            except SkipRow as exc:
+                self.skip(record.get("name") or "spot", exc)
+
+        # Records carrying an existing id are left alone, so re-running an
+        # import with ids doesn't duplicate spots
+        ids = [spot.pk for spot in spots if spot.pk is not None]
+        taken = set(StudySpot.objects.filter(pk__in=ids).values_list("pk", flat=True))
+        for spot in spots:
+            if spot.pk in taken:
+                self.skip(f"spot {spot.pk}", "id already exists")
+        spots = [spot for spot in spots if spot.pk not in taken]
+
+        # ignore_conflicts covers ids taken while the import runs; it doesn't
+        # report dropped rows, so explicit ids are counted back
+        StudySpot.objects.bulk_create(spots, ignore_conflicts=True)
+        ids = [spot.pk for spot in spots if spot.pk is not None]
+        lost = len(ids) - StudySpot.objects.filter(pk__in=ids).count()
+        self.imported += len(spots) - lost
+        self.skipped += lost
+
+    def build_spot(self, record, owners):
+        values = {field: parse_text(record.get(field), field) for field in SPOT_TEXT_FIELDS}
+        if not values["name"] or not values["location"]:
+            raise SkipRow("name and location are required")
+        owner = record.get("owner") or self.default_owner
+        owner_id = owners.get(parse_username(owner))
+        if owner_id is None:
+            raise SkipRow(f"unknown owner {owner!r}")
+
+        spot = StudySpot(owner_id=owner_id, **values)
+        spot.image_url = spot.image_url or None
+        for field in SPOT_FLAG_FIELDS:
+            setattr(spot, field, parse_bool(record.get(field)))
+        try:
+            spot.latitude = parse_float(record.get("latitude"))
+            spot.longitude = parse_float(record.get("longitude"))
+            if record.get("id"):
+                spot.pk = int(record["id"])
+                self.explicit_ids = True
+        except (TypeError, ValueError) as exc:
+            raise SkipRow(exc)
+        if spot.latitude is not None and not -90 <= spot.latitude <= 90:
+            raise SkipRow(f"latitude {spot.latitude} out of range")
+        if spot.longitude is not None and not -180 <= spot.longitude <= 180:
+            raise SkipRow(f"longitude {spot.longitude} out of range")
+        spot.sync_derived_fields()
+        return spot
+
+    # ---------- REVIEWS ----------
+
+    def import_reviews(self, records):
+        users = self.user_ids(parse_username(record.get("user")) for record in records)
+        spot_ids = set()
+        for record in records:
+            try:
+                spot_ids.add(int(record.get("spot")))
+            except (TypeError, ValueError):
+                pass
+        existing = set(StudySpot.objects.filter(pk__in=spot_ids).values_list("pk", flat=True))
+
+        # One review per (spot, user): reviews that already exist are kept
+        # as they are
+        reviewed = set(
+            Review.objects.filter(spot_id__in=existing, user_id__in=users.values())
+            .values_list("spot_id", "user_id")
+        )
+        reviews = []
+        now = timezone.now()
+        for record in records:
+            try:
+                review = self.build_review(record, users, existing, now)
+            except SkipRow as exc:
+                self.skip(f"review of spot {record.get('spot')!r}", exc)
+                continue
+            key = (review.spot_id, review.user_id)
+            if key in reviewed:
+                self.skip(f"review of spot {review.spot_id}", f"{record.get('user')!r} already reviewed it")
+                continue
+            reviewed.add(key)
+            reviews.append(review)
+
+        # ignore_conflicts covers reviews written while the import runs; it
+        # doesn't report dropped rows, so ours are counted back by (spot,
+        # user, created_at), which a review written meanwhile won't share
+        Review.objects.bulk_create(reviews, ignore_conflicts=True)
+        stored = set(
+            Review.objects.filter(
+                spot_id__in={review.spot_id for review in reviews},
+                user_id__in={review.user_id for review in reviews},
+            ).values_list("spot_id", "user_id", "created_at")
+        )
+        inserted = sum(
+            (review.spot_id, review.user_id, review.created_at) in stored for review in reviews
+        )
+        self.imported += inserted
+        self.skipped += len(reviews) - inserted
+        self.touched_spots.update(review.spot_id for review in reviews)
+
+    def build_review(self, record, users, existing, now):
+        try:
+            spot_id = int(record.get("spot"))
+            rating = int(record.get("rating"))
+        except (TypeError, ValueError):
+            raise SkipRow("spot and rating must be integers")
+        if spot_id not in existing:
+            raise SkipRow("unknown spot")
+        if not 1 <= rating <= 5:
+            raise SkipRow(f"rating {rating} out of range")
+        user_id = users.get(parse_username(record.get("user")))
+        if user_id is None:
+            raise SkipRow(f"unknown user {record.get('user')!r}")
+
+        created_at = record.get("created_at") or None
+        if created_at is not None:
+            try:
+                # None if malformed, ValueError if well formed but impossible
+                created_at = parse_datetime(str(created_at))
+            except ValueError:
+                created_at = None
+            if created_at is None:
+                raise SkipRow(f"bad created_at {record.get('created_at')!r}")
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at)
+        return Review(
+            spot_id=spot_id,
+            user_id=user_id,
+            rating=rating,
+            comment=parse_text(record.get("comment"), "comment") or None,
+            created_at=created_at or now,
+        )
+
+    # ---------- USERS ----------
+
+    def user_ids(self, usernames):
+        """{username: id} for the chunk, creating missing users if asked."""
+        usernames = {name for name in usernames if name}
+        found = dict(
+            User.objects.filter(username__in=usernames).values_list("username", "id")
+        )
+        missing = usernames - found.keys()
+        if missing and self.create_users:
+            new_users = []
+            for name in sorted(missing):
+                user = User(username=name)
+                user.set_unusable_password()
+                new_users.append(user)
+            User.objects.bulk_create(new_users, ignore_conflicts=True)
+            created = dict(
+                User.objects.filter(username__in=missing).values_list("username", "id")
+            )
+            # bulk_create skips the signal that gives every user a profile
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user_id) for user_id in created.values()],
+                ignore_conflicts=True,
+            )
+            found.update(created)
+        return found
+
+    # ---------- AGGREGATES ----------
+
+    def finish(self, kind):
+        if kind == "spots":
+            if self.explicit_ids:
+                # Inserting explicit ids doesn't advance the PostgreSQL sequence
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(no_style(), [StudySpot]):
+                        cursor.execute(sql)
+            if connection.vendor == "postgresql":
+                StudySpot.objects.filter(search_vector__isnull=True).update(
+                    search_vector=search.build_search_vector()
+                )
+        else:
+            self.recount(sorted(self.touched_spots))
+
+        if self.imported:
+            caching.bump_catalog_version()
+            # Cheaper than catching up row by row
+            caching.bump_index_version()
+
+    def recount(self, spot_ids, batch_size=1000):
+        """Recompute the rating counters of the spots that got reviews."""
+        now = timezone.now()
+        empty = counters_for({})
+        for i in range(0, len(spot_ids), batch_size):
+            batch = spot_ids[i:i + batch_size]
+            actual = actual_counters(batch)
+            spots = []
+            for spot_id in batch:
+                spot = StudySpot(pk=spot_id, reviews_changed_at=now, updated_at=now)
+                for field, value in actual.get(spot_id, empty).items():
+                    setattr(spot, field, value)
+                spots.append(spot)
+            StudySpot.objects.bulk_update(spots, COUNTER_FIELDS + ("reviews_changed_at", "updated_at"))
+        self.stdout.write(f"Recounted ratings for {len(spot_ids)} spots.")
+
+
+def parse_text(value, field):
+    """
+    A text field's value, stripped. JSON numbers are written out; lists
+    and objects can't be stored in a text column.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        raise SkipRow(f"{field} must be text, not {type(value).__name__}")
+    return str(value).strip()
+
+
+def parse_username(value):
+    """The username a record refers to, or None if the value can't be one."""
+    if isinstance(value, str) or (isinstance(value, int) and not isinstance(value, bool)):
+        return str(value)
+    return None
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in TRUE_VALUES
+
+
+def parse_float(value):
+    if value is None or str(value).strip() == "":
+        return None
+    return float(value)
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import uploads
+from core.storage import get_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Push spooled uploads (listing images, avatars, staff documents) to "
+        "storage and point their rows at the stored files. Runs until "
+        "stopped; meant to run next to the web workers, on the same disk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=4, help="Concurrent uploads."
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait when the spool is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once nothing is due instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        storage = get_storage()
+        workers = max(1, options["workers"])
+        total_uploaded = total_failed = 0
+        last_prune = 0.0
+
+        while True:
+            uploaded, failed = uploads.process_batch(storage, workers)
+            total_uploaded += uploaded
+            total_failed += failed
+            if uploaded or failed:
+                self.stdout.write(f"  ... {uploaded} uploaded, {failed} failed")
+
+            if time.monotonic() - last_prune > 3600:
+                uploads.prune_done()
+                last_prune = time.monotonic()
+
+            if uploaded or failed:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Uploaded {total_uploaded} files, {total_failed} failed attempts."
+        ))
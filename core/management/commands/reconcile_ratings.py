@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import caching
+from core.models import StudySpot
+from core.ratings import COUNTER_FIELDS, actual_counters, counters_for
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every study spot's rating counters and star histogram "
+        "from its reviews and report (and fix) any drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Report drift without fixing it."
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        actual = actual_counters()
+        empty = counters_for({})
+        drifted = []
+        checked = 0
+        spots = StudySpot.objects.only("id", "name", *COUNTER_FIELDS).order_by("id")
+        for spot in spots.iterator(chunk_size=2000):
+            checked += 1
+            expected = dict(actual.get(spot.id, empty))
+            expected["average_rating"] = Decimal(str(expected["average_rating"])).quantize(
+                Decimal("0.01")
+            )
+            changes = [
+                f"{field} {getattr(spot, field)} -> {value}"
+                for field, value in expected.items()
+                if getattr(spot, field) != value
+            ]
+            if not changes:
+                continue
+            self.stdout.write(f"  #{spot.id} {spot.name}: " + ", ".join(changes))
+            for field, value in expected.items():
+                setattr(spot, field, value)
+            spot.updated_at = now
+            drifted.append(spot)
+
+        if drifted and not options["dry_run"]:
+            StudySpot.objects.bulk_update(
+                drifted, COUNTER_FIELDS + ("updated_at",), batch_size=options["batch_size"]
+            )
+            caching.bump_catalog_version()
+
+        summary = f"Checked {checked} spots, {len(drifted)} with drift"
+        if drifted and not options["dry_run"]:
+            summary += " (fixed)"
+        self.stdout.write(self.style.SUCCESS(summary + "."))
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import caching, trending
+from core.models import Review, StudySpot, TrendingState
+
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rescore trending for the study spots whose reviews changed since the "
+        "last run, then refresh the is_trending flags. Meant to run "
+        "periodically (e.g. hourly from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rescore every spot with reviews or a score, not just the "
+            "changed ones (the first run always does).",
+        )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        state = TrendingState.load()
+
+        if started - state.epoch > trending.REBASE_AFTER:
+            self.rebase(state, started)
+
+        if state.last_run is None or options["full"]:
+            touched = StudySpot.objects.filter(Q(rating_count__gt=0) | Q(trending_score__gt=0))
+        else:
+            # reviews_changed_at comes from the database clock; overlap a
+            # little rather than miss a spot
+            touched = StudySpot.objects.filter(
+                reviews_changed_at__gte=state.last_run - CLOCK_SKEW
+            )
+        spot_ids = list(touched.order_by("id").values_list("id", flat=True))
+
+        batch_size = options["batch_size"]
+        for i in range(0, len(spot_ids), batch_size):
+            self.rescore(spot_ids[i:i + batch_size], state.epoch, started)
+        self.stdout.write(f"Rescored {len(spot_ids)} spots.")
+
+        added, removed = self.refresh_flags(state.epoch, started)
+        self.stdout.write(f"Trending: {added} added, {removed} removed.")
+
+        # The next run picks up reviews written while this one was running
+        state.last_run = started
+        state.save(update_fields=["last_run"])
+        if spot_ids:
+            caching.bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS("Trending scores updated."))
+
+    def rebase(self, state, now):
+        """Move the epoch to ``now``, scaling every stored score to match."""
+        factor = 1 / trending.growth(state.epoch, now)
+        with transaction.atomic():
+            StudySpot.objects.filter(trending_score__gt=0).update(
+                trending_score=F("trending_score") * factor
+            )
+            state.epoch = now
+            state.save(update_fields=["epoch"])
+        self.stdout.write(f"Rebased trending scores to {now:%Y-%m-%d %H:%M}.")
+
+    def rescore(self, spot_ids, epoch, now):
+        scores = defaultdict(float)
+        reviews = Review.objects.filter(
+            spot_id__in=spot_ids, created_at__gte=now - trending.HORIZON
+        ).values_list("spot_id", "rating", "created_at")
+        for spot_id, rating, created_at in reviews:
+            scores[spot_id] += trending.stored_contribution(rating, created_at, epoch)
+
+        spots = [
+            StudySpot(pk=spot_id, trending_score=scores.get(spot_id, 0.0))
+            for spot_id in spot_ids
+        ]
+        StudySpot.objects.bulk_update(spots, ["trending_score"])
+
+    def refresh_flags(self, epoch, now):
+        top = set(
+            StudySpot.objects.filter(
+                trending_score__gte=trending.stored_threshold(epoch, now)
+            )
+            .order_by("-trending_score")
+            .values_list("id", flat=True)[: trending.TRENDING_COUNT]
+        )
+        flagged = set(
+            StudySpot.objects.filter(is_trending=True).values_list("id", flat=True)
+        )
+
+        # Only a handful of rows change; save() keeps amenity_mask and the
+        # in-process indexes in step with the flag.
+        for spot in StudySpot.objects.filter(pk__in=top ^ flagged):
+            spot.is_trending = spot.pk in top
+            spot.save(update_fields=["is_trending"])
+        return len(top - flagged), len(flagged - top)
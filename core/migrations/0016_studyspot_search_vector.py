@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:18
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # tsvector/GIN only exist on PostgreSQL; other backends use the
+    # in-process index in core.search.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS core_studyspot_search_gin "
+        "ON core_studyspot USING gin (search_vector)"
+    )
+    schema_editor.execute(
+        "UPDATE core_studyspot SET search_vector = "
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(location, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_studyspot_search_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_remove_studyspot_image_remove_studyspot_rating_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyspot',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:40
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Only PostgreSQL has pg_trgm; other backends use core.search.TrigramIndex.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS core_studyspot_name_trgm "
+        "ON core_studyspot USING gin (name gin_trgm_ops)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS core_studyspot_location_trgm "
+        "ON core_studyspot USING gin (location gin_trgm_ops)"
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_studyspot_name_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS core_studyspot_location_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_studyspot_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
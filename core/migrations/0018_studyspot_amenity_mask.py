@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+# Frozen copy of core.amenities.AMENITIES at the time of this migration
+AMENITY_FIELDS = [
+    "wifi", "ac", "free", "coffee", "open_24_7", "outlets", "pastries", "is_trending",
+]
+
+
+def backfill_amenity_mask(apps, schema_editor):
+    StudySpot = apps.get_model("core", "StudySpot")
+    spots = list(StudySpot.objects.only("id", *AMENITY_FIELDS))
+    for spot in spots:
+        spot.amenity_mask = sum(
+            1 << bit for bit, field in enumerate(AMENITY_FIELDS) if getattr(spot, field)
+        )
+    StudySpot.objects.bulk_update(spots, ["amenity_mask"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_studyspot_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyspot',
+            name='amenity_mask',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_amenity_mask, migrations.RunPython.noop),
+    ]
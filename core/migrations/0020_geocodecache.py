@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_studyspot_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=512, unique=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved'), ('not_found', 'Not found')], db_index=True, default='pending', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:36
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_counters(apps, schema_editor):
+    StudySpot = apps.get_model("core", "StudySpot")
+    Review = apps.get_model("core", "Review")
+    totals = Review.objects.values("spot_id").annotate(
+        total=Sum("rating"), count=Count("id")
+    ).order_by()
+    spots = StudySpot.objects.in_bulk([row["spot_id"] for row in totals])
+    for row in totals:
+        spot = spots[row["spot_id"]]
+        spot.rating_sum = row["total"]
+        spot.rating_count = row["count"]
+        spot.average_rating = round(row["total"] / row["count"], 2)
+    StudySpot.objects.bulk_update(
+        spots.values(), ["rating_sum", "rating_count", "average_rating"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:39
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_histogram(apps, schema_editor):
+    StudySpot = apps.get_model("core", "StudySpot")
+    Review = apps.get_model("core", "Review")
+    rows = Review.objects.values_list("spot_id", "rating").annotate(n=Count("id")).order_by()
+    spots = StudySpot.objects.in_bulk({spot_id for spot_id, _, _ in rows})
+    for spot_id, rating, n in rows:
+        setattr(spots[spot_id], f"rating_{rating}_count", n)
+    StudySpot.objects.bulk_update(
+        spots.values(),
+        [f"rating_{stars}_count" for stars in range(1, 6)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='studyspot',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_studyspot_rating_histogram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['spot', '-created_at', '-id'], name='core_review_spot_created_idx'),
+        ),
+    ]
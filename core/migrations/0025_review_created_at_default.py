@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_review_spot_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='review',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
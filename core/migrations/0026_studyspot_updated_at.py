@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_review_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyspot',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
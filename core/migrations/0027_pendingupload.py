@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_studyspot_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spool_name', models.CharField(max_length=100, unique=True)),
+                ('bucket', models.CharField(max_length=63)),
+                ('path', models.CharField(max_length=500)),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('target_model', models.CharField(max_length=100)),
+                ('target_id', models.PositiveBigIntegerField()),
+                ('target_field', models.CharField(max_length=50)),
+                ('cache_bust', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('uploading', 'Uploading'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('public_url', models.CharField(blank=True, max_length=600)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_by', models.CharField(blank=True, max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
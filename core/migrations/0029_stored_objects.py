@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_image_variants'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='pendingupload',
+            name='cache_bust',
+        ),
+        migrations.AddField(
+            model_name='pendingupload',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StoredObject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(max_length=63)),
+                ('path', models.CharField(max_length=500)),
+                ('url', models.CharField(max_length=600)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('target_model', models.CharField(max_length=100)),
+                ('target_field', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'path'), name='unique_stored_object')],
+            },
+        ),
+    ]
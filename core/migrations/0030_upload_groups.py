@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_stored_objects'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingupload',
+            name='group',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='pendingupload',
+            name='spool_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pendingupload',
+            name='upload_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
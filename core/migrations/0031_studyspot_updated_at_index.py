@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_upload_groups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studyspot',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -1,7 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Avg
+from django.contrib.postgres.search import SearchVectorField
+
+from . import amenities, geo
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -29,6 +32,8 @@ class StudySpot(models.Model):
 
     # ONLY ONE image_url
     image_url = models.CharField(max_length=500, blank=True, null=True)
+    # Resized AVIF/WebP copies of image_url, see core/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
 
@@ -38,13 +43,78 @@ class StudySpot(models.Model):
     is_trending = models.BooleanField(default=False)
 
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    # Maintained by core.ratings on every review write; average_rating = sum / count
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    # Star histogram, maintained alongside the counters above
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    # Set with every counter update; update_trending rescores only these spots
+    reviews_changed_at = models.DateTimeField(blank=True, null=True, editable=False, db_index=True)
+    # Decayed review score relative to TrendingState.epoch, see core/trending.py
+    trending_score = models.FloatField(default=0, editable=False, db_index=True)
+
+    # Maintained by core.search on PostgreSQL (GIN-indexed, see migration 0016)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
+    # Bitset of the amenity booleans above, see core/amenities.py
+    amenity_mask = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
 
-    def update_average_rating(self):
-        average = self.reviews.aggregate(Avg('rating'))['rating__avg']
-        self.average_rating = round(average or 0, 2)
-        self.save()
+    # Changes with every write that affects how the spot is displayed; it
+    # versions the cached listing cards (core/cards.py) and tells the
+    # in-memory indexes which rows to re-read (core/indexing.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    # Derived from latitude/longitude; prefix-indexed for viewport queries (core/geo.py)
+    geohash = models.CharField(max_length=12, blank=True, default="", editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["geohash"],
+                name="core_spot_geohash_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
 
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent)] from 5 stars down to 1."""
+        total = self.rating_count
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f"rating_{stars}_count")
+            histogram.append((stars, count, round(100 * count / total) if total else 0))
+        return histogram
 
+    @property
+    def has_coordinates(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def sync_derived_fields(self):
+        """Recompute denormalized columns. Call before bulk_create/bulk_update."""
+        self.amenity_mask = amenities.mask_for_spot(self)
+        self.geohash = (
+            geo.encode_geohash(self.latitude, self.longitude) if self.has_coordinates else ""
+        )
+
+    def save(self, *args, **kwargs):
+        self.sync_derived_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if update_fields & set(amenities.AMENITY_FIELDS):
+                update_fields.add("amenity_mask")
+            if update_fields & {"latitude", "longitude"}:
+                update_fields.add("geohash")
+            update_fields.add("updated_at")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
 
 
 
@@ -92,15 +162,160 @@ class Review(models.Model):
         validators=[MinValueValidator(1), MaxValueValidator(5)]
     )
     comment = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # A default rather than auto_now_add, so import_catalog can keep the
+    # original review dates
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    # The spot's rating counters are updated by the Review signals
+    # (core/signals.py); keep them in the same transaction as the review.
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get("using")):
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the spot's counters currently include, for edits (core.ratings)
+        instance._counted = (instance.__dict__.get("spot_id"), instance.__dict__.get("rating"))
+        return instance
 
     class Meta:
         # This is the database constraint from your sub-tasks.
         # It ensures a user can only write one review per spot.
         unique_together = ('spot', 'user')
+        indexes = [
+            # Newest-first review pages for a spot (keyset pagination)
+            models.Index(
+                fields=["spot", "-created_at", "-id"], name="core_review_spot_created_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s review for {self.spot.name}"
+
+
+class TrendingState(models.Model):
+    """Singleton row for core.trending: the score epoch and the last run."""
+
+    epoch = models.DateTimeField()
+    last_run = models.DateTimeField(blank=True, null=True)
+
+    @classmethod
+    def load(cls):
+        state, _ = cls.objects.get_or_create(pk=1, defaults={"epoch": timezone.now()})
+        return state
+
+
+class GeocodeCache(models.Model):
+    """
+    Coordinates for a normalised address (see core/geocoding.py). Rows are
+    created as PENDING when a listing is saved with an unknown address and
+    resolved later by ``manage.py geocode_spots``.
+    """
+
+    PENDING = "pending"
+    RESOLVED = "resolved"
+    NOT_FOUND = "not_found"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RESOLVED, "Resolved"),
+        (NOT_FOUND, "Not found"),
+    ]
+
+    address = models.CharField(max_length=512, unique=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.address} ({self.status})"
     
 
 
+
+
+class PendingUpload(models.Model):
+    """
+    An uploaded file waiting in the local spool for ``manage.py
+    process_uploads`` to push it to storage (see core/uploads.py). Until
+    then ``target_field`` of the target row points at the spooled copy.
+    """
+
+    PENDING = "pending"
+    UPLOADING = "uploading"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (UPLOADING, "Uploading"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    spool_name = models.CharField(max_length=100, unique=True)
+    bucket = models.CharField(max_length=63)
+    path = models.CharField(max_length=500)
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    # Row to update once the file is in storage, e.g. ("core.StudySpot", 7, "image_url")
+    target_model = models.CharField(max_length=100)
+    target_id = models.PositiveBigIntegerField()
+    target_field = models.CharField(max_length=50)
+    # Also build image derivatives and record them in this field (core/images.py)
+    variants_field = models.CharField(max_length=50, blank=True)
+    # Uploads spooled together with the same group are stored all or nothing
+    group = models.CharField(max_length=32, blank=True, db_index=True)
+    # How long writing the spool file and pushing it to storage took
+    spool_ms = models.PositiveIntegerField(blank=True, null=True)
+    upload_ms = models.PositiveIntegerField(blank=True, null=True)
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    public_url = models.CharField(max_length=600, blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.bucket}/{self.path} ({self.status})"
+
+
+class StoredObject(models.Model):
+    """
+    A file in storage under a content-hashed path (``spots/7/<sha256>.jpg``).
+    Its bytes never change, so it is served with a year-long cache
+    lifetime and uploading the same bytes again reuses it. ``manage.py
+    gc_storage`` deletes objects no ``target_model.target_field`` points
+    at any more.
+    """
+
+    bucket = models.CharField(max_length=63)
+    path = models.CharField(max_length=500)
+    url = models.CharField(max_length=600)
+    size = models.PositiveBigIntegerField(default=0)
+    # Image variant manifest (core/images.py), copied on reuse
+    variants = models.JSONField(default=dict, blank=True)
+    target_model = models.CharField(max_length=100)
+    target_field = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped on reuse, so gc_storage spares objects just handed out again
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["bucket", "path"], name="unique_stored_object"),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket}/{self.path}"
@@ -0,0 +1,224 @@
+"""
+In-process k-nearest-neighbour index for "spots near me".
+
+Spots are stored as unit vectors on the sphere in a KD-tree, where the
+straight-line (chord) distance orders points exactly like great-circle
+distance. A query walks the tree best-first and stops once no unvisited
+node can beat the k-th candidate, so it touches a few leaves instead of
+sorting the whole table; the survivors are re-ranked with a vectorized
+haversine.
+
+Saves and deletes don't rebuild the tree: deleted spots are tombstoned
+and new or moved spots go to a small pending buffer that is scanned
+linearly. The tree is rebuilt from memory once either grows too large.
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+from . import amenities
+from .geo import EARTH_RADIUS_KM
+from .indexing import SpotIndex
+
+LEAF_SIZE = 32
+# Rebuild once pending + tombstoned spots exceed this share of the tree
+REBUILD_RATIO = 0.01
+REBUILD_MIN = 256
+DEFAULT_K = 24
+MAX_K = 200
+
+
+def to_unit_vectors(latitudes, longitudes):
+    lat = np.radians(latitudes)
+    lng = np.radians(longitudes)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Vectorized great-circle distance from one point to arrays of points."""
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(latitudes)
+    dphi = phi2 - phi1
+    dlmb = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def chord_for_km(radius_km):
+    """Squared chord length on the unit sphere for a great-circle distance."""
+    angle = min(radius_km / EARTH_RADIUS_KM, math.pi)
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+class KDTree:
+    """
+    Static KD-tree over unit vectors. Points are reordered so every node
+    covers a contiguous slice; each node keeps its bounding box for pruning.
+    """
+
+    def __init__(self, ids, latitudes, longitudes, masks):
+        self.size = len(ids)
+        points = to_unit_vectors(latitudes, longitudes) if self.size else np.empty((0, 3))
+        order = np.arange(self.size)
+
+        # node arrays: slice bounds, children (-1 for leaves), bounding boxes
+        self.starts, self.ends, self.lows, self.highs = [], [], [], []
+        self.left, self.right = [], []
+        if self.size:
+            self._build(points, order, 0, self.size)
+
+        self.points = points[order]
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)[order]
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)[order]
+        self.masks = np.asarray(masks, dtype=np.int64)[order]
+        self.alive = np.ones(self.size, dtype=bool)
+        self.position = {int(spot_id): pos for pos, spot_id in enumerate(self.ids)}
+        self.lows = np.array(self.lows)
+        self.highs = np.array(self.highs)
+
+    def _build(self, points, order, start, end):
+        node = len(self.starts)
+        chunk = points[order[start:end]]
+        low, high = chunk.min(axis=0), chunk.max(axis=0)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lows.append(low)
+        self.highs.append(high)
+        self.left.append(-1)
+        self.right.append(-1)
+
+        if end - start > LEAF_SIZE:
+            axis = int(np.argmax(high - low))
+            middle = (end - start) // 2
+            split = np.argpartition(chunk[:, axis], middle)
+            order[start:end] = order[start:end][split]
+            self.left[node] = self._build(points, order, start, start + middle)
+            self.right[node] = self._build(points, order, start + middle, end)
+        return node
+
+    def min_distance(self, node, point):
+        """Squared distance from ``point`` to the bounding box of ``node``."""
+        gap = np.maximum(self.lows[node] - point, 0) + np.maximum(point - self.highs[node], 0)
+        return float(gap @ gap)
+
+    def search(self, point, k, required=0, max_distance=math.inf):
+        """
+        Up to ``k`` (squared chord distance, position) pairs nearest to
+        ``point`` that are alive, carry the ``required`` amenity bits and lie
+        within ``max_distance``.
+        """
+        best = []  # max-heap of (-distance, position)
+        if not self.size:
+            return best
+        nodes = [(self.min_distance(0, point), 0)]
+        while nodes:
+            bound, node = heapq.heappop(nodes)
+            limit = -best[0][0] if len(best) == k else max_distance
+            if bound > limit:
+                break
+
+            if self.left[node] != -1:
+                for child in (self.left[node], self.right[node]):
+                    child_bound = self.min_distance(child, point)
+                    if child_bound <= limit:
+                        heapq.heappush(nodes, (child_bound, child))
+                continue
+
+            start, end = self.starts[node], self.ends[node]
+            diff = self.points[start:end] - point
+            distances = np.einsum("ij,ij->i", diff, diff)
+            keep = self.alive[start:end] & (distances <= limit)
+            if required:
+                keep &= (self.masks[start:end] & required) == required
+            for offset in np.flatnonzero(keep):
+                entry = (-float(distances[offset]), start + int(offset))
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        return best
+
+
+class NearbyIndex(SpotIndex):
+    fields = ("id", "latitude", "longitude", "amenity_mask")
+
+    def clear(self):
+        self.spots = {}  # spot_id -> (latitude, longitude, amenity_mask)
+        self.pending = set()  # spots not (or no longer correctly) in the tree
+        self.tombstones = 0
+        self.tree = KDTree([], [], [], [])
+
+    def add(self, row):
+        if row["latitude"] is None or row["longitude"] is None:
+            return
+        spot_id = row["id"]
+        self.spots[spot_id] = (row["latitude"], row["longitude"], row["amenity_mask"])
+        self.pending.add(spot_id)
+
+    def discard(self, spot_id):
+        if self.spots.pop(spot_id, None) is None:
+            return
+        self.pending.discard(spot_id)
+        position = self.tree.position.get(spot_id)
+        if position is not None and self.tree.alive[position]:
+            self.tree.alive[position] = False
+            self.tombstones += 1
+
+    def _maybe_rebuild(self):
+        # The first query after a build also lands here, with every spot pending
+        stale = len(self.pending) + self.tombstones
+        if stale <= max(REBUILD_MIN, REBUILD_RATIO * self.tree.size):
+            return
+        ids = list(self.spots)
+        rows = list(self.spots.values())
+        self.tree = KDTree(
+            ids,
+            [row[0] for row in rows],
+            [row[1] for row in rows],
+            [row[2] for row in rows],
+        )
+        self.pending = set()
+        self.tombstones = 0
+
+    def nearest(self, latitude, longitude, k=DEFAULT_K, amenity_keys=(), radius_km=None):
+        """
+        The ``k`` spots closest to (latitude, longitude) as a list of
+        (spot_id, distance_km), nearest first. Only spots with every amenity
+        in ``amenity_keys`` (and within ``radius_km``, if given) qualify.
+        """
+        self.ensure_built()
+        required = amenities.mask_for(amenity_keys)
+        max_distance = math.inf if radius_km is None else chord_for_km(radius_km)
+        point = to_unit_vectors([latitude], [longitude])[0]
+
+        with self.lock:
+            self._maybe_rebuild()
+            tree = self.tree
+            best = tree.search(point, k, required, max_distance)
+            positions = [position for _, position in best]
+            ids = tree.ids[positions].tolist()
+            lats = tree.latitudes[positions].tolist()
+            lngs = tree.longitudes[positions].tolist()
+
+            # Spots saved since the last rebuild are few; check them all
+            for spot_id in self.pending:
+                lat, lng, mask = self.spots[spot_id]
+                if mask & required == required:
+                    ids.append(spot_id)
+                    lats.append(lat)
+                    lngs.append(lng)
+
+        if not ids:
+            return []
+        distances = haversine_km(latitude, longitude, np.array(lats), np.array(lngs))
+        ranked = sorted(zip(distances.tolist(), ids))
+        if radius_km is not None:
+            ranked = [item for item in ranked if item[0] <= radius_km]
+        return [(spot_id, round(distance, 3)) for distance, spot_id in ranked[:k]]
+
+
+nearby_index = NearbyIndex()
@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination and cheap result counts.
+
+A page is fetched with ``WHERE (sort key) < (last key seen)`` instead of an
+OFFSET, so the cost of a page depends on the page size and not on how far
+into the listing the user has scrolled.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import math
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 24
+# Above this many rows, counts are estimated/capped instead of exact
+APPROX_COUNT_THRESHOLD = 1000
+
+
+@dataclass
+class Page:
+    items: list
+    next_cursor: str = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder drops microseconds below the millisecond, which
+        # would make a created_at cursor skip rows in the same millisecond
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def _reject_constant(name):
+    # NaN/Infinity: not a key any row can have
+    raise ValueError(f"{name} is not a valid cursor value")
+
+
+def _finite_float(text):
+    value = float(text)
+    if not math.isfinite(value):  # e.g. 1e400
+        raise ValueError(f"{text} is not a valid cursor value")
+    return value
+
+
+def decode_cursor(cursor):
+    """Return the list of key values in ``cursor``, or None if it's invalid."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(
+            base64.urlsafe_b64decode(padded.encode()),
+            parse_constant=_reject_constant,
+            parse_float=_finite_float,
+        )
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _after(ordering, values):
+    """
+    Build the "comes after this key" condition for ``ordering``, e.g. for
+    ("-search_rank", "-id"): rank < r OR (rank = r AND id < i).
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal_so_far & Q(**{f"{name}__{lookup}": value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return the page of ``queryset`` that follows ``cursor``.
+
+    ``ordering`` is a sequence of field or annotation names (``-`` for
+    descending) whose last entry must be unique, e.g. ("-search_rank", "-id").
+    An invalid or stale cursor falls back to the first page.
+    """
+    queryset = queryset.order_by(*ordering)
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(ordering):
+        try:
+            queryset = queryset.filter(_after(ordering, values))
+        except (TypeError, ValueError, OverflowError, ValidationError):
+            pass  # a key of the wrong type or size, e.g. a hand-edited cursor
+
+    items = list(queryset[: page_size + 1])
+    if len(items) <= page_size:
+        return Page(items)
+
+    items = items[:page_size]
+    last = items[-1]
+    next_cursor = encode_cursor(
+        [getattr(last, field.lstrip("-")) for field in ordering]
+    )
+    return Page(items, next_cursor)
+
+
+def approximate_count(queryset, filtered=True, threshold=APPROX_COUNT_THRESHOLD):
+    """
+    Return ``(count, is_estimate)``.
+
+    The unfiltered table on PostgreSQL uses the planner's row estimate. Any
+    other count stops at ``threshold`` rows, so it costs at most that many
+    index entries however large the catalog gets.
+    """
+    if not filtered and connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= threshold:
+            return row[0], True
+
+    count = queryset.order_by()[:threshold].count()
+    return count, count >= threshold
@@ -0,0 +1,74 @@
+"""
+Shared StudySpot query building for the listing pages (home, map) and the
+JSON endpoints, so every entry point parses and applies filters the same
+way.
+"""
+
+from dataclasses import dataclass
+
+from . import amenities, geo, nearby, search
+from .models import StudySpot
+
+
+@dataclass(frozen=True)
+class SpotQuery:
+    q: str = ""
+    amenities: tuple = ()
+    near: tuple = None  # (lat, lng) for "near me" listings
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.GET
+        q = " ".join(params.get("q", "").split())
+
+        # ?amenities=wifi,outlets is the multi-filter form; the older
+        # single ?filter=wifi links keep working.
+        requested = params.get("amenities", "")
+        legacy = params.get("filter", "")
+        if legacy and legacy != "all":
+            requested = f"{requested},{legacy}"
+
+        return cls(
+            q=q,
+            amenities=amenities.parse_amenities(requested),
+            near=geo.parse_point(params.get("near")),
+        )
+
+    @property
+    def is_filtered(self):
+        return bool(self.q or self.amenities or self.near)
+
+    @property
+    def cache_parts(self):
+        """The query in normalised form, for cache keys."""
+        return (self.q.lower(), tuple(sorted(self.amenities)), self.near)
+
+    @property
+    def ordering(self):
+        """Stable keyset ordering: best match first when searching, else newest."""
+        if search.tokenize(self.q):
+            return ("-search_rank", "-id")
+        return ("-id",)
+
+    def apply(self, queryset=None):
+        if queryset is None:
+            # The tsvector is only needed inside the database
+            queryset = StudySpot.objects.defer("search_vector")
+        queryset = amenities.filter_by_amenities(queryset, self.amenities)
+        return search.search_spots(queryset, self.q)
+
+    def nearest(self, k=nearby.DEFAULT_K):
+        """
+        The ``k`` spots closest to ``near`` that have the requested
+        amenities, nearest first, each with a ``distance_km`` attribute. A
+        text query only narrows that set; it does not widen the search.
+        """
+        latitude, longitude = self.near
+        distances = dict(
+            nearby.nearby_index.nearest(latitude, longitude, k, self.amenities)
+        )
+        spots = list(self.apply().filter(pk__in=list(distances)))
+        for spot in spots:
+            spot.distance_km = distances[spot.pk]
+        spots.sort(key=lambda spot: (spot.distance_km, spot.pk))
+        return spots
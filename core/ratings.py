@@ -0,0 +1,106 @@
+"""
+Review rating counters on StudySpot.
+
+rating_sum, rating_count and the five star buckets (rating_1_count ...
+rating_5_count) are adjusted by database-side F() expressions in a single
+UPDATE whenever a review is created, edited or deleted (see
+core/signals.py), so concurrent reviews can't overwrite each other and a
+new review costs the same however many reviews the spot already has.
+average_rating is derived from the counters in the same statement.
+"""
+
+from collections import Counter, defaultdict
+
+from django.db.models import Count, DecimalField, F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Now
+
+from . import indexing
+from .models import Review, StudySpot
+
+STARS = (1, 2, 3, 4, 5)
+
+
+def bucket_field(stars):
+    return f"rating_{stars}_count"
+
+
+BUCKET_FIELDS = tuple(bucket_field(stars) for stars in STARS)
+COUNTER_FIELDS = ("rating_sum", "rating_count", "average_rating") + BUCKET_FIELDS
+
+
+def average_expression(rating_sum, rating_count):
+    """SQL for rating_sum / rating_count as a 2-decimal average (0 if none)."""
+    average = Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0))
+    return Cast(
+        Coalesce(average, Value(0.0)),
+        DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def average_for(rating_sum, rating_count):
+    return round(rating_sum / rating_count, 2) if rating_count else 0
+
+
+def apply_change(spot_id, added=(), removed=()):
+    """
+    Atomically count the ``added`` ratings and uncount the ``removed`` ones
+    on a spot, refreshing its average. An edit is one of each.
+    """
+    buckets = Counter(added)
+    buckets.subtract(removed)
+    sum_delta = sum(added) - sum(removed)
+    count_delta = len(added) - len(removed)
+    if not sum_delta and not count_delta and not any(buckets.values()):
+        return
+
+    # Every right-hand side sees the row as it was before this UPDATE
+    new_sum = F("rating_sum") + sum_delta
+    new_count = F("rating_count") + count_delta
+    updates = {
+        bucket_field(stars): F(bucket_field(stars)) + delta
+        for stars, delta in buckets.items()
+        if delta
+    }
+    updated = StudySpot.objects.filter(pk=spot_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        average_rating=average_expression(new_sum, new_count),
+        reviews_changed_at=Now(),
+        updated_at=Now(),
+        **updates,
+    )
+    if updated:
+        # .update() skips the StudySpot signals; this only reads the row
+        # back if a built index ranks by rating (the typeahead does). Other
+        # workers catch up once the Review signals bump the catalog version.
+        indexing.spot_updated(spot_id, COUNTER_FIELDS)
+
+
+def actual_counters(spot_ids=None):
+    """
+    {spot_id: {field: value}} for every counter field, recomputed from the
+    reviews with one GROUP BY (spot, rating) query. Spots without reviews
+    are left out. Pass ``spot_ids`` to recompute only those spots.
+    """
+    histograms = defaultdict(Counter)
+    reviews = Review.objects.all()
+    if spot_ids is not None:
+        reviews = reviews.filter(spot_id__in=spot_ids)
+    rows = reviews.values_list("spot_id", "rating").annotate(n=Count("id")).order_by()
+    for spot_id, rating, n in rows:
+        histograms[spot_id][rating] += n
+    return {spot_id: counters_for(histogram) for spot_id, histogram in histograms.items()}
+
+
+def counters_for(histogram):
+    """Counter field values for a {stars: number of reviews} histogram."""
+    rating_sum = sum(stars * n for stars, n in histogram.items())
+    rating_count = sum(histogram.values())
+    values = {
+        "rating_sum": rating_sum,
+        "rating_count": rating_count,
+        "average_rating": average_for(rating_sum, rating_count),
+    }
+    for stars in STARS:
+        values[bucket_field(stars)] = histogram.get(stars, 0)
+    return values
@@ -0,0 +1,371 @@
+"""
+Ranked full-text search over StudySpot.
+
+On PostgreSQL the search runs against the ``search_vector`` column (name
+weighted A, location B, description C) backed by a GIN index. Other
+backends (SQLite in development and tests) use an in-process inverted
+index with the same weighting and prefix semantics.
+
+When the exact search finds fewer than ``FUZZY_MIN_RESULTS`` spots, typo
+tolerant trigram matching on name and location is mixed in (pg_trgm on
+PostgreSQL, an in-process trigram index elsewhere), so "mezanine" still
+finds "Mezzanine".
+
+Views should only call ``search_spots()``.
+"""
+
+import bisect
+import math
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+
+from .indexing import SpotIndex
+
+# Same defaults as PostgreSQL's ts_rank: {D, C, B, A} = {0.1, 0.2, 0.4, 1.0}
+FIELD_WEIGHTS = {
+    "name": 1.0,
+    "location": 0.4,
+    "description": 0.2,
+}
+SEARCH_CONFIG = "simple"
+MAX_FALLBACK_RESULTS = 1000
+
+FUZZY_FIELDS = ("name", "location")
+FUZZY_MIN_RESULTS = 3
+# pg_trgm's default pg_trgm.similarity_threshold, used by the % operator
+FUZZY_THRESHOLD = 0.3
+# Exact matches always rank above fuzzy ones
+EXACT_BOOST = 1.0
+
+TOKEN_RE = re.compile(r"\w+")
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def trigrams(text):
+    """
+    Trigrams the way pg_trgm builds them: each word is lower-cased and
+    padded with two spaces in front and one behind.
+    """
+    grams = set()
+    for word in WORD_RE.findall((text or "").lower()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def build_search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector("location", weight="B", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def order_by_scores(queryset, scores):
+    """
+    Restrict ``queryset`` to the ids in ``scores`` ({id: score}) and annotate
+    ``search_rank`` so results can be ordered (and keyset-paginated) the same
+    way as the PostgreSQL backend.
+    """
+    by_score = defaultdict(list)
+    for spot_id, score in scores.items():
+        by_score[round(score, 6)].append(spot_id)
+
+    rank = Case(
+        *[When(pk__in=ids, then=Value(score)) for score, ids in by_score.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return (
+        queryset.filter(pk__in=list(scores))
+        .annotate(search_rank=rank)
+        .order_by("-search_rank", "-id")
+    )
+
+
+# ---------- POSTGRESQL ----------
+
+class PostgresSearchBackend:
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+
+        # Every term must match, and each one matches as a prefix so
+        # results show up while the user is still typing.
+        raw = " & ".join(f"{term}:*" for term in terms)
+        ts_query = SearchQuery(raw, search_type="raw", config=SEARCH_CONFIG)
+
+        return (
+            queryset.filter(search_vector=ts_query)
+            .annotate(
+                search_rank=Cast(
+                    SearchRank(F("search_vector"), ts_query), FloatField()
+                )
+            )
+            .order_by("-search_rank", "-id")
+        )
+
+    def fuzzy_search(self, queryset, query, exact_scores):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        # field % query uses the gin_trgm_ops indexes from migration 0017.
+        matches = Q(pk__in=list(exact_scores))
+        for field in FUZZY_FIELDS:
+            matches |= Q(**{f"{field}__trigram_similar": query})
+
+        similarity = Greatest(
+            *[TrigramSimilarity(field, query) for field in FUZZY_FIELDS]
+        )
+        rank = Case(
+            *[
+                When(pk=spot_id, then=Value(EXACT_BOOST + score))
+                for spot_id, score in exact_scores.items()
+            ],
+            default=similarity,
+            output_field=FloatField(),
+        )
+        return (
+            queryset.filter(matches)
+            .annotate(search_rank=Cast(rank, FloatField()))
+            .order_by("-search_rank", "-id")
+        )
+
+    def index_spot(self, spot):
+        from .models import StudySpot
+
+        StudySpot.objects.filter(pk=spot.pk).update(
+            search_vector=build_search_vector()
+        )
+
+
+# ---------- IN-PROCESS FALLBACK ----------
+
+class InvertedIndex(SpotIndex):
+    fields = ("id", "name", "location", "description")
+
+    def clear(self):
+        self.postings = {}   # token -> {spot_id: weight}
+        self.vocabulary = []  # sorted tokens, for prefix lookups
+        self.doc_tokens = {}  # spot_id -> tokens, so a spot can be removed
+
+    def add(self, row):
+        spot_id = row["id"]
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(row[field]):
+                weights[token] += weight
+
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                bisect.insort(self.vocabulary, token)
+            posting[spot_id] = weight
+        self.doc_tokens[spot_id] = list(weights)
+
+    def discard(self, spot_id):
+        for token in self.doc_tokens.pop(spot_id, ()):
+            posting = self.postings[token]
+            posting.pop(spot_id, None)
+            if not posting:
+                del self.postings[token]
+                i = bisect.bisect_left(self.vocabulary, token)
+                del self.vocabulary[i]
+
+    def _prefix_tokens(self, prefix):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff")
+        return self.vocabulary[start:end]
+
+    def score(self, terms):
+        """Return {spot_id: score} for spots matching every term as a prefix."""
+        self.ensure_built()
+        with self.lock:
+            scores = None
+            for term in terms:
+                term_scores = defaultdict(float)
+                for token in self._prefix_tokens(term):
+                    for spot_id, weight in self.postings[token].items():
+                        term_scores[spot_id] += weight
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        spot_id: total + term_scores[spot_id]
+                        for spot_id, total in scores.items()
+                        if spot_id in term_scores
+                    }
+                if not scores:
+                    return {}
+            return dict(scores or {})
+
+
+class TrigramIndex(SpotIndex):
+    """
+    Trigram inverted index over the fuzzy fields of every spot.
+
+    Postings are bucketed by the trigram count of the indexed string. For a
+    query with ``n`` trigrams, a string with ``d`` trigrams can only reach
+    similarity ``t`` if ``t * n <= d <= n / t`` and it shares at least
+    ``m = t * (n + d) / (1 + t)`` of them. Any such string therefore contains
+    one of the ``n - m + 1`` rarest query trigrams in its bucket, so only
+    those postings are probed before similarities are computed.
+    """
+
+    fields = ("id",) + FUZZY_FIELDS
+
+    def clear(self):
+        self.postings = defaultdict(dict)  # trigram -> {size: {entry}}
+        self.sizes = defaultdict(int)  # size -> number of entries
+        # One entry per (spot, field), packed into an int for cheap hashing
+        self.entry_grams = {}  # entry -> trigrams
+
+    def _entries(self, spot_id):
+        for field_no in range(len(FUZZY_FIELDS)):
+            yield spot_id * len(FUZZY_FIELDS) + field_no
+
+    def add(self, row):
+        for entry, field in zip(self._entries(row["id"]), FUZZY_FIELDS):
+            grams = frozenset(trigrams(row[field]))
+            if not grams:
+                continue
+            size = len(grams)
+            for gram in grams:
+                self.postings[gram].setdefault(size, set()).add(entry)
+            self.sizes[size] += 1
+            self.entry_grams[entry] = grams
+
+    def discard(self, spot_id):
+        for entry in self._entries(spot_id):
+            grams = self.entry_grams.pop(entry, None)
+            if grams is None:
+                continue
+            size = len(grams)
+            for gram in grams:
+                buckets = self.postings[gram]
+                buckets[size].discard(entry)
+                if not buckets[size]:
+                    del buckets[size]
+                    if not buckets:
+                        del self.postings[gram]
+            self.sizes[size] -= 1
+            if not self.sizes[size]:
+                del self.sizes[size]
+
+    def similar(self, query, threshold=FUZZY_THRESHOLD):
+        """Return {spot_id: similarity} for spots at or above ``threshold``."""
+        query_grams = frozenset(trigrams(query))
+        n = len(query_grams)
+        if not n:
+            return {}
+
+        self.ensure_built()
+        results = {}
+        fields = len(FUZZY_FIELDS)
+        with self.lock:
+            for size in list(self.sizes):
+                if size < threshold * n or size * threshold > n:
+                    continue
+                min_shared = math.ceil(threshold * (n + size) / (1 + threshold) - 1e-9)
+                if min_shared > min(n, size):
+                    continue
+
+                buckets = []
+                for gram in query_grams:
+                    bucket = self.postings.get(gram)
+                    buckets.append(bucket.get(size, ()) if bucket else ())
+                buckets.sort(key=len)
+                candidates = set().union(*buckets[: n - min_shared + 1])
+
+                for entry in candidates:
+                    shared = len(query_grams & self.entry_grams[entry])
+                    if shared < min_shared:
+                        continue
+                    spot_id = entry // fields
+                    similarity = shared / (n + size - shared)
+                    if similarity > results.get(spot_id, 0.0):
+                        results[spot_id] = similarity
+        return results
+
+
+class PythonSearchBackend:
+    def __init__(self):
+        self.index = InvertedIndex()
+        self.trigram_index = TrigramIndex()
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+
+        scores = self.index.score(terms)
+        if len(scores) > MAX_FALLBACK_RESULTS:
+            top = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+            scores = dict(top[:MAX_FALLBACK_RESULTS])
+        return order_by_scores(queryset, scores)
+
+    def fuzzy_search(self, queryset, query, exact_scores):
+        scores = self.trigram_index.similar(query)
+        for spot_id, score in exact_scores.items():
+            scores[spot_id] = EXACT_BOOST + score
+        return order_by_scores(queryset, scores)
+
+    def index_spot(self, spot):
+        # The in-process indexes are patched through core.indexing.
+        pass
+
+
+# ---------- PUBLIC API ----------
+
+_backends = {}
+
+
+def get_backend():
+    vendor = connection.vendor
+    if vendor not in _backends:
+        if vendor == "postgresql":
+            _backends[vendor] = PostgresSearchBackend()
+        else:
+            _backends[vendor] = PythonSearchBackend()
+    return _backends[vendor]
+
+
+def search_spots(queryset, query):
+    """
+    Filter ``queryset`` down to spots matching ``query``, best matches first.
+    An empty query returns the queryset unchanged.
+
+    Fuzzy matches are only added when the exact search comes back with
+    fewer than ``FUZZY_MIN_RESULTS`` spots.
+    """
+    query = (query or "").strip()
+    if not tokenize(query):
+        return queryset
+
+    backend = get_backend()
+    results = backend.search(queryset, query)
+    exact_scores = dict(
+        results.values_list("pk", "search_rank")[:FUZZY_MIN_RESULTS]
+    )
+    if len(exact_scores) >= FUZZY_MIN_RESULTS:
+        return results
+    return backend.fuzzy_search(queryset, query, exact_scores)
+
+
+def index_spot(spot):
+    get_backend().index_spot(spot)
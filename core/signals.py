@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, StudySpot, Review
+from . import caching, identity, indexing, ratings, search
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -10,4 +12,63 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
\ No newline at end of file
+    instance.userprofile.save()
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    identity.forget_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def forget_cached_profile(sender, instance, **kwargs):
+    identity.forget_user(instance.user_id)
+
+
+@receiver(post_save, sender=StudySpot)
+def sync_spot_indexes(sender, instance, **kwargs):
+    search.index_spot(instance)
+    indexing.spot_saved(instance)
+
+
+@receiver(post_delete, sender=StudySpot)
+def drop_spot_indexes(sender, instance, **kwargs):
+    indexing.spot_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=Review)
+def remember_counted_rating(sender, instance, **kwargs):
+    # Reviews loaded without spot/rating (e.g. via only()) still need the
+    # old values, so an edit can take them back out of the counters.
+    counted = getattr(instance, "_counted", (None, None))
+    if not instance._state.adding and None in counted:
+        instance._counted = (
+            Review.objects.filter(pk=instance.pk).values_list("spot_id", "rating").first()
+            or (None, None)
+        )
+
+
+@receiver(post_save, sender=Review)
+def count_review_rating(sender, instance, created, **kwargs):
+    old_spot, old_rating = (None, None) if created else instance._counted
+    if old_spot == instance.spot_id:
+        ratings.apply_change(instance.spot_id, added=[instance.rating], removed=[old_rating])
+    else:
+        if old_spot is not None:
+            ratings.apply_change(old_spot, removed=[old_rating])
+        ratings.apply_change(instance.spot_id, added=[instance.rating])
+    instance._counted = (instance.spot_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review_rating(sender, instance, **kwargs):
+    ratings.apply_change(instance.spot_id, removed=[instance.rating])
+
+
+# Registered after the rating receivers so the new version is only
+# published once the counters have been updated and committed; bumping
+# earlier would let a concurrent request cache the old rows under it.
+@receiver([post_save, post_delete], sender=StudySpot)
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_catalog_caches(sender, **kwargs):
+    transaction.on_commit(caching.bump_catalog_version)
@@ -0,0 +1,336 @@
+"""
+Object storage for uploaded files (listing images, avatars, staff documents).
+
+``get_storage()`` returns the backend named by settings.STORAGE_BACKEND:
+Supabase Storage in production, a directory on disk ("local") that stands
+in for it in development and offline tests, or any class with the same
+methods given by dotted path:
+
+- ``upload(bucket, path, data, content_type, immutable=False)`` stores
+  ``data`` (bytes, or a binary file which is streamed), overwriting what
+  is there; ``immutable`` makes it cacheable
+  for a year, so its path must never be reused for other bytes.
+- ``download(bucket, path)`` reads it back.
+- ``delete(bucket, paths)`` removes objects; missing ones are ignored.
+- ``public_url(bucket, path)`` builds an object's URL and ``locate(url)``
+  turns such a URL back into ``(bucket, path, query)``, or None.
+
+Failures raise StorageError; ``transient`` tells whether trying again
+may help. ``get_storage()`` wraps the backend in ResilientStorage, which
+retries transient failures of these (idempotent) calls with exponential
+backoff. Behind it sits a circuit breaker (core/circuit.py): while storage
+keeps failing, calls fail fast with StorageUnavailable instead of each
+waiting out its timeouts, and ``health()`` reports the state.
+"""
+
+import functools
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import circuit
+
+# Seconds; nothing waits on storage for longer than these
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 20  # also the write timeout, per chunk sent
+HTTP_POOL_TIMEOUT = 5  # waiting for a free pooled connection
+HTTP_MAX_CONNECTIONS = 16
+PUBLIC_URL_CACHE_SIZE = 4096
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+SUPABASE_PUBLIC_PREFIX = "/storage/v1/object/public/"
+# Attempts after the first for transient failures, waiting about
+# RETRY_BACKOFF, then twice that, ... seconds in between
+RETRIES = 2
+RETRY_BACKOFF = 0.5
+# Consecutive transient failures that open the circuit, and how long it
+# stays open before a trial call
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30
+
+
+class StorageError(Exception):
+    def __init__(self, message, transient=True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class StorageUnavailable(StorageError):
+    """Refused without trying: the circuit is open."""
+
+
+def _api_error(message, exc):
+    """A StorageError for an exception from the Supabase client."""
+    status = getattr(exc, "status", None)
+    # An error page that isn't JSON fails the client's parsing; the httpx
+    # error it was handling still has the response
+    context = exc
+    while status is None and context is not None:
+        status = getattr(getattr(context, "response", None), "status_code", None)
+        context = context.__context__
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        status = None
+    # Network errors and timeouts have no status; 4xx (bad path, missing
+    # object, credentials) won't go away on retry
+    transient = status is None or status >= 500 or status in (408, 429)
+    return StorageError(f"{message}: {exc}", transient=transient)
+
+
+def _split_url(url, prefix):
+    """(bucket, path, query) for ``url`` if it starts with ``prefix``."""
+    base, _, query = url.partition("?")
+    if not base.startswith(prefix):
+        return None
+    bucket, _, path = base[len(prefix):].partition("/")
+    if not bucket or not path:
+        return None
+    return bucket, unquote(path), f"?{query}" if query else ""
+
+
+class SupabaseStorage:
+    """
+    Supabase Storage. The client is created on first use, once per
+    process, and talks through one shared keep-alive connection pool, so
+    importing the app (workers, management commands) never touches the
+    network and missing credentials only fail the calls that need them.
+    """
+
+    def __init__(self, url=None, key=None):
+        self.url = url or os.getenv("SUPABASE_URL")
+        self.key = key or os.getenv("SUPABASE_KEY")
+        self._client = None
+        self._lock = threading.Lock()
+        # get_public_url only formats a string; remember the answers
+        self.public_url = functools.lru_cache(maxsize=PUBLIC_URL_CACHE_SIZE)(self._public_url)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        import httpx
+        from supabase import ClientOptions, create_client
+
+        if not self.url or not self.key:
+            raise StorageError("SUPABASE_URL and SUPABASE_KEY must be set.", transient=False)
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(
+                connect=HTTP_CONNECT_TIMEOUT,
+                read=HTTP_READ_TIMEOUT,
+                write=HTTP_READ_TIMEOUT,
+                pool=HTTP_POOL_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+            http2=True,
+        )
+        try:
+            return create_client(
+                self.url, self.key, options=ClientOptions(httpx_client=http_client)
+            )
+        except Exception as exc:
+            http_client.close()
+            raise StorageError(f"Could not create the Supabase client: {exc}") from exc
+
+    def upload(self, bucket, path, data, content_type, immutable=False):
+        # upsert: one round trip whether or not the object exists yet
+        options = {"content-type": content_type, "upsert": "true"}
+        if immutable:
+            options["cache-control"] = str(IMMUTABLE_MAX_AGE)
+        try:
+            self.client.storage.from_(bucket).upload(path=path, file=data, file_options=options)
+        except StorageError:
+            raise
+        except Exception as exc:
+            raise _api_error(f"Upload of {bucket}/{path} failed", exc) from exc
+
+    def download(self, bucket, path):
+        try:
+            return self.client.storage.from_(bucket).download(path)
+        except StorageError:
+            raise
+        except Exception as exc:
+            raise _api_error(f"Download of {bucket}/{path} failed", exc) from exc
+
+    def delete(self, bucket, paths):
+        try:
+            self.client.storage.from_(bucket).remove(list(paths))
+        except StorageError:
+            raise
+        except Exception as exc:
+            raise _api_error(f"Delete from {bucket} failed", exc) from exc
+
+    def _public_url(self, bucket, path):
+        return self.client.storage.from_(bucket).get_public_url(path).rstrip("?")
+
+    def locate(self, url):
+        if not self.url:
+            return None
+        return _split_url(url, self.url.rstrip("/") + SUPABASE_PUBLIC_PREFIX)
+
+
+class LocalStorage:
+    """Files under ``root``/<bucket>/<path>, served from ``base_url``."""
+
+    def __init__(self, root=None, base_url=None):
+        self.root = Path(root or settings.LOCAL_STORAGE_ROOT)
+        self.base_url = (base_url or settings.MEDIA_URL + "storage/").rstrip("/") + "/"
+
+    def _file(self, bucket, path):
+        target = (self.root / bucket / path).resolve()
+        if not target.is_relative_to(self.root.resolve()):
+            raise StorageError(f"Invalid storage path {bucket}/{path}", transient=False)
+        return target
+
+    def upload(self, bucket, path, data, content_type, immutable=False):
+        target = self._file(bucket, path)
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Write then rename, so readers never see half a file
+            fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+            with os.fdopen(fd, "wb") as handle:
+                if isinstance(data, bytes):
+                    handle.write(data)
+                else:
+                    shutil.copyfileobj(data, handle)
+            os.replace(tmp, target)
+        except OSError as exc:
+            raise StorageError(f"Upload of {bucket}/{path} failed: {exc}") from exc
+
+    def download(self, bucket, path):
+        try:
+            return self._file(bucket, path).read_bytes()
+        except OSError as exc:
+            raise StorageError(
+                f"Download of {bucket}/{path} failed: {exc}",
+                transient=not isinstance(exc, FileNotFoundError),
+            ) from exc
+
+    def delete(self, bucket, paths):
+        try:
+            for path in paths:
+                self._file(bucket, path).unlink(missing_ok=True)
+        except OSError as exc:
+            raise StorageError(f"Delete from {bucket} failed: {exc}") from exc
+
+    def public_url(self, bucket, path):
+        return f"{self.base_url}{bucket}/{path}"
+
+    def locate(self, url):
+        return _split_url(url, self.base_url)
+
+
+class ResilientStorage:
+    """
+    Retries and a circuit breaker around ``backend``. URL helpers
+    (``public_url``, ``locate``) don't touch the network and pass through.
+    """
+
+    def __init__(self, backend, breaker=None, retries=RETRIES, backoff=RETRY_BACKOFF):
+        self.backend = backend
+        self.breaker = breaker or circuit.CircuitBreaker(
+            "storage", BREAKER_THRESHOLD, BREAKER_RESET
+        )
+        self.retries = retries
+        self.backoff = backoff
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def available(self):
+        """False while the circuit is open (calls would fail fast)."""
+        # Polled by the uploader even when idle: keeps the health check fed
+        self.breaker.publish()
+        return self.breaker.state != circuit.OPEN or self.breaker.retry_in() == 0
+
+    def upload(self, bucket, path, data, content_type, immutable=False):
+        start = data.tell() if hasattr(data, "seek") else None
+
+        def attempt():
+            if start is not None:
+                data.seek(start)  # a file is read again from the start
+            self.backend.upload(bucket, path, data, content_type, immutable=immutable)
+
+        self._call(attempt)
+
+    def download(self, bucket, path):
+        return self._call(lambda: self.backend.download(bucket, path))
+
+    def delete(self, bucket, paths):
+        paths = list(paths)
+        self._call(lambda: self.backend.delete(bucket, paths))
+
+    def _call(self, attempt):
+        for retry in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise StorageUnavailable(
+                    f"Storage is unavailable; retrying in {self.breaker.retry_in():.0f}s."
+                )
+            try:
+                result = attempt()
+            except StorageError as exc:
+                if not exc.transient:
+                    self.breaker.record_success()  # storage answered
+                    raise
+                self.breaker.record_failure()
+                if retry == self.retries:
+                    raise
+                # Full jitter keeps a pool of threads from retrying in step
+                time.sleep(random.uniform(0, self.backoff * 2 ** retry))
+            else:
+                self.breaker.record_success()
+                return result
+
+
+BACKENDS = {
+    "supabase": "core.storage.SupabaseStorage",
+    "local": "core.storage.LocalStorage",
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(name):
+    """A backend by name ("supabase", "local") or dotted class path."""
+    return import_string(BACKENDS.get(name, name))()
+
+
+def get_storage():
+    """The process-wide backend configured by settings.STORAGE_BACKEND."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = ResilientStorage(create_storage(settings.STORAGE_BACKEND))
+    return _storage
+
+
+def health():
+    """
+    The storage circuit as last published by any process: "closed"
+    (healthy), "open" (failing, calls refused), "half_open" (trying
+    again) or "unknown" if no process has used storage for a few minutes
+    (process_uploads checks it on every poll, busy or not).
+    """
+    return circuit.published("storage") or {"name": "storage", "state": "unknown"}
+
+
+def storage_available():
+    """False while storage is known to be down."""
+    return health()["state"] != circuit.OPEN
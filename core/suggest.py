@@ -0,0 +1,141 @@
+"""
+Search-box typeahead served from memory.
+
+Every word-start suffix of a spot's name and location ("it park cebu",
+"park cebu", "cebu") goes into one sorted list, so the entries matching a
+typed prefix are a single bisect range. Matches are ranked by rating, then
+popularity (number of reviews). Short prefixes match a large share of the
+catalog, so for wide ranges the spots are walked in rank order instead and
+the walk stops as soon as enough of them match. Answers are memoized per
+prefix until the next StudySpot change; nothing here queries the database
+once the index is built.
+"""
+
+import bisect
+
+from .indexing import SpotIndex
+from .search import tokenize
+
+NAME, LOCATION = 0, 1
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+MAX_CACHED_PREFIXES = 5000
+# Ranges wider than this are answered by walking spots in rank order
+SCAN_LIMIT = 2000
+
+
+def normalize(text):
+    return " ".join(tokenize(text))
+
+
+class SuggestIndex(SpotIndex):
+    fields = ("id", "name", "location", "average_rating", "rating_count")
+
+    def clear(self):
+        self.keys = []  # sorted (suffix, spot_id, field)
+        self.ranking = []  # sorted (rank key, spot_id), best first
+        self.is_sorted = True
+        self.spots = {}  # spot_id -> (name, location, rank key)
+        self.spot_keys = {}  # spot_id -> its entries in self.keys
+        self.results = {}  # (prefix, limit) -> memoized suggestions
+
+    def add(self, row):
+        spot_id = row["id"]
+        rank = (-float(row["average_rating"] or 0), -row["rating_count"])
+        self.spots[spot_id] = (row["name"], row["location"], rank)
+
+        entries = []
+        for field, text in ((NAME, row["name"]), (LOCATION, row["location"])):
+            words = normalize(text).split()
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), spot_id, field))
+        if self.is_sorted and self.built:
+            for entry in entries:
+                bisect.insort(self.keys, entry)
+            bisect.insort(self.ranking, (rank, spot_id))
+        else:
+            # Initial build: append everything and sort once on first query
+            self.keys.extend(entries)
+            self.ranking.append((rank, spot_id))
+            self.is_sorted = False
+        self.spot_keys[spot_id] = entries
+        self.results.clear()
+
+    def discard(self, spot_id):
+        spot = self.spots.pop(spot_id, None)
+        if spot is None:
+            return
+        self._sort()
+        for entry in self.spot_keys.pop(spot_id):
+            _remove(self.keys, entry)
+        _remove(self.ranking, (spot[2], spot_id))
+        self.results.clear()
+
+    def _sort(self):
+        if not self.is_sorted:
+            self.keys.sort()
+            self.ranking.sort()
+            self.is_sorted = True
+
+    def _ranked_matches(self, prefix, start, end):
+        """(spot_id, field) pairs matching ``prefix``, best ranked first."""
+        if end - start <= SCAN_LIMIT:
+            candidates = {
+                (self.spots[spot_id][2], spot_id, field)
+                for _, spot_id, field in self.keys[start:end]
+            }
+            for _, spot_id, field in sorted(candidates):
+                yield spot_id, field
+            return
+
+        for _, spot_id in self.ranking:
+            entries = self.spot_keys[spot_id]
+            for field in (NAME, LOCATION):
+                if any(e[2] == field and e[0].startswith(prefix) for e in entries):
+                    yield spot_id, field
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """
+        Up to ``limit`` suggestions for ``prefix``: dicts with ``type``
+        ("spot" or "location") and ``text``, plus ``id`` for spots. Each
+        location is suggested once, at the rank of its best spot.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.ensure_built()
+
+        with self.lock:
+            cached = self.results.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            self._sort()
+            start = bisect.bisect_left(self.keys, (prefix,))
+            end = bisect.bisect_left(self.keys, (prefix + "\uffff",))
+
+            results = []
+            seen_locations = set()
+            for spot_id, field in self._ranked_matches(prefix, start, end):
+                name, location, _ = self.spots[spot_id]
+                if field == NAME:
+                    results.append({"type": "spot", "id": spot_id, "text": name, "location": location})
+                elif location.lower() not in seen_locations:
+                    seen_locations.add(location.lower())
+                    results.append({"type": "location", "text": location})
+                if len(results) == limit:
+                    break
+
+            if len(self.results) >= MAX_CACHED_PREFIXES:
+                self.results.clear()
+            self.results[(prefix, limit)] = results
+            return results
+
+
+def _remove(sorted_list, item):
+    i = bisect.bisect_left(sorted_list, item)
+    if i < len(sorted_list) and sorted_list[i] == item:
+        del sorted_list[i]
+
+
+suggest_index = SuggestIndex()
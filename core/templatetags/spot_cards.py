@@ -0,0 +1,11 @@
+from django import template
+
+from core.cards import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def spot_cards(context, spots, variant):
+    """{% spot_cards spots "home" as cards %}: [(spot, cached card HTML)]"""
+    return render_cards(spots, variant, context)
@@ -0,0 +1,41 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def spot_picture(spot, variant, sizes="100vw", loading="lazy"):
+    """
+    <picture> for the spot's image with AVIF/WebP srcsets of its resized
+    variants (core/images.py), or a plain <img> if it has none yet.
+    """
+    variants = images.current_variants(spot)
+    entry = variants.get(variant)
+    if not entry:
+        return format_html(
+            '<img src="{}" alt="{}" loading="{}">', spot.image_url, spot.name, loading
+        )
+
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (content_type, images.srcset(variants, fmt), sizes)
+            for fmt, (_, content_type, _) in images.FORMATS.items()
+            if fmt in entry
+        ),
+    )
+    return format_html(
+        '<picture class="spot-picture">{}<img src="{}" alt="{}" width="{}" height="{}" '
+        'loading="{}" decoding="async"></picture>',
+        sources, spot.image_url, spot.name, entry["width"], entry["height"], loading,
+    )
+
+
+@register.simple_tag
+def spot_image_url(spot, variant, fmt="webp"):
+    """A single variant's URL (e.g. for data attributes read by JS)."""
+    return images.variant_url(spot, variant, fmt) or ""
@@ -1,3 +1,1897 @@
-from django.test import TestCase
+import base64
+import email
+import hashlib
+import email.policy
+import io
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import unquote
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from . import (
+    caching,
+    cards,
+    checks,
+    circuit,
+    clustering,
+    facets,
+    geo,
+    geocoding,
+    identity,
+    images,
+    nearby,
+    ratings,
+    storage,
+    suggest,
+    trending,
+    uploads,
+)
+from .models import (
+    GeocodeCache,
+    PendingUpload,
+    Review,
+    StaffApplication,
+    StoredObject,
+    StudySpot,
+    TrendingState,
+)
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .queries import SpotQuery
+from .storage import (
+    ResilientStorage,
+    StorageError,
+    StorageUnavailable,
+    SupabaseStorage,
+    _api_error,
+)
+from .templatetags.spot_images import spot_picture
+
+
+# ---------- HELPERS ----------
+
+def make_spot(owner, name, **fields):
+    fields.setdefault("location", "Lahug, Cebu City")
+    fields.setdefault("description", "A place to study")
+    return StudySpot.objects.create(name=name, owner=owner, **fields)
+
+
+class StubBackend:
+    """
+    A storage backend in memory. Each call pops the next entry of
+    ``failures`` and raises it if it isn't None.
+    """
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.objects = {}
+        self.calls = []
+
+    def upload(self, bucket, path, data, content_type, immutable=False):
+        body = data.read() if hasattr(data, "read") else data
+        self.calls.append(("upload", path, body))
+        self._fail()
+        self.objects[(bucket, path)] = body
+
+    def download(self, bucket, path):
+        self.calls.append(("download", path))
+        self._fail()
+        return self.objects[(bucket, path)]
+
+    def delete(self, bucket, paths):
+        self.calls.append(("delete", paths))
+        self._fail()
+        for path in paths:
+            self.objects.pop((bucket, path), None)
+
+    def public_url(self, bucket, path):
+        return f"https://storage.test/{bucket}/{path}"
+
+    def locate(self, url):
+        return None
+
+    def _fail(self):
+        error = self.failures.pop(0) if self.failures else None
+        if error is not None:
+            raise error
+
+
+class FakeStorageServer:
+    """
+    A local HTTP server speaking enough of the Supabase Storage API for
+    SupabaseStorage. Setting ``status`` fails every request with it (as
+    JSON, or as an HTML page if ``json_errors`` is False), ``delay`` holds
+    each answer back and ``drop`` closes connections without one.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+        self.status = None
+        self.json_errors = True
+        self.delay = 0
+        self.drop = False
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.handle_error = lambda request, address: None  # clients that gave up
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle_request(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                fake.requests.append((self.command, self.path))
+                time.sleep(fake.delay)
+                if fake.drop:
+                    self.close_connection = True
+                    return
+                if fake.status:
+                    if fake.json_errors:
+                        self.reply(fake.status, api_error(fake.status, "failed"))
+                    else:
+                        self.reply(fake.status, b"<html>Bad gateway</html>", "text/html")
+                    return
+                prefix = "/storage/v1/object/"
+                key = unquote(self.path[len(prefix):])
+                if self.command == "POST":
+                    form = email.message_from_bytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body,
+                        policy=email.policy.HTTP,
+                    )
+                    part = next(part for part in form.iter_parts() if part.get_filename())
+                    fake.objects[key] = {
+                        "data": part.get_payload(decode=True),
+                        "content_type": part.get_content_type(),
+                        "cache_control": self.headers.get("cache-control"),
+                    }
+                    self.reply(200, {"Key": key})
+                elif self.command == "GET":
+                    if key not in fake.objects:
+                        self.reply(404, api_error(404, "Object not found"))
+                    else:
+                        stored = fake.objects[key]
+                        self.reply(200, stored["data"], stored["content_type"])
+                elif self.command == "DELETE":
+                    for path in json.loads(body)["prefixes"]:
+                        fake.objects.pop(f"{key}/{path}", None)
+                    self.reply(200, [])
+
+            do_POST = do_GET = do_DELETE = handle_request
+
+        return Handler
+
+
+def api_error(status, message):
+    """A Storage API error body."""
+    return {"statusCode": str(status), "error": "error", "message": message}
+
+
+class ApiException(Exception):
+    def __init__(self, status):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+def use_spool_dir(test):
+    """Spool uploads into a temporary directory for the length of ``test``."""
+    spool_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+    settings_override = override_settings(UPLOAD_SPOOL_DIR=spool_dir)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return spool_dir
+
+
+PDF = b"%PDF-1.4 " + b"x" * 100
+
+
+def staff_application(**files):
+    """POST data for /apply-staff/ with ``files`` attached."""
+    return {
+        "full_name": "Ana Reyes",
+        "email": "ana@example.com",
+        "phone_number": "09171234567",
+        "study_place_name": "Reyes Reading Room",
+        "study_place_address": "Lahug, Cebu City",
+        "role_description": "Owner",
+        **files,
+    }
+
+
+def raw_cursor(json_text):
+    """A cursor holding ``json_text`` as is, e.g. "[Infinity]"."""
+    return base64.urlsafe_b64encode(json_text.encode()).decode().rstrip("=")
+
+
+LOCAL_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def breaker(threshold=3, reset=30):
+    return circuit.CircuitBreaker("test", failure_threshold=threshold, reset_timeout=reset)
+
+
+# ---------- SEARCH ----------
+
+class CatalogTestCase(TestCase):
+    """Three spots to search and filter."""
+
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="pw")
+        self.mezzanine = make_spot(
+            owner, "Mezzanine Study Hub", wifi=True, outlets=True, coffee=True
+        )
+        self.library = make_spot(
+            owner, "City Library", location="Fuente", description="Quiet tables",
+            wifi=True, ac=True,
+        )
+        self.cafe = make_spot(
+            owner, "Brew Corner", description="Coffee and a mezzanine floor", outlets=True
+        )
+
+    def results(self, q="", amenity_keys=()):
+        return list(SpotQuery(q=q, amenities=tuple(amenity_keys)).apply())
+
+
+class SearchTests(CatalogTestCase):
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.results("mezzanine"), [self.mezzanine, self.cafe])
+
+    def test_prefix_matches(self):
+        self.assertEqual(self.results("libr"), [self.library])
+
+    def test_edits_reach_the_search_index(self):
+        self.assertEqual(self.results("fuente"), [self.library])
+        self.library.location = "Banilad"
+        self.library.save()
+        self.assertEqual(self.results("fuente"), [])
+        self.assertEqual(self.results("banilad"), [self.library])
+
+
+class FuzzySearchTests(CatalogTestCase):
+    def test_typos_fall_back_to_fuzzy_matches(self):
+        self.assertIn(self.mezzanine, self.results("mezanine"))
+        self.assertIn(self.library, self.results("libary"))
+        self.assertEqual(self.results("zzzzqqq"), [])
+
+
+class AmenityFilterTests(CatalogTestCase):
+    def test_multiple_amenities_must_all_match(self):
+        self.assertCountEqual(self.results(amenity_keys=["wifi"]), [self.mezzanine, self.library])
+        self.assertEqual(self.results(amenity_keys=["wifi", "outlets"]), [self.mezzanine])
+        self.assertEqual(self.results(amenity_keys=["wifi", "outlets", "ac"]), [])
+
+    def test_amenities_narrow_a_search(self):
+        self.assertEqual(self.results("mezzanine", ["outlets", "coffee"]), [self.mezzanine])
+        self.assertEqual(self.results("mezzanine", ["ac"]), [])
+
+    def test_amenities_from_the_request(self):
+        user = User.objects.create_user("viewer", password="pw")
+        self.client.force_login(user)
+        response = self.client.get(reverse("core:home"), {"amenities": "outlets", "filter": "wifi"})
+        self.assertEqual(response.context["active_amenities"], ("wifi", "outlets"))
+        self.assertEqual(list(response.context["study_spaces"]), [self.mezzanine])
+
+
+class FacetTests(CatalogTestCase):
+    def counts(self, q="", amenity_keys=()):
+        return facets.amenity_counts(SpotQuery(q=q, amenities=tuple(amenity_keys)))
+
+    def test_counts_within_the_current_results(self):
+        counts = self.counts()
+        self.assertEqual((counts["total"], counts["wifi"], counts["outlets"], counts["ac"]), (3, 2, 2, 1))
+        counts = self.counts(amenity_keys=["wifi"])
+        self.assertEqual((counts["total"], counts["outlets"], counts["coffee"]), (2, 1, 1))
+        self.assertEqual(self.counts("library")["total"], 1)
+
+    def test_cached_until_the_catalog_changes(self):
+        self.assertEqual(self.counts()["ac"], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts()["ac"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cafe.ac = True
+            self.cafe.save()
+        self.assertEqual(self.counts()["ac"], 2)
+
+
+# ---------- PAGINATION ----------
+
+class KeysetCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="pw")
+        self.spots = [make_spot(owner, f"Spot {i}") for i in range(5)]
+        self.newest_first = sorted(self.spots, key=lambda spot: -spot.id)
+
+    def page(self, cursor, ordering=("-id",)):
+        queryset = StudySpot.objects.annotate(search_rank=Value(1.0))
+        return keyset_page(queryset, ordering, cursor, page_size=2)
+
+    def test_pages_follow_each_other(self):
+        seen = []
+        cursor = None
+        while True:
+            page = self.page(cursor)
+            seen.extend(page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.newest_first)
+
+    def test_garbage_cursors_give_the_first_page(self):
+        garbage = [
+            "",
+            "!!!",
+            "not base64 at all",
+            "e30",  # {}
+            encode_cursor(["abc"]),
+            encode_cursor([None]),
+            encode_cursor([{"id": 1}]),
+            encode_cursor([1, 2, 3]),
+        ]
+        for cursor in garbage:
+            self.assertEqual(self.page(cursor).items, self.newest_first[:2], cursor)
+
+    def test_non_finite_and_huge_numbers_give_the_first_page(self):
+        for value in ("Infinity", "-Infinity", "NaN", "1e400"):
+            cursor = raw_cursor(f"[{value}]")
+            self.assertIsNone(decode_cursor(cursor), value)
+            self.assertEqual(self.page(cursor).items, self.newest_first[:2], value)
+            self.assertEqual(
+                self.page(raw_cursor(f"[{value}, 1]"), ("-search_rank", "-id")).items,
+                self.newest_first[:2],
+                value,
+            )
+        # Out of the id column's range, but a number: every row comes before it
+        self.assertEqual(self.page(raw_cursor("[1e300]")).items, self.newest_first[:2])
+        self.assertEqual(self.page(raw_cursor("[" + "9" * 30 + "]")).items, self.newest_first[:2])
+
+    def test_views_accept_non_finite_cursors(self):
+        self.client.force_login(User.objects.create_user("viewer", password="pw"))
+        for url in (reverse("core:home"), reverse("core:home_cards")):
+            for params in ({}, {"q": "spot"}):
+                response = self.client.get(url, {"cursor": raw_cursor("[Infinity]"), **params})
+                self.assertEqual(response.status_code, 200, (url, params))
+
+    def test_cursor_for_another_ordering_gives_the_first_page(self):
+        # e.g. a search cursor (rank, id) replayed after the query was cleared
+        stale = encode_cursor([0.5, self.newest_first[1].id])
+        self.assertEqual(self.page(stale).items, self.newest_first[:2])
+
+    def test_cursor_of_a_deleted_spot_still_continues(self):
+        page = self.page(None)
+        page.items[-1].delete()
+        self.assertEqual(self.page(page.next_cursor).items, self.newest_first[2:4])
+
+    def test_views_accept_garbage_cursors(self):
+        self.client.force_login(User.objects.create_user("viewer", password="pw"))
+        for url in (reverse("core:home"), reverse("core:home_cards")):
+            for cursor in ("!!!", encode_cursor(["abc", "def"])):
+                response = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 200, (url, cursor))
+
+
+# ---------- LISTING CACHE ----------
+
+class ListingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", password="pw")
+        self.spot = make_spot(self.owner, "Cached Corner", wifi=True)
+        self.client.force_login(self.owner)
+
+    def spot_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query for query in queries if '"core_studyspot"' in query["sql"]]
+
+    def test_pages_are_cached_per_normalised_query(self):
+        for url in (reverse("core:home"), reverse("core:map_view")):
+            self.spot_queries(url, {"q": "Cached", "amenities": "wifi"})
+            response, queries = self.spot_queries(url, {"q": "cached", "amenities": "wifi"})
+            self.assertEqual(queries, [], url)
+            self.assertContains(response, "Cached Corner")
+
+    def test_spot_and_review_writes_invalidate(self):
+        url = reverse("core:home")
+        self.spot_queries(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spot.name = "Renamed Corner"
+            self.spot.save()
+        response, queries = self.spot_queries(url)
+        self.assertTrue(queries)
+        self.assertContains(response, "Renamed Corner")
+
+        version = caching.catalog_version()
+        reviewer = User.objects.create_user("reviewer", password="pw")
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(spot=self.spot, user=reviewer, rating=4)
+        self.assertNotEqual(caching.catalog_version(), version)
+        version = caching.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertNotEqual(caching.catalog_version(), version)
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_works_with_the_local_memory_cache(self):
+        url = reverse("core:home")
+        self.spot_queries(url)
+        self.assertEqual(self.spot_queries(url)[1], [])
+
+
+class CardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", password="pw")
+        self.visitor = User.objects.create_user("visitor", password="pw")
+        self.spot = make_spot(self.owner, "Card Corner")
+
+    def home(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse("core:home"))
+
+    def test_cards_come_from_the_cache_with_owner_controls_per_viewer(self):
+        self.home(self.visitor)
+        key = cards.card_key("home", self.spot)
+        self.assertIn("Card Corner", cache.get(key))
+        cache.set(key, "<article>From the cache</article><!--card:controls-->")
+
+        delete_url = reverse("core:delete_listing", args=[self.spot.id])
+        response = self.home(self.owner)
+        self.assertContains(response, "From the cache")
+        self.assertContains(response, delete_url)
+        response = self.home(self.visitor)
+        self.assertContains(response, "From the cache")
+        self.assertNotContains(response, delete_url)
+
+    def test_changed_spots_are_rendered_again(self):
+        self.home(self.visitor)
+        cache.set(cards.card_key("home", self.spot), "<article>Stale</article>")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spot.name = "Card Nook"
+            self.spot.save()
+        response = self.home(self.visitor)
+        self.assertNotContains(response, "Stale")
+        self.assertContains(response, "Card Nook")
+
+    def test_one_cache_read_per_page(self):
+        self.home(self.visitor)
+        with mock.patch.object(cards.cache, "get_many", wraps=cards.cache.get_many) as get_many:
+            self.client.get(reverse("core:map_view"))
+            self.home(self.visitor)
+        self.assertEqual(get_many.call_count, 2)
+
+
+# ---------- GEO ----------
+
+class GeoTests(SimpleTestCase):
+    def test_geohash(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_covering_cells_contain_the_box(self):
+        bbox = (10.29, 123.87, 10.34, 123.91)
+        cells = geo.covering_cells(bbox)
+        self.assertLessEqual(len(cells), geo.MAX_COVER_CELLS)
+        for lat in (10.29, 10.315, 10.34):
+            for lng in (123.87, 123.89, 123.91):
+                spot_hash = geo.encode_geohash(lat, lng)
+                self.assertTrue(any(spot_hash.startswith(cell) for cell in cells), (lat, lng))
+
+    def test_bbox_around_crosses_the_antimeridian(self):
+        south, west, north, east = geo.bbox_around(0, 179.99, 5)
+        self.assertGreater(west, east)
+        self.assertAlmostEqual(north - south, 2 * 5 / 111.195, places=3)
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("lister", password="pw")
+        self.user.userprofile.is_contributor = True
+        self.user.userprofile.save()
+        self.client.force_login(self.user)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.gazetteer = f"{directory}/places.csv"
+        with open(self.gazetteer, "w", encoding="utf-8") as handle:
+            handle.write(
+                "name,latitude,longitude\n"
+                "Lahug,10.33,123.90\nIT Park,10.33,123.905\nCebu City,10.31,123.89\n"
+            )
+
+    def create_listing(self, name, location):
+        self.client.post(reverse("core:create_listing"), {
+            "name": name, "location": location, "description": "Quiet",
+        })
+        return StudySpot.objects.get(name=name)
+
+    def geocode(self):
+        output = io.StringIO()
+        call_command("geocode_spots", "--gazetteer", self.gazetteer, stdout=output)
+        return output.getvalue()
+
+    def test_normalize_address(self):
+        self.assertEqual(
+            geocoding.normalize_address("Brgy. Lahug, Cebu City"), "barangay lahug cebu city"
+        )
+        self.assertEqual(geocoding.normalize_address("  Sto. Niño  St. "), "santo nino street")
+
+    def test_leftmost_longest_place_wins(self):
+        gazetteer = geocoding.load_gazetteer(self.gazetteer)
+        self.assertEqual(gazetteer.resolve("it park lahug cebu city"), (10.33, 123.905))
+        self.assertEqual(gazetteer.resolve("somewhere in cebu city"), (10.31, 123.89))
+        self.assertIsNone(gazetteer.resolve("mandaue"))
+
+    def test_listings_queue_addresses_and_the_command_fills_them(self):
+        spot = self.create_listing("Park Desk", "IT Park, Lahug")
+        self.assertIsNone(spot.latitude)
+        entry = GeocodeCache.objects.get()
+        self.assertEqual((entry.address, entry.status), ("it park lahug", GeocodeCache.PENDING))
+
+        version = caching.index_version()
+        output = self.geocode()
+        self.assertIn("Queue: 1 resolved, 0 not found", output)
+        self.assertIn("Spots: 1 geocoded", output)
+        spot.refresh_from_db()
+        self.assertEqual((spot.latitude, spot.longitude), (10.33, 123.905))
+        self.assertEqual(spot.geohash, geo.encode_geohash(10.33, 123.905))
+        self.assertNotEqual(caching.index_version(), version)
+
+        # Known addresses are filled in by the view; nothing is left to do
+        again = self.create_listing("Park Desk 2", "IT Park; LAHUG")
+        self.assertEqual((again.latitude, again.longitude), (10.33, 123.905))
+        self.assertIn("Queue: 0 resolved, 0 not found", self.geocode())
+
+    def test_unknown_addresses_are_retried_on_request(self):
+        spot = self.create_listing("Far Desk", "Mandaue")
+        self.assertIn("0 resolved, 1 not found", self.geocode())
+        self.assertIn("0 resolved, 0 not found", self.geocode())
+        with open(self.gazetteer, "a", encoding="utf-8") as handle:
+            handle.write("Mandaue,10.35,123.93\n")
+        output = io.StringIO()
+        call_command(
+            "geocode_spots", "--gazetteer", self.gazetteer, "--retry-not-found", stdout=output
+        )
+        self.assertIn("1 resolved, 0 not found", output.getvalue())
+        spot.refresh_from_db()
+        self.assertEqual(spot.latitude, 10.35)
+
+
+class SpotsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("mapper", password="pw")
+        self.client.force_login(owner)
+        # Due north of the origin, about 1.1 km apart
+        for number in range(5):
+            make_spot(owner, f"Spot {number}", latitude=10.30 + number * 0.01, longitude=123.89)
+        make_spot(owner, "Elsewhere", latitude=14.60, longitude=120.98)
+        make_spot(owner, "Unplaced")
+        self.url = reverse("core:spots_api")
+
+    def names(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [spot["name"] for spot in response.json()["results"]]
+
+    def test_radius_results_are_nearest_first(self):
+        response = self.client.get(self.url, {"lat": 10.323, "lng": 123.89, "radius": 2})
+        self.assertEqual(self.names(response), ["Spot 2", "Spot 3", "Spot 1", "Spot 4"])
+        distances = [spot["distance_km"] for spot in response.json()["results"]]
+        self.assertAlmostEqual(distances[0], 0.334, places=2)
+        self.assertEqual(distances, sorted(distances))
+
+    def test_radius_query_reads_only_the_page(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.url, {"lat": 10.30, "lng": 123.89, "radius": 10, "limit": 2}
+            )
+        self.assertEqual(self.names(response), ["Spot 0", "Spot 1"])
+        (spot_query,) = [query["sql"] for query in queries if '"core_studyspot"' in query["sql"]]
+        self.assertIn("LIMIT 2", spot_query)
+
+    def test_bbox(self):
+        response = self.client.get(self.url, {"bbox": "10.305,123.8,10.335,124.0"})
+        self.assertEqual(sorted(self.names(response)), ["Spot 1", "Spot 2", "Spot 3"])
+
+    def test_bad_parameters(self):
+        for params in ({}, {"lat": "nan", "lng": 123}, {"lat": 91, "lng": 0}, {"bbox": "1,2,3"}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+# ---------- INDEXES ----------
+
+class SpotIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", password="pw")
+        self.spot = make_spot(self.owner, "Atrium Study Lounge", latitude=10.3, longitude=123.9)
+        self.index = suggest.suggest_index
+        self.index.ensure_built()
+
+    def names(self, prefix):
+        return [entry["text"] for entry in self.index.suggest(prefix) if entry["type"] == "spot"]
+
+    def test_review_writes_patch_in_place(self):
+        reviewer = User.objects.create_user("reviewer", password="pw")
+        with mock.patch.object(self.index, "rebuild", wraps=self.index.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                Review.objects.create(spot=self.spot, user=reviewer, rating=5)
+            self.assertEqual(self.names("atrium"), ["Atrium Study Lounge"])
+        rebuild.assert_not_called()
+        self.assertEqual(self.index.spots[self.spot.id][2], (-5.0, -1))
+
+    def test_other_processes_writes_are_caught_up(self):
+        doomed = make_spot(self.owner, "Attic Corner")
+        # Written without signals, as another worker's writes look here
+        StudySpot.objects.filter(pk=self.spot.pk).update(
+            name="Atelier Study Lounge", updated_at=timezone.now()
+        )
+        StudySpot.objects.filter(pk=doomed.pk)._raw_delete(using="default")
+        self.assertEqual(self.names("at"), ["Atrium Study Lounge", "Attic Corner"])
+
+        with mock.patch.object(self.index, "rebuild", wraps=self.index.rebuild) as rebuild:
+            caching.bump_catalog_version()
+            self.assertEqual(self.names("at"), ["Atelier Study Lounge"])
+        rebuild.assert_not_called()
+        self.assertEqual(self.index.ids, {self.spot.id})
+
+    def test_index_version_bump_rebuilds(self):
+        with mock.patch.object(self.index, "rebuild", wraps=self.index.rebuild) as rebuild:
+            caching.bump_index_version()
+            self.assertEqual(self.names("atrium"), ["Atrium Study Lounge"])
+        rebuild.assert_called_once()
+
+    def test_clusters_follow_saved_coordinates(self):
+        cluster_index = clustering.cluster_index
+        cluster_index.ensure_built()
+        self.spot.latitude, self.spot.longitude = 10.35, 123.95
+        with mock.patch.object(cluster_index, "rebuild", wraps=cluster_index.rebuild) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.spot.save()
+            cluster_index.ensure_built()
+        rebuild.assert_not_called()
+        self.assertEqual(cluster_index.spots[self.spot.id][:2], (10.35, 123.95))
+        cells = cluster_index.levels[clustering.MAX_ZOOM]
+        self.assertEqual(
+            cells[clustering.cell_for(10.35, 123.95, clustering.MAX_ZOOM)][0], 1
+        )
+        self.assertNotIn(clustering.cell_for(10.3, 123.9, clustering.MAX_ZOOM), cells)
+
+
+class NearbyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", password="pw")
+        self.library = make_spot(self.owner, "Library", latitude=10.300, longitude=123.900, wifi=True)
+        self.cafe = make_spot(self.owner, "Cafe", latitude=10.310, longitude=123.900)
+        self.hub = make_spot(self.owner, "Hub", latitude=10.330, longitude=123.900, wifi=True)
+        make_spot(self.owner, "Unplaced")
+        self.index = nearby.nearby_index
+
+    def test_tree_matches_a_full_scan(self):
+        rng = np.random.default_rng(7)
+        latitudes = rng.uniform(9.5, 11.0, 2000)
+        longitudes = rng.uniform(123.0, 124.5, 2000)
+        masks = rng.integers(0, 4, 2000)
+        tree = nearby.KDTree(list(range(2000)), latitudes, longitudes, masks)
+        distances = nearby.haversine_km(10.3, 123.9, latitudes, longitudes)
+        for required in (0, 1, 3):
+            best = tree.search(nearby.to_unit_vectors([10.3], [123.9])[0], 10, required)
+            expected = [i for i in np.argsort(distances) if masks[i] & required == required][:10]
+            found = [int(tree.ids[position]) for _, position in sorted(best, reverse=True)]
+            self.assertEqual(found, expected, required)
+
+    def test_nearest_with_amenities_and_radius(self):
+        hits = self.index.nearest(10.301, 123.900, k=2)
+        self.assertEqual([spot_id for spot_id, _ in hits], [self.library.id, self.cafe.id])
+        self.assertAlmostEqual(hits[0][1], 0.111, places=2)
+        hits = self.index.nearest(10.301, 123.900, k=5, amenity_keys=["wifi"])
+        self.assertEqual([spot_id for spot_id, _ in hits], [self.library.id, self.hub.id])
+        hits = self.index.nearest(10.301, 123.900, k=5, radius_km=2)
+        self.assertEqual([spot_id for spot_id, _ in hits], [self.library.id, self.cafe.id])
+
+    def test_saves_and_deletes_patch_the_tree(self):
+        with mock.patch("core.nearby.REBUILD_MIN", 0):
+            self.index.nearest(10.3, 123.9)  # built and put in the tree
+            self.assertEqual(self.index.tree.size, 3)
+            with mock.patch.object(self.index, "rebuild", wraps=self.index.rebuild) as rebuild:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.hub.latitude = 10.3001
+                    self.hub.save()
+                    self.library.delete()
+                hits = self.index.nearest(10.3, 123.9, k=2)
+            rebuild.assert_not_called()
+        self.assertEqual([spot_id for spot_id, _ in hits], [self.hub.id, self.cafe.id])
+
+    def test_api(self):
+        self.client.force_login(self.owner)
+        url = reverse("core:nearby_api")
+        response = self.client.get(url, {"lat": 10.301, "lng": 123.9, "k": 1, "amenities": "wifi"})
+        self.assertEqual(
+            [(spot["name"], spot["distance_km"]) for spot in response.json()["results"]],
+            [("Library", 0.111)],
+        )
+        self.assertEqual(self.client.get(url, {"lat": 100, "lng": 0}).status_code, 400)
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="pw")
+        self.park = make_spot(
+            owner, "Park Study Hall", location="IT Park, Cebu City",
+            average_rating=Decimal("4.5"), rating_count=10,
+        )
+        self.cafe = make_spot(
+            owner, "Parkside Cafe", location="IT Park, Cebu City",
+            average_rating=Decimal("4.5"), rating_count=30,
+        )
+        self.loft = make_spot(
+            owner, "The Reading Loft", location="Lahug",
+            average_rating=Decimal("3.0"), rating_count=2,
+        )
+
+    def texts(self, prefix, limit=suggest.DEFAULT_LIMIT):
+        return [(item["type"], item["text"]) for item in suggest.suggest_index.suggest(prefix, limit)]
+
+    def test_ranked_by_rating_then_reviews(self):
+        expected = [
+            ("spot", "Parkside Cafe"),
+            ("location", "IT Park, Cebu City"),
+            ("spot", "Park Study Hall"),
+        ]
+        self.assertEqual(self.texts("par"), expected)
+        with mock.patch("core.suggest.SCAN_LIMIT", 0):  # walk spots in rank order
+            suggest.suggest_index.results.clear()
+            self.assertEqual(self.texts("par"), expected)
+        self.assertEqual(self.texts("par", limit=1), expected[:1])
+
+    def test_matches_start_at_any_word(self):
+        self.assertEqual(self.texts("read"), [("spot", "The Reading Loft")])
+        self.assertEqual(self.texts("cebu ci"), [("location", "IT Park, Cebu City")])
+        self.assertEqual(self.texts("ading"), [])
+        self.assertEqual(self.texts("  "), [])
+
+    def test_saves_patch_the_index(self):
+        self.assertEqual(self.texts("loft"), [("spot", "The Reading Loft")])
+        self.loft.name = "The Reading Attic"
+        self.loft.save()
+        self.assertEqual(self.texts("loft"), [])
+        self.assertEqual(self.texts("attic"), [("spot", "The Reading Attic")])
+
+    def test_api_runs_no_queries(self):
+        self.client.force_login(User.objects.get(username="owner"))
+        url = reverse("core:suggest_api")
+        self.client.get(url, {"prefix": "lah"})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"prefix": "the"})
+        (item,) = response.json()["results"]
+        self.assertEqual(item["url"], reverse("core:studyspot_detail", args=[self.loft.id]))
+
+
+# ---------- RATINGS ----------
+
+class RatingCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("owner", password="pw")
+        self.spot = make_spot(self.owner, "Counter Cafe")
+        self.users = [User.objects.create_user(f"reviewer{i}", password="pw") for i in range(4)]
+
+    def review(self, user, rating):
+        return Review.objects.create(spot=self.spot, user=user, rating=rating)
+
+    def assertCounters(self, histogram):
+        """The spot's counters match ``histogram`` and reconcile_ratings agrees."""
+        self.spot.refresh_from_db()
+        expected = ratings.counters_for(histogram)
+        for field, value in expected.items():
+            if field == "average_rating":
+                value = Decimal(str(value)).quantize(Decimal("0.01"))
+            self.assertEqual(getattr(self.spot, field), value, field)
+        self.assertEqual(
+            ratings.actual_counters([self.spot.id]).get(self.spot.id, ratings.counters_for({})),
+            expected,
+        )
+        out = io.StringIO()
+        call_command("reconcile_ratings", "--dry-run", stdout=out)
+        self.assertIn("0 with drift", out.getvalue())
+
+    def test_create(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        self.review(self.users[2], 4)
+        self.assertCounters({5: 1, 4: 2})
+        self.assertEqual(self.spot.average_rating, Decimal("4.33"))
+
+    def test_edit(self):
+        review = self.review(self.users[0], 2)
+        self.review(self.users[1], 5)
+        review.rating = 3
+        review.save()
+        self.assertCounters({3: 1, 5: 1})
+
+        # Loaded without its rating: the old value is looked up
+        partial = Review.objects.only("id", "spot").get(pk=review.pk)
+        partial.rating = 1
+        partial.save()
+        self.assertCounters({1: 1, 5: 1})
+
+    def test_edit_moving_to_another_spot(self):
+        review = self.review(self.users[0], 4)
+        other = make_spot(self.owner, "Other Cafe")
+        review.spot = other
+        review.save()
+        self.assertCounters({})
+        other.refresh_from_db()
+        self.assertEqual((other.rating_count, other.rating_4_count), (1, 1))
+
+    def test_delete(self):
+        review = self.review(self.users[0], 1)
+        self.review(self.users[1], 5)
+        review.delete()
+        self.assertCounters({5: 1})
+
+    def test_queryset_delete(self):
+        for user, rating in zip(self.users, (1, 2, 2, 5)):
+            self.review(user, rating)
+        Review.objects.filter(rating__lte=2).delete()
+        self.assertCounters({5: 1})
+        Review.objects.all().delete()
+        self.assertCounters({})
+        self.assertEqual(self.spot.average_rating, 0)
+
+    def test_reconcile_fixes_drift(self):
+        self.review(self.users[0], 3)
+        StudySpot.objects.filter(pk=self.spot.pk).update(rating_count=7, rating_5_count=2)
+        out = io.StringIO()
+        call_command("reconcile_ratings", stdout=out)
+        self.assertIn("1 with drift (fixed)", out.getvalue())
+        self.assertCounters({3: 1})
+
+
+class RatingHistogramTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="pw")
+        self.spot = make_spot(owner, "Histogram Hall")
+        for i, rating in enumerate((5, 5, 4, 1)):
+            reviewer = User.objects.create_user(f"reviewer{i}", password="pw")
+            Review.objects.create(spot=self.spot, user=reviewer, rating=rating)
+        self.client.force_login(owner)
+
+    def test_histogram_from_the_counters(self):
+        self.spot.refresh_from_db()
+        self.assertEqual(
+            self.spot.rating_histogram,
+            [(5, 2, 50), (4, 1, 25), (3, 0, 0), (2, 0, 0), (1, 1, 25)],
+        )
+
+    def test_counters_roll_back_with_the_review(self):
+        reviewer = User.objects.create_user("late", password="pw")
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Review.objects.create(spot=self.spot, user=reviewer, rating=3)
+                self.spot.refresh_from_db()
+                self.assertEqual((self.spot.rating_count, self.spot.rating_3_count), (5, 1))
+                raise RuntimeError
+        self.spot.refresh_from_db()
+        self.assertEqual((self.spot.rating_count, self.spot.rating_3_count), (4, 0))
+
+    def test_api_reads_no_reviews(self):
+        url = reverse("core:spot_ratings_api", args=[self.spot.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.json(), {
+            "id": self.spot.id,
+            "average": 3.75,
+            "count": 4,
+            "histogram": {"1": 1, "2": 0, "3": 0, "4": 1, "5": 2},
+        })
+        self.assertFalse([query for query in queries if '"core_review"' in query["sql"]])
+
+    def test_detail_page_shows_the_breakdown(self):
+        response = self.client.get(reverse("core:studyspot_detail", args=[self.spot.id]))
+        self.assertContains(response, "4 reviews")
+        self.assertContains(response, 'style="width: 50%"')
+
+
+# ---------- IMPORT ----------
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("importer", password="pw")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def run_import(self, kind, name, content, *args):
+        path = f"{self.directory}/{name}"
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(content)
+        output = io.StringIO()
+        call_command("import_catalog", kind, path, *args, stdout=output, stderr=io.StringIO())
+        return output.getvalue()
+
+    def test_csv_spots(self):
+        output = self.run_import(
+            "spots", "spots.csv",
+            "name,location,latitude,longitude,wifi\n"
+            "Quiet Corner , IT Park,10.33,123.90,yes\n"
+            "No Location,,,,\n"
+            "Far Away,Nowhere,95,0,\n",
+            "--owner", "importer",
+        )
+        self.assertIn("Imported 1 spots, skipped 2", output)
+        spot = StudySpot.objects.get()
+        self.assertEqual((spot.name, spot.owner, spot.wifi), ("Quiet Corner", self.owner, True))
+        self.assertEqual(spot.geohash, geo.encode_geohash(10.33, 123.90))
+
+    def test_malformed_jsonl_rows_are_skipped(self):
+        rows = [
+            {"name": "Good", "location": "Lahug", "owner": "importer"},
+            {"name": 7, "location": "Banilad", "owner": "importer"},
+            {"name": ["Listed"], "location": "Lahug", "owner": "importer"},
+            {"name": "Mapped", "location": {"city": "Cebu"}, "owner": "importer"},
+            {"name": "Lost", "location": "Lahug", "owner": ["importer"]},
+            {"name": "Pinned", "location": "Lahug", "owner": "importer", "latitude": [10.3]},
+            {"name": "Numbered", "location": "Lahug", "owner": "importer", "id": {"n": 1}},
+        ]
+        content = "\n".join(json.dumps(row) for row in rows) + "\n[1, 2]\nnot json\n"
+        output = self.run_import("spots", "spots.jsonl", content)
+        self.assertIn("Imported 2 spots, skipped 7", output)
+        self.assertEqual(sorted(StudySpot.objects.values_list("name", flat=True)), ["7", "Good"])
+
+    def test_reviews_recount_ratings(self):
+        spot = make_spot(self.owner, "Reviewed")
+        User.objects.create_user("ana", password="pw")
+        rows = [
+            {"spot": spot.id, "user": "ana", "rating": 4, "comment": " Quiet "},
+            {"spot": spot.id, "user": "ana", "rating": 2},  # one review per user
+            {"spot": spot.id, "user": "ben", "rating": 5},
+            {"spot": spot.id, "user": "cy", "rating": 9},
+            {"spot": spot.id, "user": ["ana"], "rating": 3},
+            {"spot": spot.id, "user": "dee", "rating": 3, "comment": ["x"]},
+        ]
+        content = "\n".join(json.dumps(row) for row in rows)
+        output = self.run_import("reviews", "reviews.jsonl", content, "--create-users")
+        self.assertIn("Imported 2 reviews, skipped 4", output)
+        self.assertEqual(Review.objects.get(user__username="ana").comment, "Quiet")
+        spot.refresh_from_db()
+        self.assertEqual((spot.rating_count, spot.average_rating), (2, Decimal("4.5")))
+        self.assertTrue(User.objects.get(username="ben").userprofile)
+
+
+# ---------- TRENDING ----------
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="pw")
+        self.hot = make_spot(owner, "Hot")
+        self.stale = make_spot(owner, "Stale")
+        self.mild = make_spot(owner, "Mild")
+        self.reviewers = [User.objects.create_user(f"r{i}", password="pw") for i in range(3)]
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review(self.hot, 0, 5, now)
+            self.review(self.stale, 0, 5, now - timedelta(days=8))
+            self.review(self.mild, 0, 3, now)
+
+    def review(self, spot, reviewer, rating, created_at):
+        Review.objects.create(
+            spot=spot, user=self.reviewers[reviewer], rating=rating, created_at=created_at
+        )
+
+    def update(self):
+        output = io.StringIO()
+        call_command("update_trending", stdout=output)
+        return output.getvalue()
+
+    def trending(self):
+        return set(StudySpot.objects.filter(is_trending=True).values_list("name", flat=True))
+
+    def test_scores_decay_by_half_every_half_life(self):
+        epoch = timezone.now()
+        stored = trending.stored_contribution(5, epoch + timedelta(days=3), epoch)
+        later = epoch + timedelta(days=3 + trending.HALF_LIFE_DAYS)
+        self.assertAlmostEqual(trending.current_score(stored, epoch, later), 1.0)
+
+    def test_only_changed_spots_are_rescored(self):
+        self.assertIn("Rescored 3 spots", self.update())
+        self.assertEqual(self.trending(), {"Hot"})
+        scores = dict(StudySpot.objects.values_list("name", "trending_score"))
+        self.assertGreater(scores["Hot"], scores["Mild"])
+        self.assertGreater(scores["Mild"], scores["Stale"])
+
+        # As if the reviews were written well before the last run
+        StudySpot.objects.update(reviews_changed_at=timezone.now() - timedelta(hours=1))
+        self.assertIn("Rescored 0 spots", self.update())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review(self.mild, 1, 5, timezone.now())
+        self.assertIn("Rescored 1 spots", self.update())
+        self.assertEqual(self.trending(), {"Hot", "Mild"})
+
+    def test_rebasing_keeps_the_order(self):
+        self.update()
+        # The same scores, stored against an epoch long past
+        state = TrendingState.load()
+        old_epoch = state.epoch - trending.REBASE_AFTER * 2
+        factor = trending.growth(old_epoch, state.epoch)
+        StudySpot.objects.update(trending_score=F("trending_score") * factor)
+        state.epoch = old_epoch
+        state.save()
+
+        self.assertIn("Rebased", self.update())
+        self.assertEqual(self.trending(), {"Hot"})
+        self.assertAlmostEqual(StudySpot.objects.get(name="Hot").trending_score, 2.0, places=3)
+
+
+# ---------- IMAGES ----------
+
+def photo(width=1200, height=600, orientation=None):
+    """JPEG bytes, with EXIF (camera make and ``orientation``) if given."""
+    options = {}
+    if orientation:
+        exif = Image.Exif()
+        exif[0x010F] = "Phone"
+        exif[0x0112] = orientation
+        options["exif"] = exif
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "teal").save(out, "JPEG", **options)
+    return out.getvalue()
+
+
+class InlineExecutor:
+    """Stands in for ProcessPoolExecutor: runs the calls in this process."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables, chunksize=1):
+        return map(fn, *iterables)
+
+
+class ImageVariantTests(SimpleTestCase):
+    def test_variants_are_upright_resized_and_metadata_free(self):
+        variants = images.build_variants(photo(orientation=6), "spots/7/abc.jpg")
+        sizes = {(variant["name"], variant["format"]): variant for variant in variants}
+        # Turned upright (600x1200); hero would upscale, so card covers it
+        self.assertEqual(
+            {(name, variant["width"], variant["height"]) for (name, _), variant in sizes.items()},
+            {("preview", 320, 640), ("card", 600, 1200)},
+        )
+        self.assertEqual({fmt for _, fmt in sizes}, set(images.available_formats()))
+        card = sizes[("card", "webp")]
+        self.assertEqual((card["path"], card["content_type"]), ("spots/7/abc-card.webp", "image/webp"))
+        self.assertFalse(Image.open(io.BytesIO(card["data"])).getexif())
+
+    def test_strip_metadata(self):
+        data, content_type = images.strip_metadata(photo(orientation=6))
+        self.assertEqual(content_type, "image/jpeg")
+        stripped = Image.open(io.BytesIO(data))
+        self.assertEqual((stripped.size, dict(stripped.getexif())), ((600, 1200), {}))
+        self.assertIsNone(images.strip_metadata(photo()))
+        with self.assertRaises(images.ImageProcessingError):
+            images.strip_metadata(b"not an image")
+
+    def test_stored_variants_and_picture_tag(self):
+        backend = StubBackend()
+        source = "https://storage.test/study_spots/spots/7/abc.jpg"
+        manifest = images.store_variants(
+            backend, "study_spots", "spots/7/abc.jpg", photo(500, 250), source
+        )
+        self.assertIn(("study_spots", "spots/7/abc-preview.webp"), backend.objects)
+        self.assertIs(manifest["variants"]["hero"], manifest["variants"]["card"])
+
+        spot = StudySpot(name="Pictured", image_url=source, image_variants=manifest)
+        html = spot_picture(spot, "card", sizes="300px")
+        self.assertIn(
+            'srcset="https://storage.test/study_spots/spots/7/abc-preview.webp 320w, '
+            'https://storage.test/study_spots/spots/7/abc-card.webp 500w"',
+            html,
+        )
+        self.assertIn('width="500" height="250"', html)
+        # A manifest for an older image is ignored
+        spot.image_url = "https://storage.test/study_spots/spots/7/new.jpg"
+        self.assertTrue(spot_picture(spot, "card").startswith("<img "))
+
+
+class BuildImageVariantsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(STORAGE_BACKEND="local", LOCAL_STORAGE_ROOT=Path(root))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch("core.storage._storage", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.storage = storage.get_storage()
+        self.data = photo(orientation=6)
+        self.storage.upload("study_spots", "spots/1/main.jpg", self.data, "image/jpeg")
+        owner = User.objects.create_user("owner", password="pw")
+        self.spot = make_spot(
+            owner, "Old Photo", image_url=self.storage.public_url("study_spots", "spots/1/main.jpg")
+        )
+
+    def run_command(self, *args):
+        output = io.StringIO()
+        with mock.patch(
+            "core.management.commands.build_image_variants.ProcessPoolExecutor", InlineExecutor
+        ):
+            call_command("build_image_variants", *args, stdout=output)
+        return output.getvalue()
+
+    def test_backfill_moves_old_images_to_hashed_paths(self):
+        self.assertIn("Built variants for 1 images, 0 failed", self.run_command())
+        self.spot.refresh_from_db()
+        bucket, path, _ = self.storage.locate(self.spot.image_url)
+        data = self.storage.download(bucket, path)
+        self.assertEqual(path, f"spots/1/{hashlib.sha256(data).hexdigest()}.jpg")
+        self.assertFalse(Image.open(io.BytesIO(data)).getexif())
+        self.assertEqual(images.current_variants(self.spot)["card"]["width"], 600)
+        self.assertTrue(StoredObject.objects.filter(path=path).exists())
+
+        # Done images are left alone
+        self.assertIn("0 images to process", self.run_command())
+
+
+# ---------- SPOT DETAIL ----------
+
+class StudySpotDetailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user("owner", password="pw")
+        self.spot = make_spot(owner, "Review Cafe")
+        self.user = User.objects.create_user("reviewer", password="pw")
+        self.client.force_login(self.user)
+        self.url = reverse("core:studyspot_detail", args=[self.spot.id])
+
+    def test_second_review_is_refused(self):
+        response = self.client.post(self.url, {"rating": 4, "comment": "Nice"})
+        self.assertRedirects(response, self.url)
+
+        response = self.client.post(self.url, {"rating": 1, "comment": "Again"})
+        self.assertEqual(response.status_code, 200)
+        messages = [str(message) for message in response.context["messages"]]
+        self.assertIn("You have already submitted a review for this spot.", messages)
+
+        self.assertEqual(Review.objects.filter(spot=self.spot).count(), 1)
+        self.spot.refresh_from_db()
+        self.assertEqual((self.spot.rating_count, self.spot.rating_sum), (1, 4))
+        self.assertEqual(self.spot.rating_4_count, 1)
+        self.assertEqual(self.spot.rating_1_count, 0)
+
+    def test_anonymous_users_cannot_review(self):
+        self.client.logout()
+        response = self.client.post(self.url, {"rating": 5})
+        self.assertRedirects(response, reverse("core:login"), fetch_redirect_response=False)
+        self.assertFalse(Review.objects.exists())
+
+    def test_review_views_accept_garbage_cursors(self):
+        Review.objects.create(spot=self.spot, user=self.user, rating=4)
+        for url in (self.url, reverse("core:studyspot_reviews", args=[self.spot.id])):
+            for cursor in ("!!!", encode_cursor(["abc", "def"])):
+                response = self.client.get(url, {"cursor": cursor})
+                self.assertEqual(response.status_code, 200, (url, cursor))
+
+
+# ---------- IDENTITY ----------
+
+class IdentityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("reader", password="pw")
+        self.client.force_login(self.user)
+
+    def identity_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return [
+            query["sql"] for query in queries
+            if '"auth_user"' in query["sql"] or '"core_userprofile"' in query["sql"]
+        ]
+
+    def test_user_and_profile_come_from_the_cache(self):
+        self.identity_queries(reverse("core:home"))
+        self.assertIsNotNone(cache.get(identity.identity_key(self.user.pk)))
+        self.assertEqual(self.identity_queries(reverse("core:home")), [])
+        self.assertEqual(self.identity_queries(reverse("core:profile")), [])
+
+    def test_saves_drop_the_cached_copy(self):
+        self.identity_queries(reverse("core:home"))
+        self.user.userprofile.save()
+        self.assertIsNone(cache.get(identity.identity_key(self.user.pk)))
+
+        self.identity_queries(reverse("core:home"))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(cache.get(identity.identity_key(self.user.pk)))
+        # Loaded afresh, the inactive user is logged out
+        response = self.client.get(reverse("core:home"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_a_changed_password_ends_other_sessions(self):
+        self.identity_queries(reverse("core:home"))
+        User.objects.filter(pk=self.user.pk).update(password="changed")  # no signal
+        cache.set(
+            identity.identity_key(self.user.pk),
+            User.objects.select_related("userprofile").get(pk=self.user.pk),
+        )
+        response = self.client.get(reverse("core:home"))
+        self.assertEqual(response.status_code, 302)
+
+
+class SharedCacheTests(SimpleTestCase):
+    def test_file_cache_is_the_default(self):
+        self.assertTrue(caching.cache_is_shared())
+        self.assertEqual(checks.check_shared_cache(None), [])
+
+    @override_settings(CACHES=LOCAL_CACHE)
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual([error.id for error in checks.check_shared_cache(None)], ["core.W001"])
+        with self.assertRaises(MiddlewareNotUsed):
+            identity.IdentityMiddleware(lambda request: None)
+
+
+# ---------- STORAGE ----------
+
+class StorageBackendTests(SimpleTestCase):
+    def test_supabase_client_is_created_lazily_once(self):
+        backend = SupabaseStorage(url="http://127.0.0.1:9", key="test-key")
+        self.assertIsNone(backend._client)
+        clients = []
+        with mock.patch("supabase.create_client", side_effect=lambda *args, **kwargs: object()) as create:
+            threads = [
+                threading.Thread(target=lambda: clients.append(backend.client)) for _ in range(8)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(len({id(client) for client in clients}), 1)
+
+    def test_missing_credentials_only_fail_calls(self):
+        with mock.patch.dict("os.environ", {"SUPABASE_URL": "", "SUPABASE_KEY": ""}):
+            backend = SupabaseStorage()
+        with self.assertRaises(StorageError) as raised:
+            backend.download("media", "a.txt")
+        self.assertFalse(raised.exception.transient)
+
+    def test_supabase_public_urls_are_memoized(self):
+        backend = SupabaseStorage(url="https://project.supabase.co", key="test-key")
+        url = "https://project.supabase.co/storage/v1/object/public/media/spots/1/a.webp"
+        self.assertEqual(backend.public_url("media", "spots/1/a.webp"), url)
+        with mock.patch.object(backend, "_client") as client:
+            self.assertEqual(backend.public_url("media", "spots/1/a.webp"), url)
+        client.storage.from_.assert_not_called()
+        self.assertEqual(
+            backend.locate(url + "?width=300"), ("media", "spots/1/a.webp", "?width=300")
+        )
+        self.assertIsNone(backend.locate("https://elsewhere.test/media/a.webp"))
+
+    def test_local_storage(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        backend = storage.LocalStorage(root=root, base_url="/media/storage")
+        backend.upload("media", "spots/1/a.txt", io.BytesIO(b"streamed"), "text/plain")
+        self.assertEqual(backend.download("media", "spots/1/a.txt"), b"streamed")
+        url = backend.public_url("media", "spots/1/a.txt")
+        self.assertEqual(url, "/media/storage/media/spots/1/a.txt")
+        self.assertEqual(backend.locate(url), ("media", "spots/1/a.txt", ""))
+
+        backend.delete("media", ["spots/1/a.txt", "missing.txt"])
+        with self.assertRaises(StorageError) as raised:
+            backend.download("media", "spots/1/a.txt")
+        self.assertFalse(raised.exception.transient)
+        with self.assertRaises(StorageError) as raised:
+            backend.upload("media", "../../escape.txt", b"x", "text/plain")
+        self.assertFalse(raised.exception.transient)
+
+    @override_settings(STORAGE_BACKEND="local")
+    def test_get_storage_is_one_resilient_backend(self):
+        with mock.patch("core.storage._storage", None):
+            first = storage.get_storage()
+            self.assertIs(storage.get_storage(), first)
+        self.assertIsInstance(first, ResilientStorage)
+        self.assertIsInstance(first.backend, storage.LocalStorage)
+        self.assertIsInstance(
+            storage.create_storage("core.storage.SupabaseStorage"), SupabaseStorage
+        )
+
+
+class ApiErrorTests(SimpleTestCase):
+    def test_client_errors_are_not_transient(self):
+        for status in (400, 401, 403, 404, 409, 413):
+            self.assertFalse(_api_error("Upload failed", ApiException(status)).transient, status)
+
+    def test_server_errors_timeouts_and_rate_limits_are_transient(self):
+        for status in (500, 502, 503, 504, 408, 429):
+            self.assertTrue(_api_error("Upload failed", ApiException(status)).transient, status)
+
+    def test_errors_without_a_status_are_transient(self):
+        self.assertTrue(_api_error("Upload failed", ConnectionError("reset")).transient)
+        self.assertTrue(_api_error("Upload failed", ApiException("not a number")).transient)
+
+
+class SupabaseStorageTests(SimpleTestCase):
+    """SupabaseStorage and ResilientStorage against a local HTTP server."""
+
+    def setUp(self):
+        cache.clear()
+        self.server = FakeStorageServer()
+        self.addCleanup(self.server.stop)
+        self.backend = SupabaseStorage(url=self.server.url, key="test-key")
+
+    def resilient(self, threshold=3):
+        return ResilientStorage(self.backend, breaker(threshold=threshold), retries=2, backoff=0)
+
+    def assert_fails(self, call, transient):
+        with self.assertRaises(StorageError) as raised:
+            call()
+        self.assertIs(raised.exception.transient, transient, raised.exception)
+        return raised.exception
+
+    def test_round_trip(self):
+        storage = self.resilient()
+        storage.upload("media", "spots/a.webp", b"image", "image/webp", immutable=True)
+        stored = self.server.objects["media/spots/a.webp"]
+        self.assertEqual(stored["data"], b"image")
+        self.assertEqual(stored["content_type"], "image/webp")
+        self.assertEqual(stored["cache_control"], "max-age=31536000")
+        self.assertEqual(storage.download("media", "spots/a.webp"), b"image")
+
+        storage.delete("media", ["spots/a.webp"])
+        self.assertEqual(self.server.objects, {})
+        self.assert_fails(lambda: storage.download("media", "spots/a.webp"), transient=False)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.status = 403
+        test_breaker = breaker(threshold=1)
+        storage = ResilientStorage(self.backend, test_breaker, retries=2, backoff=0)
+        self.assert_fails(lambda: storage.upload("media", "a.txt", b"a", "text/plain"), transient=False)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(test_breaker.state, circuit.CLOSED)
+
+    def test_server_errors_are_retried_until_the_circuit_opens(self):
+        self.server.status = 503
+        storage = self.resilient(threshold=3)
+        self.assert_fails(lambda: storage.download("media", "a.txt"), transient=True)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(storage.breaker.state, circuit.OPEN)
+
+        with self.assertRaises(StorageUnavailable):
+            storage.download("media", "a.txt")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertFalse(storage.available())
+
+    def test_error_pages_keep_their_status(self):
+        self.server.json_errors = False
+        self.server.status = 404
+        self.assert_fails(lambda: self.backend.download("media", "a.txt"), transient=False)
+        self.server.status = 502
+        self.assert_fails(lambda: self.backend.download("media", "a.txt"), transient=True)
+
+    def test_timeouts_are_transient(self):
+        self.server.delay = 0.5
+        with mock.patch("core.storage.HTTP_READ_TIMEOUT", 0.05):
+            started = time.monotonic()
+            self.assert_fails(lambda: self.backend.download("media", "a.txt"), transient=True)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_dropped_connections_are_transient(self):
+        self.server.drop = True
+        self.assert_fails(lambda: self.backend.delete("media", ["a.txt"]), transient=True)
+
+    def test_refused_connections_are_transient(self):
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+        backend = SupabaseStorage(url=f"http://127.0.0.1:{port}", key="test-key")
+        storage = ResilientStorage(backend, breaker(threshold=3), retries=2, backoff=0)
+        self.assert_fails(lambda: storage.upload("media", "a.txt", b"a", "text/plain"), transient=True)
+        with self.assertRaises(StorageUnavailable):
+            storage.upload("media", "a.txt", b"a", "text/plain")
+
+
+class ResilientStorageTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_transient_failures_are_retried(self):
+        backend = StubBackend([StorageError("503"), StorageError("503")])
+        storage = ResilientStorage(backend, breaker(), retries=2, backoff=0)
+        storage.upload("b", "a.txt", b"data", "text/plain")
+        self.assertEqual(len(backend.calls), 3)
+        self.assertEqual(backend.objects[("b", "a.txt")], b"data")
+
+    def test_gives_up_after_the_retries(self):
+        backend = StubBackend([StorageError("503")] * 5)
+        storage = ResilientStorage(backend, breaker(threshold=10), retries=2, backoff=0)
+        with self.assertRaises(StorageError):
+            storage.download("b", "a.txt")
+        self.assertEqual(len(backend.calls), 3)
+
+    def test_non_transient_failures_are_not_retried(self):
+        backend = StubBackend([StorageError("404", transient=False)])
+        test_breaker = breaker(threshold=1)
+        storage = ResilientStorage(backend, test_breaker, retries=2, backoff=0)
+        with self.assertRaises(StorageError):
+            storage.download("b", "a.txt")
+        self.assertEqual(len(backend.calls), 1)
+        # Storage answered, so it doesn't count against the circuit
+        self.assertEqual(test_breaker.state, circuit.CLOSED)
+
+    def test_retried_file_uploads_start_from_the_same_offset(self):
+        backend = StubBackend([StorageError("503")])
+        storage = ResilientStorage(backend, breaker(), retries=1, backoff=0)
+        data = io.BytesIO(b"headerbody")
+        data.seek(6)
+        storage.upload("b", "a.txt", data, "text/plain")
+        self.assertEqual([call[2] for call in backend.calls], [b"body", b"body"])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch("core.circuit.time")
+        self.clock = patcher.start()
+        self.clock.monotonic.return_value = 1000.0
+        self.clock.time.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_threshold_failures(self):
+        backend = StubBackend([StorageError("503")] * 3)
+        test_breaker = breaker(threshold=3)
+        storage = ResilientStorage(backend, test_breaker, retries=2, backoff=0)
+        with self.assertRaises(StorageError):
+            storage.download("b", "a.txt")
+        self.assertEqual(test_breaker.state, circuit.OPEN)
+        self.assertEqual(circuit.published("test")["state"], circuit.OPEN)
+
+        # Refused without calling the backend
+        with self.assertRaises(StorageUnavailable):
+            storage.download("b", "a.txt")
+        self.assertEqual(len(backend.calls), 3)
+        self.assertFalse(storage.available())
+
+    def test_half_open_trial_closes_the_circuit(self):
+        backend = StubBackend([StorageError("503")] * 3)
+        test_breaker = breaker(threshold=3, reset=30)
+        storage = ResilientStorage(backend, test_breaker, retries=2, backoff=0)
+        with self.assertRaises(StorageError):
+            storage.delete("b", ["a.txt"])
+
+        self.clock.monotonic.return_value = 1029.0
+        self.assertFalse(test_breaker.allow())
+        self.clock.monotonic.return_value = 1030.0
+        self.assertTrue(storage.available())
+        self.assertTrue(test_breaker.allow())
+        self.assertEqual(test_breaker.state, circuit.HALF_OPEN)
+        # Only one trial at a time
+        self.assertFalse(test_breaker.allow())
+
+        test_breaker.record_success()
+        self.assertEqual(test_breaker.state, circuit.CLOSED)
+        self.assertEqual(test_breaker.failures, 0)
+        self.assertEqual(circuit.published("test")["state"], circuit.CLOSED)
+
+    def test_failed_trial_reopens_the_circuit(self):
+        test_breaker = breaker(threshold=3, reset=30)
+        for _ in range(3):
+            test_breaker.record_failure()
+        self.clock.monotonic.return_value = 1030.0
+        self.assertTrue(test_breaker.allow())
+        test_breaker.record_failure()
+        self.assertEqual(test_breaker.state, circuit.OPEN)
+        self.assertEqual(test_breaker.retry_in(), 30)
+
+    def test_steady_state_is_republished(self):
+        test_breaker = breaker()
+        storage = ResilientStorage(StubBackend(), test_breaker, backoff=0)
+        self.assertTrue(storage.available())
+        self.assertEqual(circuit.published("test")["state"], circuit.CLOSED)
+
+        # The entry expired; a closed breaker has no transition to publish
+        cache.delete(circuit.state_key("test"))
+        self.clock.monotonic.return_value = 1000 + circuit.PUBLISH_INTERVAL - 1
+        test_breaker.record_success()
+        self.assertIsNone(circuit.published("test"))
+        self.clock.monotonic.return_value = 1000 + circuit.PUBLISH_INTERVAL
+        self.assertTrue(storage.available())
+        self.assertEqual(circuit.published("test")["state"], circuit.CLOSED)
+
+    def test_cache_is_written_outside_the_lock(self):
+        test_breaker = breaker(threshold=1)
+        held = []
+        with mock.patch("core.circuit.cache") as fake_cache:
+            fake_cache.set.side_effect = lambda *args: held.append(test_breaker._lock.locked())
+            test_breaker.record_failure()
+            test_breaker.allow()
+            test_breaker.record_success()
+        self.assertEqual(held, [False, False])
+
+
+class ProcessBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_spool_dir(self)
+
+        owner = User.objects.create_user("owner", password="pw")
+        self.spot = StudySpot.objects.create(
+            name="Spool Cafe", location="Lahug", description="Quiet", owner=owner
+        )
+        document = SimpleUploadedFile("doc.pdf", b"%PDF-1.4 test", content_type="application/pdf")
+        self.upload = uploads.spool(document, "study_spots", f"spots/{self.spot.id}", self.spot, "image_url")
+        self.spot.save()
+
+    def test_storage_down_releases_uploads(self):
+        backend = StubBackend([StorageError("503")])
+        storage = ResilientStorage(backend, breaker(threshold=1), retries=2, backoff=0)
+        self.assertEqual(uploads.process_batch(storage, workers=2), (0, 0))
+
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, PendingUpload.PENDING)
+        self.assertEqual(self.upload.attempts, 0)
+        self.assertEqual(len(backend.calls), 1)
+
+    def test_open_circuit_claims_nothing(self):
+        test_breaker = breaker(threshold=1)
+        test_breaker.record_failure()
+        storage = ResilientStorage(StubBackend(), test_breaker, backoff=0)
+        self.assertEqual(uploads.process_batch(storage, workers=2), (0, 0))
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, PendingUpload.PENDING)
+        self.assertIsNone(self.upload.claimed_at)
+
+    def test_other_failures_count_an_attempt(self):
+        backend = StubBackend([StorageError("403", transient=False)])
+        storage = ResilientStorage(backend, breaker(), backoff=0)
+        self.assertEqual(uploads.process_batch(storage, workers=2), (0, 1))
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.status, PendingUpload.PENDING)
+        self.assertEqual(self.upload.attempts, 1)
+
+    def test_stored_upload_replaces_the_spool_url(self):
+        storage = ResilientStorage(StubBackend(), breaker(), backoff=0)
+        self.assertEqual(uploads.process_batch(storage, workers=2), (1, 0))
+        self.spot.refresh_from_db()
+        self.assertEqual(self.spot.image_url, f"https://storage.test/study_spots/{self.upload.path}")
+        self.assertTrue(self.upload.path.endswith(".pdf"))
+
+
+class BarrierBackend(StubBackend):
+    """Each upload waits until ``parties`` uploads are in flight at once."""
+
+    def __init__(self, parties, failures=()):
+        super().__init__(failures)
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def upload(self, bucket, path, data, content_type, immutable=False):
+        self.barrier.wait()
+        super().upload(bucket, path, data, content_type, immutable)
+
+
+class StaffDocumentTests(TestCase):
+    """The documents of one application are stored together."""
+
+    FIELDS = ("government_id", "proof_of_ownership", "proof_of_address")
+
+    def setUp(self):
+        cache.clear()
+        use_spool_dir(self)
+        self.user = User.objects.create_user("applicant", password="pw")
+        self.client.force_login(self.user)
+        files = {
+            field: SimpleUploadedFile(
+                f"{field}.pdf", PDF + field.encode(), content_type="application/pdf"
+            )
+            for field in self.FIELDS
+        }
+        response = self.client.post(reverse("core:apply_staff"), staff_application(**files))
+        self.assertTrue(response.context["submitted"])
+        self.application = StaffApplication.objects.get(user=self.user)
+        self.uploads = list(PendingUpload.objects.order_by("id"))
+
+    def spool_urls(self):
+        self.application.refresh_from_db()
+        return [getattr(self.application, field) for field in self.FIELDS]
+
+    def test_documents_are_spooled_as_one_timed_group(self):
+        self.assertEqual(len(self.uploads), 3)
+        self.assertEqual(len({upload.group for upload in self.uploads}), 1)
+        self.assertTrue(all(upload.spool_ms is not None for upload in self.uploads))
+        self.assertTrue(all(url.startswith("/uploads/spool/") for url in self.spool_urls()))
+
+    def test_documents_are_pushed_concurrently(self):
+        # Deadlocks (and times out) unless all three uploads run at once
+        storage = ResilientStorage(BarrierBackend(3), breaker(), backoff=0)
+        self.assertEqual(uploads.process_batch(storage, workers=3), (3, 0))
+        self.assertEqual(
+            self.spool_urls(),
+            [f"https://storage.test/staff_docs/{upload.path}" for upload in self.uploads],
+        )
+        for upload in PendingUpload.objects.all():
+            self.assertEqual(upload.status, PendingUpload.DONE)
+            self.assertIsNotNone(upload.upload_ms)
+
+    def test_one_failed_document_fails_the_group(self):
+        spool_urls = self.spool_urls()
+        backend = StubBackend([None, StorageError("403", transient=False), None])
+        storage = ResilientStorage(backend, breaker(), backoff=0)
+        with self.assertLogs("core.uploads", "WARNING") as logs:
+            self.assertEqual(uploads.process_batch(storage, workers=3), (0, 3))
+        self.assertEqual(sum("Another file of the group failed" in line for line in logs.output), 2)
+        self.assertEqual(self.spool_urls(), spool_urls)
+        self.assertEqual(
+            sorted(PendingUpload.objects.values_list("attempts", flat=True)), [1, 1, 1]
+        )
+        # The two stored copies are kept; the retry only pushes the third
+        self.assertEqual(StoredObject.objects.count(), 2)
+        PendingUpload.objects.update(available_at=timezone.now())
+        backend.calls.clear()
+        self.assertEqual(uploads.process_batch(storage, workers=3), (3, 0))
+        self.assertEqual(len(backend.calls), 1)
+        self.assertTrue(all(url.startswith("https://storage.test/") for url in self.spool_urls()))
+
+    def test_group_held_in_part_by_another_uploader_waits(self):
+        PendingUpload.objects.filter(pk=self.uploads[0].pk).update(
+            status=PendingUpload.UPLOADING, claimed_by="other", claimed_at=timezone.now()
+        )
+        spool_urls = self.spool_urls()
+        storage = ResilientStorage(StubBackend(), breaker(), backoff=0)
+        self.assertEqual(uploads.process_batch(storage, workers=3), (0, 0))
+        self.assertEqual(self.spool_urls(), spool_urls)
+        self.assertEqual(
+            PendingUpload.objects.filter(status=PendingUpload.PENDING, attempts=0).count(), 2
+        )
+
+
+class UploadPipelineTests(TestCase):
+    """A listing image from the view, through the spool, into LocalStorage."""
+
+    def setUp(self):
+        cache.clear()
+        self.spool_dir = use_spool_dir(self)
+        self.storage_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_root, ignore_errors=True)
+        settings_override = override_settings(
+            STORAGE_BACKEND="local", LOCAL_STORAGE_ROOT=Path(self.storage_root)
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # A fresh process-wide backend, built from the settings above
+        patcher = mock.patch("core.storage._storage", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user("lister", password="pw")
+        user.userprofile.is_contributor = True
+        user.userprofile.save()
+        self.client.force_login(user)
+
+    def test_listing_image_is_stored_and_swapped_in(self):
+        image = io.BytesIO()
+        Image.new("RGB", (64, 48), "teal").save(image, "PNG")
+        response = self.client.post(reverse("core:create_listing"), {
+            "name": "Pipeline Cafe",
+            "location": "Lahug, Cebu City",
+            "description": "Quiet",
+            "image": SimpleUploadedFile("cafe.png", image.getvalue(), content_type="image/png"),
+        })
+        self.assertEqual(response.status_code, 302)
+        spot = StudySpot.objects.get(name="Pipeline Cafe")
+        upload = PendingUpload.objects.get()
+        self.assertEqual(spot.image_url, uploads.spool_url(upload.spool_name))
+        self.assertTrue(uploads.spool_file(upload.spool_name).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("process_uploads", "--once", stdout=io.StringIO())
+
+        spot.refresh_from_db()
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, PendingUpload.DONE)
+        self.assertEqual(spot.image_url, f"/media/storage/study_spots/{upload.path}")
+        stored = Path(self.storage_root, "study_spots", upload.path)
+        self.assertEqual(stored.read_bytes(), image.getvalue())
+        self.assertFalse(uploads.spool_file(upload.spool_name).exists())
+        # Pages rendered before the swap still find the image
+        response = self.client.get(uploads.spool_url(upload.spool_name))
+        self.assertRedirects(response, spot.image_url, fetch_redirect_response=False)
+
+    def store_image(self, spot, data):
+        upload = uploads.spool(
+            SimpleUploadedFile("photo.png", data, content_type="image/png"),
+            "study_spots", f"spots/{spot.id}", spot, "image_url",
+            variants_field="image_variants",
+        )
+        spot.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("process_uploads", "--once", stdout=io.StringIO())
+        spot.refresh_from_db()
+        return upload
+
+    def png(self, color):
+        image = io.BytesIO()
+        Image.new("RGB", (64, 48), color).save(image, "PNG")
+        return image.getvalue()
+
+    def test_same_bytes_are_stored_once_under_their_hash(self):
+        spot = make_spot(User.objects.get(), "Hashed")
+        data = self.png("teal")
+        upload = self.store_image(spot, data)
+        self.assertEqual(upload.path, f"spots/{spot.id}/{hashlib.sha256(data).hexdigest()}.png")
+        stored = StoredObject.objects.get()
+        self.assertEqual((stored.url, stored.size), (spot.image_url, len(data)))
+        self.assertEqual(stored.variants, spot.image_variants)
+
+        # Uploading the same photo again points straight at the stored copy
+        spot.image_url, spot.image_variants = "", {}
+        self.assertIsNone(self.store_image(spot, data))
+        self.assertEqual(PendingUpload.objects.count(), 1)
+        self.assertEqual((spot.image_url, spot.image_variants), (stored.url, stored.variants))
+        self.assertEqual(StoredObject.objects.count(), 1)
+        self.assertEqual(list(Path(self.spool_dir).iterdir()), [])
+
+    def test_gc_storage_deletes_replaced_objects(self):
+        spot = make_spot(User.objects.get(), "Rephotographed")
+        self.store_image(spot, self.png("teal"))
+        old = StoredObject.objects.get()
+        self.store_image(spot, self.png("navy"))
+        current = StoredObject.objects.exclude(pk=old.pk).get()
+        self.assertEqual(spot.image_url, current.url)
+        folder = Path(self.storage_root, "study_spots", f"spots/{spot.id}")
+        # The photo and its variants (<sha256>-card.webp, ...)
+        old_files = {path.name for path in folder.glob(f"{Path(old.path).stem}*")}
+        self.assertGreater(len(old_files), 1)
+
+        # Within the grace period everything is kept
+        output = io.StringIO()
+        call_command("gc_storage", stdout=output)
+        self.assertIn("0 orphaned objects", output.getvalue())
+
+        StoredObject.objects.update(last_used_at=timezone.now() - timedelta(days=2))
+        output = io.StringIO()
+        call_command("gc_storage", "--dry-run", stdout=output)
+        self.assertIn(f"study_spots/{old.path}", output.getvalue())
+        self.assertEqual(StoredObject.objects.count(), 2)
+
+        call_command("gc_storage", stdout=io.StringIO())
+        self.assertEqual(list(StoredObject.objects.all()), [current])
+        remaining = {path.name for path in folder.iterdir()}
+        self.assertFalse(old_files & remaining)
+        self.assertIn(Path(current.path).name, remaining)
+
+
+class StorageHealthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("core:storage_health")
+
+    def test_anonymous_and_regular_users_are_refused(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(User.objects.create_user("user", password="pw"))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_staff_can_see_it(self):
+        self.client.force_login(User.objects.create_user("staff", password="pw", is_staff=True))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["storage"]["state"], "unknown")
+
+    @override_settings(HEALTH_CHECK_TOKEN="secret")
+    def test_monitors_use_the_token(self):
+        self.assertEqual(
+            self.client.get(self.url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403
+        )
+        self.assertEqual(
+            self.client.get(self.url, HTTP_AUTHORIZATION="Bearer secret").status_code, 200
+        )
+
+
+# ---------- UPLOAD LIMITS ----------
+
+class UploadLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        use_spool_dir(self)
+        self.user = User.objects.create_user("applicant", password="pw")
+        self.client.force_login(self.user)
+        self.url = reverse("core:apply_staff")
+
+    def test_accepted_file_next_to_a_refused_field(self):
+        response = self.client.post(self.url, staff_application(
+            government_id=SimpleUploadedFile("id.pdf", PDF, content_type="application/pdf"),
+            foo=SimpleUploadedFile("foo.txt", b"not a field we take files in", content_type="text/plain"),
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["submitted"])
+        application = StaffApplication.objects.get(user=self.user)
+        self.assertTrue(application.government_id.startswith("/uploads/spool/"))
+        upload = PendingUpload.objects.get(target_field="government_id")
+        self.assertEqual(upload.content_type, "application/pdf")
+        self.assertEqual(upload.size, len(PDF))
+
+    def test_refused_field_before_an_accepted_file(self):
+        response = self.client.post(self.url, staff_application(
+            foo=SimpleUploadedFile("foo.txt", b"x" * 100, content_type="text/plain"),
+            proof_of_address=SimpleUploadedFile("bill.pdf", PDF, content_type="application/pdf"),
+        ))
+        self.assertTrue(response.context["submitted"])
+        self.assertTrue(
+            StaffApplication.objects.get(user=self.user).proof_of_address.startswith("/uploads/spool/")
+        )
+
+    def test_type_is_sniffed_not_taken_from_the_client(self):
+        response = self.client.post(self.url, staff_application(
+            government_id=SimpleUploadedFile("id.pdf", b"<html>" + b"x" * 100, content_type="application/pdf"),
+        ))
+        self.assertIn("Government id: File must be", response.context["error"])
+        self.assertFalse(StaffApplication.objects.exists())
+        self.assertFalse(PendingUpload.objects.exists())
+
+    def test_oversized_file_is_refused(self):
+        big = b"%PDF-1.4 " + b"x" * (5 * 1024 * 1024)
+        response = self.client.post(self.url, staff_application(
+            proof_of_ownership=SimpleUploadedFile("deed.pdf", big, content_type="application/pdf"),
+        ))
+        self.assertIn("Proof of ownership: File must be at most 5 MB.", response.context["error"])
+        self.assertFalse(StaffApplication.objects.exists())
+
+    def test_tiny_files_are_checked_too(self):
+        response = self.client.post(self.url, staff_application(
+            government_id=SimpleUploadedFile("id.pdf", b"hi", content_type="application/pdf"),
+        ))
+        self.assertIn("Government id: File must be", response.context["error"])
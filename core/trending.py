@@ -0,0 +1,50 @@
+"""
+Time-decayed trending scores.
+
+Every review adds a rating-dependent weight that halves every
+HALF_LIFE_DAYS. Rather than decaying every row as time passes, scores are
+stored relative to a fixed epoch: a review written at time t adds
+weight * 2^((t - epoch) / half-life). Today's score is the stored value
+scaled by the same factor for every spot, so ordering by the stored,
+indexed column is ordering by the current score. Only spots whose reviews
+changed need rescoring; the epoch is moved forward now and then so the
+numbers stay small.
+"""
+
+import math
+from datetime import timedelta
+
+HALF_LIFE_DAYS = 7
+DECAY_PER_SECOND = math.log(2) / timedelta(days=HALF_LIFE_DAYS).total_seconds()
+# Reviews older than this add under 0.1% of their original weight
+HORIZON = timedelta(days=HALF_LIFE_DAYS * 10)
+# Move the epoch forward once scores have grown by 2^13
+REBASE_AFTER = timedelta(days=HALF_LIFE_DAYS * 13)
+
+# Spots flagged is_trending: the top TRENDING_COUNT whose score today is at
+# least MIN_TRENDING_SCORE (a fresh 5-star review scores 2.0)
+TRENDING_COUNT = 12
+MIN_TRENDING_SCORE = 1.5
+
+
+def review_weight(rating):
+    """1 star adds nothing, 3 stars 1.0, 5 stars 2.0."""
+    return (rating - 1) / 2
+
+
+def growth(epoch, when):
+    """Factor between a score at ``epoch`` and the same score at ``when``."""
+    return math.exp(DECAY_PER_SECOND * (when - epoch).total_seconds())
+
+
+def stored_contribution(rating, created_at, epoch):
+    return review_weight(rating) * growth(epoch, created_at)
+
+
+def current_score(stored_score, epoch, now):
+    return stored_score / growth(epoch, now)
+
+
+def stored_threshold(epoch, now):
+    """MIN_TRENDING_SCORE expressed in stored (epoch-relative) units."""
+    return MIN_TRENDING_SCORE * growth(epoch, now)
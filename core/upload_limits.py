@@ -0,0 +1,147 @@
+"""
+Per-field type and size limits for uploaded files, enforced while the
+request body is parsed.
+
+``LimitedUploadHandler`` comes first in settings.FILE_UPLOAD_HANDLERS. It
+identifies each file from its first bytes (not the client's filename or
+content type) and counts bytes as they arrive. Once a file breaks the limits
+for its field in FIELD_LIMITS, the rest of it is discarded unread, so an
+oversized upload costs neither memory nor disk. Files that pass go on to
+Django's own handlers, which keep small files in memory and spill the rest
+to a temporary file. Views then call ``checked_file()``, which returns the
+accepted file or the reason it was rejected.
+"""
+
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+MB = 1024 * 1024
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/avif"}
+DOCUMENT_TYPES = {"application/pdf", "image/jpeg", "image/png", "image/webp"}
+
+# field name -> (max bytes, accepted content types); other file fields are refused
+FIELD_LIMITS = {
+    "image": (10 * MB, IMAGE_TYPES),
+    "avatar": (5 * MB, {"image/jpeg", "image/png", "image/webp"}),
+    "government_id": (5 * MB, DOCUMENT_TYPES),
+    "proof_of_ownership": (5 * MB, DOCUMENT_TYPES),
+    "proof_of_address": (5 * MB, DOCUMENT_TYPES),
+}
+TYPE_NAMES = {
+    "image/jpeg": "JPG",
+    "image/png": "PNG",
+    "image/webp": "WebP",
+    "image/gif": "GIF",
+    "image/avif": "AVIF",
+    "application/pdf": "PDF",
+}
+# Extension stored files get for each accepted type, whatever the client called them
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif",
+    "application/pdf": ".pdf",
+}
+SNIFF_BYTES = 16
+
+
+def sniff(head):
+    """The content type told by a file's first bytes, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    return None
+
+
+def check(field_name, head, size):
+    """Why a file can't be accepted in ``field_name``, or None if it can."""
+    if field_name not in FIELD_LIMITS:
+        return "File uploads aren't accepted here."
+    max_size, content_types = FIELD_LIMITS[field_name]
+    if size > max_size:
+        return f"File must be at most {max_size // MB} MB."
+    if head and sniff(head) not in content_types:
+        names = sorted(TYPE_NAMES[content_type] for content_type in content_types)
+        return f"File must be {', '.join(names[:-1])} or {names[-1]}."
+    return None
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Rejects files that break FIELD_LIMITS as soon as that is known."""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.rejected = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.head = b""
+        self.received = 0
+        # Not SkipFile yet: raised before the next handler has started this
+        # file, it makes the parser close the previous, accepted one
+        self.error = check(field_name, b"", 0)
+        if self.error:
+            self.rejected[field_name] = self.error
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            raise SkipFile(self.error)
+        sniffing = len(self.head) < SNIFF_BYTES
+        if sniffing:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+        self.received += len(raw_data)
+        if (sniffing and len(self.head) == SNIFF_BYTES) or (
+            self.received > FIELD_LIMITS[self.field_name][0]
+        ):
+            self._skip_if(check(self.field_name, self.head, self.received))
+        return raw_data
+
+    def file_complete(self, file_size):
+        # Files shorter than SNIFF_BYTES are only checked here, where the
+        # parser no longer handles SkipFile; checked_file() reports them
+        error = check(self.field_name, self.head, file_size)
+        if error:
+            self.rejected[self.field_name] = error
+        return None  # the next handler builds the file
+
+    def _skip_if(self, error):
+        if error:
+            self.rejected[self.field_name] = error
+            # The parser drops the file and skips the rest of its bytes
+            raise SkipFile(error)
+
+
+def checked_file(request, field_name):
+    """
+    ``(file, None)`` for an accepted upload in ``field_name``, ``(None,
+    error)`` for a rejected one and ``(None, None)`` if there is none. The
+    file's content_type is replaced by the sniffed one.
+    """
+    uploaded_file = request.FILES.get(field_name)
+    for handler in request.upload_handlers:
+        if isinstance(handler, LimitedUploadHandler) and field_name in handler.rejected:
+            return None, handler.rejected[field_name]
+    if uploaded_file is None:
+        return None, None
+
+    # Checked again here in case the handler isn't installed
+    head = uploaded_file.read(SNIFF_BYTES)
+    uploaded_file.seek(0)
+    error = check(field_name, head, uploaded_file.size)
+    if error is None and not uploaded_file.size:
+        error = "File is empty."
+    if error:
+        return None, error
+    uploaded_file.content_type = sniff(head)
+    return uploaded_file, None
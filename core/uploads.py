@@ -0,0 +1,345 @@
+"""
+Spooled uploads: files are acknowledged as soon as they are on local disk.
+
+Views call ``spool()``, which streams the uploaded file into
+settings.UPLOAD_SPOOL_DIR, records a PendingUpload and points the target
+field (``StudySpot.image_url``, ``UserProfile.avatar_url``, ...) at the
+spooled copy, served by the ``spooled_upload`` view. ``manage.py
+process_uploads`` then pushes spooled files to storage a few at a time
+and swaps the field over to the public URL. Once a file is in storage the
+spool URL redirects to it, so pages rendered earlier keep working.
+
+Stored paths are named after the SHA-256 of the uploaded bytes
+(``spots/7/<sha256>.jpg``) and recorded as StoredObject rows, so a URL
+always means the same bytes and can be cached for a year. Bytes that are
+already stored are not uploaded again: ``spool()`` points the field
+straight at the existing object, and the uploader checks once more
+before pushing.
+
+Files spooled with the same ``group`` (the documents of one staff
+application) are claimed and pushed together, concurrently, and their
+rows are only updated once all of them are stored. Each upload records
+how long spooling and pushing it took.
+"""
+
+import hashlib
+import logging
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+
+from . import circuit, images, upload_limits
+from .models import PendingUpload, StoredObject
+from .storage import StorageError, StorageUnavailable
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 6
+RETRY_BASE = timedelta(seconds=10)  # doubled after every failed attempt
+# An upload claimed for longer than this belongs to a crashed uploader
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# How long spool URLs of finished uploads keep redirecting
+DONE_RETENTION = timedelta(days=2)
+
+
+def spool_dir():
+    return Path(settings.UPLOAD_SPOOL_DIR)
+
+
+def spool_file(name):
+    return spool_dir() / name
+
+
+def spool_url(name):
+    return reverse("core:spooled_upload", args=[name])
+
+
+def reuse(bucket, path):
+    """The StoredObject at ``bucket``/``path``, marked as just used, or None."""
+    stored = StoredObject.objects.filter(bucket=bucket, path=path).first()
+    if stored is not None:
+        stored.last_used_at = timezone.now()
+        stored.save(update_fields=["last_used_at"])
+    return stored
+
+
+def elapsed_ms(started):
+    return round((time.monotonic() - started) * 1000)
+
+
+def spool(uploaded_file, bucket, folder, instance, field, variants_field="", group=""):
+    """
+    Save ``uploaded_file`` to the spool for upload to
+    ``bucket``/``folder``/<sha256><ext> and set ``instance.field`` to its
+    spool URL, or to the stored copy's URL if those bytes are already in
+    storage. The caller saves ``instance``; it must already have a
+    primary key. ``uploaded_file`` comes from ``upload_limits.checked_file``:
+    its sniffed content type picks the file extension. With ``variants_field``, resized copies are stored too
+    and their manifest is saved in that field. Uploads sharing a ``group``
+    are stored all or nothing. Returns the PendingUpload,
+    or None if nothing needs uploading. Raises OSError if the file can't
+    be written.
+    """
+    started = time.monotonic()
+    content_type = getattr(uploaded_file, "content_type", "") or ""
+    ext = upload_limits.EXTENSIONS.get(content_type, "")
+    name = f"{uuid.uuid4().hex}{ext}"
+    target = spool_file(name)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    try:
+        with open(target, "wb") as handle:
+            for chunk in uploaded_file.chunks():
+                digest.update(chunk)
+                handle.write(chunk)
+            size = handle.tell()
+    except OSError:
+        target.unlink(missing_ok=True)
+        raise
+    path = f"{folder}/{digest.hexdigest()}{ext}"
+
+    stored = reuse(bucket, path)
+    if stored is not None:
+        target.unlink(missing_ok=True)
+        setattr(instance, field, stored.url)
+        if variants_field:
+            setattr(instance, variants_field, stored.variants)
+        return None
+
+    upload = PendingUpload.objects.create(
+        spool_name=name,
+        bucket=bucket,
+        path=path,
+        size=size,
+        content_type=content_type,
+        target_model=instance._meta.label,
+        target_id=instance.pk,
+        target_field=field,
+        variants_field=variants_field,
+        group=group,
+        spool_ms=elapsed_ms(started),
+    )
+    setattr(instance, field, spool_url(name))
+    return upload
+
+
+# ---------- UPLOADER ----------
+
+def claim(limit):
+    """Mark up to ``limit`` due uploads as ours and return them."""
+    now = timezone.now()
+    # Uploads left "uploading" by a crashed worker go back in the queue
+    PendingUpload.objects.filter(
+        status=PendingUpload.UPLOADING, claimed_at__lt=now - CLAIM_TIMEOUT
+    ).update(status=PendingUpload.PENDING)
+
+    due = list(
+        PendingUpload.objects.filter(status=PendingUpload.PENDING, available_at__lte=now)
+        .order_by("available_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not due:
+        return []
+    # The status condition makes the claim safe with several uploaders
+    token = uuid.uuid4().hex
+    PendingUpload.objects.filter(pk__in=due, status=PendingUpload.PENDING).update(
+        status=PendingUpload.UPLOADING, claimed_by=token, claimed_at=now
+    )
+    # The rest of their groups come along, due or not
+    groups = (
+        PendingUpload.objects.filter(claimed_by=token).exclude(group="").values_list("group", flat=True)
+    )
+    PendingUpload.objects.filter(group__in=list(groups), status=PendingUpload.PENDING).update(
+        status=PendingUpload.UPLOADING, claimed_by=token, claimed_at=now
+    )
+    return list(PendingUpload.objects.filter(claimed_by=token, status=PendingUpload.UPLOADING))
+
+
+def push(storage, upload):
+    """
+    Upload one spooled file (and its image variants, if wanted). Returns
+    (public URL, variant manifest or None). No database access.
+    """
+    content_type = upload.content_type or "application/octet-stream"
+    if not upload.variants_field:
+        # Streamed from disk: memory use doesn't grow with the file
+        try:
+            with open(spool_file(upload.spool_name), "rb") as handle:
+                storage.upload(upload.bucket, upload.path, handle, content_type, immutable=True)
+        except OSError as exc:
+            raise StorageError(f"Spooled file is missing: {exc}") from exc
+        return storage.public_url(upload.bucket, upload.path), None
+
+    # Images are decoded in memory anyway; upload_limits bounds their size
+    try:
+        data = spool_file(upload.spool_name).read_bytes()
+    except OSError as exc:
+        raise StorageError(f"Spooled file is missing: {exc}") from exc
+    try:
+        stripped = images.strip_metadata(data)
+    except images.ImageProcessingError:
+        stripped = None  # not an image we can read; store it as it is
+    if stripped is not None:
+        data, content_type = stripped
+
+    storage.upload(upload.bucket, upload.path, data, content_type, immutable=True)
+    url = storage.public_url(upload.bucket, upload.path)
+
+    manifest = None
+    try:
+        manifest = images.store_variants(storage, upload.bucket, upload.path, data, url)
+    except images.ImageProcessingError as exc:
+        logger.warning("No variants for %s/%s: %s", upload.bucket, upload.path, exc)
+    return url, manifest
+
+
+def remember(upload, public_url, manifest=None):
+    """Record the stored copy of ``upload``, so it is never pushed twice."""
+    StoredObject.objects.get_or_create(
+        bucket=upload.bucket,
+        path=upload.path,
+        defaults={
+            "url": public_url,
+            "size": upload.size,
+            "variants": manifest or {},
+            "target_model": upload.target_model,
+            "target_field": upload.target_field,
+        },
+    )
+
+
+def finish(upload, public_url, manifest=None):
+    model = apps.get_model(upload.target_model)
+    with transaction.atomic():
+        remember(upload, public_url, manifest)
+        target = model.objects.filter(pk=upload.target_id).first()
+        # Only swap the URL if nothing newer replaced the spooled copy since
+        if target is not None and getattr(target, upload.target_field) == spool_url(upload.spool_name):
+            setattr(target, upload.target_field, public_url)
+            fields = [upload.target_field]
+            if upload.variants_field:
+                setattr(target, upload.variants_field, manifest or {})
+                fields.append(upload.variants_field)
+            target.save(update_fields=fields)
+        upload.status = PendingUpload.DONE
+        upload.public_url = public_url
+        upload.last_error = ""
+        upload.save(update_fields=["status", "public_url", "last_error", "upload_ms"])
+        # Not before the caller's transaction (a whole group) commits
+        name = upload.spool_name
+        transaction.on_commit(lambda: spool_file(name).unlink(missing_ok=True))
+    logger.info("Stored %s/%s (%d bytes) in %s ms",
+                upload.bucket, upload.path, upload.size, upload.upload_ms)
+
+
+def fail(upload, error):
+    upload.attempts += 1
+    upload.last_error = str(error)[:1000]
+    if upload.attempts >= MAX_ATTEMPTS:
+        upload.status = PendingUpload.FAILED
+    else:
+        upload.status = PendingUpload.PENDING
+        upload.available_at = timezone.now() + RETRY_BASE * 2 ** (upload.attempts - 1)
+    upload.save(update_fields=["attempts", "last_error", "status", "available_at", "upload_ms"])
+    logger.warning("Upload of %s/%s failed (attempt %d): %s",
+                   upload.bucket, upload.path, upload.attempts, error)
+
+
+def timed_push(storage, upload):
+    """push(), never raising: (result or None, StorageError or None, ms)."""
+    started = time.monotonic()
+    try:
+        return push(storage, upload), None, elapsed_ms(started)
+    except StorageError as exc:
+        return None, exc, elapsed_ms(started)
+
+
+def release(uploads):
+    """Put claimed uploads back in the queue without counting an attempt."""
+    PendingUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).update(
+        status=PendingUpload.PENDING, available_at=timezone.now() + RETRY_BASE
+    )
+
+
+def process_batch(storage, workers):
+    """
+    Claim a batch of uploads and push them with ``workers`` threads.
+    Returns (uploaded, failed); (0, 0) means nothing was due, or storage
+    is down and nothing was tried.
+    """
+    breaker = getattr(storage, "breaker", None)
+    if breaker is not None and not storage.available():
+        return 0, 0
+    # While storage recovers, a single upload tries it out
+    recovering = breaker is not None and breaker.state != circuit.CLOSED
+    batch = claim(1 if recovering else workers * 4)
+    if not batch:
+        return 0, 0
+
+    # The same bytes may have been stored since they were spooled
+    results = {}
+    to_push = []
+    for upload in batch:
+        stored = reuse(upload.bucket, upload.path)
+        if stored is None:
+            to_push.append(upload)
+        else:
+            results[upload.pk] = ((stored.url, stored.variants), None, 0)
+
+    # Threads only talk to storage; the database is updated from here
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [(upload, executor.submit(timed_push, storage, upload)) for upload in to_push]
+        for upload, future in futures:
+            results[upload.pk] = future.result()
+
+    groups = defaultdict(list)
+    for upload in batch:
+        groups[upload.group or upload.pk].append(upload)
+    # Another uploader holding part of a group must not see it half done
+    unfinished = dict(
+        PendingUpload.objects.filter(group__in=[key for key in groups if isinstance(key, str)])
+        .exclude(status=PendingUpload.DONE)
+        .values_list("group")
+        .annotate(count=Count("id"))
+    )
+
+    uploaded = failed = 0
+    for key, members in groups.items():
+        errors = [results[upload.pk][1] for upload in members if results[upload.pk][1]]
+        for upload in members:
+            upload.upload_ms = results[upload.pk][2]
+
+        if not errors and unfinished.get(key, len(members)) == len(members):
+            with transaction.atomic():
+                for upload in members:
+                    finish(upload, *results[upload.pk][0])
+            uploaded += len(members)
+            continue
+
+        for upload in members:
+            if results[upload.pk][0] is not None:
+                remember(upload, *results[upload.pk][0])  # a retry reuses it
+        if all(isinstance(error, StorageUnavailable) for error in errors):
+            release(members)  # incomplete group, or refused without trying
+            continue
+        for upload in members:
+            fail(upload, results[upload.pk][1] or f"Another file of the group failed: {errors[0]}")
+        failed += len(members)
+    return uploaded, failed
+
+
+def prune_done():
+    """Forget finished uploads old enough that no page links their spool URL."""
+    return PendingUpload.objects.filter(
+        status=PendingUpload.DONE, created_at__lt=timezone.now() - DONE_RETENTION
+    ).delete()[0]
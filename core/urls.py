@@ -15,18 +15,29 @@ urlpatterns = [
 
     # Main Pages
     path('home/', views.home, name='home'),           # 🏠 now shows the listings (Study Spots)
+    path('home/cards/', views.home_cards, name='home_cards'),  # infinite scroll pages
     path('map_view/', views.map_view, name='map_view'),  # 🗺️ shows the old home/dashboard layout
+    path('api/spots/', views.spots_api, name='spots_api'),  # viewport / radius queries (JSON)
+    path('api/spots/nearby/', views.nearby_api, name='nearby_api'),  # k nearest spots ("near me")
+    path('api/suggest/', views.suggest_api, name='suggest_api'),  # search box typeahead
+    path('api/map/tiles/<int:zoom>/<int:x>/<int:y>/', views.map_tile_api, name='map_tile_api'),
 
     # Listings Management (for staff)
+    path('uploads/spool/<str:name>', views.spooled_upload, name='spooled_upload'),  # until process_uploads stores it
     path('create-listing/', views.create_listing, name='create_listing'),
     path('my-listings/', views.my_listings, name='my_listings'),
     path('edit-listing/<int:spot_id>/', views.edit_listing, name='edit_listing'),
     path('delete-listing/<int:id>/', views.delete_listing, name='delete_listing'),
     path('spot/<int:spot_id>/', views.studyspot_detail, name='studyspot_detail'),
+    path('spot/<int:spot_id>/reviews/', views.studyspot_reviews, name='studyspot_reviews'),  # "load more" pages
+    path('api/spots/<int:spot_id>/ratings/', views.spot_ratings_api, name='spot_ratings_api'),
  
     # Staff Application
     path('apply-staff/', views.apply_staff, name='apply_staff'),
  
     #Check username uniqueness
     path('api/check-username/', views.check_username_uniqueness, name='check_username_uniqueness'),
+
+    # Monitoring
+    path('health/storage/', views.storage_health, name='storage_health'),  # circuit breaker + upload backlog
 ]
@@ -1,15 +1,24 @@
 # core/views.py
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import login, logout, get_user_model
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
+from django.views.decorators.cache import cache_control, never_cache
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.utils.crypto import constant_time_compare
 
-from .models import UserProfile, StaffApplication, Review
+from .models import PendingUpload, StaffApplication, Review
 from core.models import StudySpot
+from .queries import SpotQuery
+from .pagination import DEFAULT_PAGE_SIZE, Page, keyset_page, approximate_count
+from . import (
+    amenities, caching, clustering, facets, geo, geocoding, nearby, ratings, suggest,
+    storage, upload_limits, uploads,
+)
 from .forms import (
     CustomUserCreationForm,
     CustomAuthenticationForm,
@@ -20,26 +29,8 @@ from .forms import (
 
 from django.conf import settings
 
-import os
 import json
-import time
-
-# --- SUPABASE / STORAGE SETUP ---
-from supabase import create_client, Client
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-try:
-    if SUPABASE_URL and SUPABASE_KEY:
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    else:
-        supabase = None
-        print("WARNING: Supabase credentials not found in environment variables.")
-except Exception as e:
-    supabase = None
-    print(f"ERROR initializing Supabase client: {e}")
+import uuid
 
 User = get_user_model()
 
@@ -57,42 +48,49 @@ def contributor_required(view_func):
     return wrapper
 
 
-def upload_studyspot_image(image_file, spot_id):
+def upload_studyspot_image(image_file, spot):
     """
-    Upload a listing image to Supabase Storage (bucket: study_spots)
-    and return the public URL. Returns None on failure.
+    Spool a listing image for upload to Supabase Storage (bucket:
+    study_spots) and point spot.image_url at the spooled copy until
+    process_uploads has stored it. Returns False if it couldn't be saved.
     """
-    if not supabase:
-        print("Supabase client not initialized.")
-        return None
-
     if not image_file:
-        return None
-
-    bucket_name = "study_spots"  
-
-    # Build path: spots/<spot_id>/main.<ext>
-    ext = os.path.splitext(image_file.name)[1] or ".jpg"
-    path = f"spots/{spot_id}/main{ext}"
+        return False
 
+    # Stored as spots/<spot_id>/<sha256>.<ext>
     try:
-        image_file.seek(0)
-        file_content = image_file.read()
-
-        supabase.storage.from_(bucket_name).upload(
-            path=path,
-            file=file_content,
-            file_options={"content-type": image_file.content_type},
+        uploads.spool(
+            image_file, "study_spots", f"spots/{spot.id}", spot, "image_url",
+            variants_field="image_variants",
         )
+        return True
+    except OSError as e:
+        print(f"[StudySpot Image Upload Error] {e}")
+        return False
 
-        public_url = supabase.storage.from_(bucket_name).get_public_url(path)
-        # Optional cache-buster so browser sees updated image if overwritten
-        public_url = f"{public_url}?v={int(time.time())}"
-        return public_url
 
-    except Exception as e:
-        print(f"[StudySpot Image Upload Error] {e}")
-        return None
+IMAGE_PENDING_MESSAGE = (
+    "Listing saved, image pending: it will be stored once file storage is back."
+)
+
+
+def spooled_upload(request, name):
+    """A spooled upload, or a redirect to it once it's in storage."""
+    upload = PendingUpload.objects.filter(spool_name=name).first()
+    if upload is None:
+        raise Http404
+    if upload.status == PendingUpload.DONE and upload.public_url:
+        # The stored object never changes, so neither does this redirect
+        response = redirect(upload.public_url)
+        response["Cache-Control"] = f"max-age={int(uploads.DONE_RETENTION.total_seconds())}"
+        return response
+    try:
+        handle = open(uploads.spool_file(name), "rb")
+    except OSError:
+        raise Http404
+    response = FileResponse(handle, content_type=upload.content_type or None)
+    response["Cache-Control"] = "private, max-age=60"
+    return response
 
 
 # ---------- AUTH / ACCOUNT VIEWS ----------
@@ -142,83 +140,265 @@ def register_view(request):
 
 @login_required(login_url="core:login")
 def home(request):
-    profile = UserProfile.objects.get(user=request.user)
-
-    query = request.GET.get("q", "").strip()
-    filter_by = request.GET.get("filter", "all")
+    profile = request.user.userprofile
 
-    study_spaces = StudySpot.objects.all()
-
-    # Search
-    if query:
-        study_spaces = study_spaces.filter(
-            Q(name__icontains=query)
-            | Q(location__icontains=query)
-            | Q(description__icontains=query)
+    spot_query = SpotQuery.from_request(request)
+    if spot_query.near:
+        # "Near me" lists the closest spots from the in-memory index
+        page = Page(spot_query.nearest())
+        total_count, count_is_estimate = len(page.items), False
+    else:
+        page, total_count, count_is_estimate = _listing_page(
+            spot_query, request.GET.get("cursor")
         )
 
-    # Filters
-    if filter_by == "wifi":
-        study_spaces = study_spaces.filter(wifi=True)
-    elif filter_by == "ac":
-        study_spaces = study_spaces.filter(ac=True)
-    elif filter_by == "outlets":
-        study_spaces = study_spaces.filter(outlets=True)
-    elif filter_by == "coffee":
-        study_spaces = study_spaces.filter(coffee=True)
-    elif filter_by == "pastries":
-        study_spaces = study_spaces.filter(pastries=True)
-    elif filter_by == "open24":
-        study_spaces = study_spaces.filter(open_24_7=True)
-    elif filter_by == "trending":
-        study_spaces = study_spaces.filter(is_trending=True)
+    # Per-amenity result counts on the filter chips while searching/filtering
+    amenity_counts = None
+    if spot_query.is_filtered and not spot_query.near:
+        amenity_counts = facets.amenity_counts(spot_query)
 
     context = {
-        "study_spaces": study_spaces,
-        "query": query,
-        "filter_by": filter_by,
+        "study_spaces": page.items,
+        "next_page_url": _next_page_url(request, page),
+        "total_count": total_count,
+        "count_is_estimate": count_is_estimate,
+        "query": spot_query.q,
+        "active_amenities": spot_query.amenities,
+        "near_me": spot_query.near is not None,
+        "amenity_counts": amenity_counts,
         "profile": profile,
     }
     return render(request, "home.html", context)
 
 
 @login_required(login_url="core:login")
-def map_view(request):
-    profile = UserProfile.objects.get(user=request.user)
+def home_cards(request):
+    """Next page of home cards for infinite scroll (HTML fragment)."""
+    spot_query = SpotQuery.from_request(request)
+    page, _, _ = _listing_page(spot_query, request.GET.get("cursor"))
+
+    response = render(
+        request, "partials/home_spot_cards.html", {"study_spaces": page.items}
+    )
+    response["X-Next-Page"] = _next_page_url(request, page) or ""
+    return response
+
 
-    query = request.GET.get("q", "")
-    filter_by = request.GET.get("filter", "all")
+LISTING_CACHE_TIMEOUT = 60 * 5
 
-    study_spots = StudySpot.objects.all()
 
-    if query:
-        study_spots = study_spots.filter(
-            Q(name__icontains=query)
-            | Q(location__icontains=query)
-            | Q(description__icontains=query)
+def _listing_page(spot_query, cursor, page_size=DEFAULT_PAGE_SIZE):
+    """
+    (page, total_count, count_is_estimate) for a listing, cached per
+    normalised query and cursor until the catalog changes.
+    """
+    def compute():
+        queryset = spot_query.apply()
+        page = keyset_page(queryset, spot_query.ordering, cursor, page_size)
+        total_count, count_is_estimate = approximate_count(
+            queryset, filtered=spot_query.is_filtered
         )
+        return page, total_count, count_is_estimate
+
+    return caching.get_or_compute(
+        "listing",
+        (spot_query.cache_parts, cursor or "", page_size),
+        compute,
+        LISTING_CACHE_TIMEOUT,
+    )
+
+
+def _next_page_url(request, page):
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params["cursor"] = page.next_cursor
+    return f"{reverse('core:home_cards')}?{params.urlencode()}"
+
+
+MAP_SIDEBAR_PAGE_SIZE = 50
+
 
-    if filter_by == "wifi":
-        study_spots = study_spots.filter(wifi=True)
-    elif filter_by == "ac":
-        study_spots = study_spots.filter(ac=True)
-    elif filter_by == "coffee":
-        study_spots = study_spots.filter(coffee=True)
-    elif filter_by == "open24":
-        study_spots = study_spots.filter(open_24_7=True)
+@login_required(login_url="core:login")
+def map_view(request):
+    profile = request.user.userprofile
+
+    # The sidebar lists one page of spots; map markers come from the
+    # clustered tile endpoint, so neither grows with the catalog.
+    spot_query = SpotQuery.from_request(request)
+    page, total_count, count_is_estimate = _listing_page(
+        spot_query, None, page_size=MAP_SIDEBAR_PAGE_SIZE
+    )
 
     return render(
         request,
         "map_view.html",
-        {"study_spots": study_spots, "profile": profile},
+        {
+            "study_spots": page.items,
+            "total_count": total_count,
+            "count_is_estimate": count_is_estimate,
+            "map_center": settings.MAP_DEFAULT_CENTER,
+            "map_zoom": settings.MAP_DEFAULT_ZOOM,
+            "query": spot_query.q,
+            "active_amenities": spot_query.amenities,
+            "profile": profile,
+        },
+    )
+
+
+# ---------- MAP / GEO API ----------
+
+SPOT_JSON_FIELDS = (
+    "id", "name", "location", "latitude", "longitude",
+    "average_rating", "image_url", "amenity_mask",
+)
+MAX_API_RESULTS = 500
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 50
+
+
+def _float_param(request, name, default=None):
+    try:
+        return float(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def _int_param(request, name, default, minimum, maximum):
+    try:
+        value = int(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+    return max(minimum, min(maximum, value))
+
+
+def _spot_json(row):
+    data = {
+        "id": row["id"],
+        "name": row["name"],
+        "location": row["location"],
+        "latitude": row["latitude"],
+        "longitude": row["longitude"],
+        "rating": float(row["average_rating"] or 0),
+        "image_url": row["image_url"],
+        "amenities": amenities.keys_for_mask(row["amenity_mask"]),
+        "detail_url": reverse("core:studyspot_detail", args=[row["id"]]),
+    }
+    if "distance_km" in row:
+        data["distance_km"] = row["distance_km"]
+    return data
+
+
+@login_required(login_url="core:login")
+def spots_api(request):
+    """
+    Spots inside ?bbox=south,west,north,east, or within ?radius= km of
+    ?lat=&lng= (nearest first). Takes the same q/amenities filters as the
+    listing pages.
+    """
+    spot_query = SpotQuery.from_request(request)
+    queryset = spot_query.apply().filter(
+        latitude__isnull=False, longitude__isnull=False
     )
+    limit = _int_param(request, "limit", 200, 1, MAX_API_RESULTS)
+
+    bbox = geo.parse_bbox(request.GET.get("bbox"))
+    if bbox:
+        rows = geo.filter_bbox(queryset, bbox).order_by(*spot_query.ordering)
+        rows = list(rows.values(*SPOT_JSON_FIELDS)[:limit])
+    else:
+        lat = _float_param(request, "lat")
+        lng = _float_param(request, "lng")
+        if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return JsonResponse(
+                {"error": "Pass bbox=south,west,north,east or lat and lng."},
+                status=400,
+            )
+        radius = _float_param(request, "radius", DEFAULT_RADIUS_KM)
+        radius = max(0.0, min(radius, MAX_RADIUS_KM))
+
+        candidates = geo.filter_bbox(queryset, geo.bbox_around(lat, lng, radius))
+        candidates = geo.order_by_distance(candidates, lat, lng)
+        rows = geo.nearest(
+            candidates.values(*SPOT_JSON_FIELDS)[:limit], lat, lng, radius, limit
+        )
+
+    return JsonResponse(
+        {"count": len(rows), "results": [_spot_json(row) for row in rows]}
+    )
+
+
+@login_required(login_url="core:login")
+def nearby_api(request):
+    """
+    The ?k= spots nearest to ?lat=&lng=, optionally within ?radius= km and
+    with the given ?amenities=. Served from the in-memory KNN index.
+    """
+    lat = _float_param(request, "lat")
+    lng = _float_param(request, "lng")
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return JsonResponse({"error": "Pass lat and lng."}, status=400)
+    k = _int_param(request, "k", nearby.DEFAULT_K, 1, nearby.MAX_K)
+    radius = _float_param(request, "radius")
+    if radius is not None:
+        radius = max(0.0, min(radius, MAX_RADIUS_KM))
+    keys = amenities.parse_amenities(request.GET.get("amenities"))
+
+    hits = nearby.nearby_index.nearest(lat, lng, k, keys, radius)
+    rows = StudySpot.objects.filter(pk__in=[spot_id for spot_id, _ in hits])
+    rows = {row["id"]: row for row in rows.values(*SPOT_JSON_FIELDS)}
+
+    results = []
+    for spot_id, distance in hits:
+        row = rows.get(spot_id)
+        if row is not None:
+            row["distance_km"] = distance
+            results.append(_spot_json(row))
+    return JsonResponse({"count": len(results), "results": results})
+
+
+@login_required(login_url="core:login")
+def map_tile_api(request, zoom, x, y):
+    """Marker clusters for slippy-map tile zoom/x/y (see core/clustering.py)."""
+    if not (clustering.MIN_ZOOM <= zoom <= clustering.MAX_ZOOM):
+        return JsonResponse({"error": "Unsupported zoom level."}, status=400)
+    if not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+        return JsonResponse({"error": "Tile out of range."}, status=400)
+
+    results = clustering.cluster_index.tile(zoom, x, y)
+    for marker in results:
+        if marker["count"] == 1:
+            marker["detail_url"] = reverse("core:studyspot_detail", args=[marker["id"]])
+
+    return JsonResponse({"zoom": zoom, "x": x, "y": y, "results": results})
+
+
+# ---------- SEARCH SUGGESTIONS ----------
+
+@cache_control(max_age=60)
+def suggest_api(request):
+    """
+    Typeahead for the search boxes: ?prefix= -> top spot names and
+    locations. Served from core.suggest without touching the database or
+    the session, so it stays cheap at keystroke rates; it only exposes
+    names and locations.
+    """
+    limit = _int_param(request, "limit", suggest.DEFAULT_LIMIT, 1, suggest.MAX_LIMIT)
+    results = suggest.suggest_index.suggest(request.GET.get("prefix", ""), limit)
+    return JsonResponse({
+        "results": [
+            dict(item, url=reverse("core:studyspot_detail", args=[item["id"]]))
+            if item["type"] == "spot" else item
+            for item in results
+        ]
+    })
 
 
 # ---------- PROFILE ----------
 
 @login_required(login_url="core:login")
 def profile_view(request):
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.user.userprofile
     return render(
         request,
         "profile.html",
@@ -231,7 +411,7 @@ def profile_view(request):
 
 @login_required(login_url="core:login")
 def manage_profile(request):
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    profile = request.user.userprofile
 
     if request.method == "POST":
         first_name = request.POST.get("first_name", "").strip()
@@ -242,15 +422,12 @@ def manage_profile(request):
         phone_number = request.POST.get("phone_number", "").strip()
         bio = request.POST.get("bio", "").strip()
 
-        avatar = request.FILES.get("avatar")
+        avatar, avatar_error = upload_limits.checked_file(request, "avatar")
         avatar_removed = request.POST.get("avatar_removed")
 
-        bucket_name = "avatars"
-        file_extension = ""
-        if avatar:
-            file_extension = os.path.splitext(avatar.name)[1]
-
-        full_file_path = f"users/{request.user.id}/avatar_final{file_extension}"
+        if avatar_error:
+            messages.error(request, f"Profile picture not accepted: {avatar_error}")
+            return redirect("core:manage_profile")
 
         if not first_name or not last_name or not username or not email:
             messages.error(
@@ -281,41 +458,15 @@ def manage_profile(request):
             profile.avatar_url = placeholder_path
 
         elif avatar:
-            if not supabase:
-                messages.error(request, "File storage service is unavailable.")
-                return redirect("core:manage_profile")
-
-            avatar.file.seek(0)
-            file_content = avatar.file.read()
-
+            # Spooled now, uploaded to Supabase by process_uploads
             try:
-                supabase.storage.from_(bucket_name).update(
-                    file=file_content,
-                    path=full_file_path,
-                    file_options={"content-type": avatar.content_type},
+                uploads.spool(
+                    avatar, "avatars", f"users/{request.user.id}", profile, "avatar_url"
                 )
-            except Exception as e:
-                # Fallback: upload if file doesn't exist yet
-                try:
-                    avatar.file.seek(0)
-                    file_content = avatar.file.read()
-                    supabase.storage.from_(bucket_name).upload(
-                        file=file_content,
-                        path=full_file_path,
-                        file_options={"content-type": avatar.content_type},
-                    )
-                except Exception as upload_e:
-                    print(f"Avatar upload error: {upload_e}")
-                    messages.error(request, "Failed to upload profile picture.")
-                    return redirect("core:manage_profile")
-
-            base_url = supabase.storage.from_(bucket_name).get_public_url(
-                full_file_path
-            )
-            if base_url.endswith("?"):
-                base_url = base_url[:-1]
-            public_url = f"{base_url}?cachebuster={int(time.time())}"
-            profile.avatar_url = public_url
+            except OSError as e:
+                print(f"Avatar upload error: {e}")
+                messages.error(request, "Failed to upload profile picture.")
+                return redirect("core:manage_profile")
 
         profile.full_name = f"{first_name} {middle_initial} {last_name}".strip()
         profile.save()
@@ -334,7 +485,7 @@ def manage_profile(request):
 
 @contributor_required
 def create_listing(request):
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.user.userprofile
 
     if request.method == "POST":
         name = request.POST.get("name")
@@ -345,7 +496,13 @@ def create_listing(request):
         free = request.POST.get("free") == "on"
         coffee = request.POST.get("coffee") == "on"
 
-        image_file = request.FILES.get("image")
+        image_file, image_error = upload_limits.checked_file(request, "image")
+        if image_error:
+            messages.error(request, f"Image not accepted: {image_error}")
+            return redirect("core:create_listing")
+
+        # Cached coordinates only; unknown addresses are queued for geocode_spots
+        latitude, longitude = geocoding.cached_coordinates(location) or (None, None)
 
         # Create spot first (without image_url)
         spot = StudySpot.objects.create(
@@ -358,14 +515,16 @@ def create_listing(request):
             free=free,
             coffee=coffee,
             image_url=None,
+            latitude=latitude,
+            longitude=longitude,
         )
 
-        # Upload to Supabase
+        # Spooled now, uploaded to Supabase by process_uploads
         if image_file:
-            public_url = upload_studyspot_image(image_file, spot.id)
-            if public_url:
-                spot.image_url = public_url
-                spot.save()
+            if upload_studyspot_image(image_file, spot):
+                spot.save(update_fields=["image_url", "image_variants"])
+                if not storage.storage_available():
+                    messages.info(request, IMAGE_PENDING_MESSAGE)
             else:
                 messages.warning(
                     request, "Listing created, but image upload failed."
@@ -385,7 +544,7 @@ def my_listings(request):
 
 @contributor_required
 def edit_listing(request, spot_id):
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.user.userprofile
     spot = get_object_or_404(StudySpot, id=spot_id)
 
     if request.method == "POST":
@@ -397,7 +556,17 @@ def edit_listing(request, spot_id):
         free = request.POST.get("free") == "on"
         coffee = request.POST.get("coffee") == "on"
 
-        image_file = request.FILES.get("image")
+        image_file, image_error = upload_limits.checked_file(request, "image")
+        if image_error:
+            messages.error(request, f"Image not accepted: {image_error}")
+            return redirect("core:edit_listing", spot_id=spot.id)
+
+        if location != spot.location or not spot.has_coordinates:
+            # Old coordinates belong to the old address; geocode_spots fills
+            # them in later if the new one isn't cached yet.
+            spot.latitude, spot.longitude = (
+                geocoding.cached_coordinates(location) or (None, None)
+            )
 
         spot.name = name
         spot.location = location
@@ -408,13 +577,12 @@ def edit_listing(request, spot_id):
         spot.coffee = coffee
 
         if image_file:
-            public_url = upload_studyspot_image(image_file, spot.id)
-            if public_url:
-                spot.image_url = public_url
-            else:
+            if not upload_studyspot_image(image_file, spot):
                 messages.warning(
                     request, "Details updated, but image upload failed."
                 )
+            elif not storage.storage_available():
+                messages.info(request, IMAGE_PENDING_MESSAGE)
 
         spot.save()
         return redirect("core:my_listings")
@@ -445,33 +613,56 @@ def delete_listing(request, id):
 
 @login_required
 def apply_staff(request):
-    profile = UserProfile.objects.get(user=request.user)
+    profile = request.user.userprofile
     application = StaffApplication.objects.filter(user=request.user).first()
 
     if request.method == "POST":
         form = StaffApplicationForm(request.POST, request.FILES, instance=application)
-        if form.is_valid():
-            app = form.save(commit=False)
-            app.user = request.user
-            app.status = "Pending"
-            app.save()
-
-            # optional: upload docs to "staff_docs" bucket if you want
-            if supabase:
-                file_fields = ["government_id", "proof_of_ownership", "proof_of_address"]
-                for field_name in file_fields:
-                    uploaded_file = request.FILES.get(field_name)
-                    if uploaded_file:
-                        path = f"staff_docs/{field_name}/{uploaded_file.name}"
-                        file_content = uploaded_file.read()
-                        supabase.storage.from_("staff_docs").upload(
-                            path, file_content
+
+        # Type and size are checked before anything is saved
+        documents = {}
+        document_errors = []
+        for field_name in ["government_id", "proof_of_ownership", "proof_of_address"]:
+            uploaded_file, error = upload_limits.checked_file(request, field_name)
+            if error:
+                label = field_name.replace("_", " ").capitalize()
+                document_errors.append(f"{label}: {error}")
+            elif uploaded_file:
+                documents[field_name] = uploaded_file
+
+        if form.is_valid() and not document_errors:
+            # Docs are spooled now and uploaded to the "staff_docs" bucket by
+            # process_uploads, together: the application only points at
+            # stored copies once all of them are stored
+            group = uuid.uuid4().hex
+            spooled = []
+            try:
+                with transaction.atomic():
+                    app = form.save(commit=False)
+                    app.user = request.user
+                    app.status = "Pending"
+                    app.save()
+                    for field_name, uploaded_file in documents.items():
+                        upload = uploads.spool(
+                            uploaded_file, "staff_docs", f"staff_docs/{field_name}",
+                            app, field_name, group=group,
                         )
-                        public_url = supabase.storage.from_(
-                            "staff_docs"
-                        ).get_public_url(path)
-                        setattr(app, field_name, public_url)
-                app.save()
+                        if upload is not None:
+                            spooled.append(upload.spool_name)
+                    app.save()
+            except OSError as e:
+                print(f"[Staff Application Upload Error] {e}")
+                for name in spooled:
+                    uploads.spool_file(name).unlink(missing_ok=True)
+                return render(
+                    request,
+                    "apply_staff.html",
+                    {
+                        "form": form,
+                        "application": application,
+                        "error": "Your documents could not be saved. Please try again.",
+                    },
+                )
 
             return render(
                 request,
@@ -485,7 +676,8 @@ def apply_staff(request):
             {
                 "form": form,
                 "application": application,
-                "error": "Please check your form fields and try again.",
+                "error": " ".join(document_errors)
+                or "Please check your form fields and try again.",
             },
         )
 
@@ -501,9 +693,12 @@ def apply_staff(request):
 
 # ---------- STUDYSPOT DETAIL / REVIEWS ----------
 
+REVIEWS_PAGE_SIZE = 10
+REVIEW_ORDERING = ("-created_at", "-id")
+
+
 def studyspot_detail(request, spot_id):
-    spot = get_object_or_404(StudySpot, id=spot_id)
-    reviews = spot.reviews.all().order_by("-created_at")
+    spot = get_object_or_404(StudySpot.objects.defer("search_vector"), id=spot_id)
 
     if request.method == "POST":
         if not request.user.is_authenticated:
@@ -512,17 +707,18 @@ def studyspot_detail(request, spot_id):
 
         form = ReviewForm(request.POST)
         if form.is_valid():
-            if Review.objects.filter(spot=spot, user=request.user).exists():
+            review = form.save(commit=False)
+            review.spot = spot
+            review.user = request.user
+            try:
+                # unique_together (spot, user) rejects a second review
+                review.save()
+            except IntegrityError:
                 messages.error(
                     request,
                     "You have already submitted a review for this spot.",
                 )
             else:
-                review = form.save(commit=False)
-                review.spot = spot
-                review.user = request.user
-                review.save()
-                spot.update_average_rating()
                 messages.success(request, "Your review has been submitted!")
                 return redirect("core:studyspot_detail", spot_id=spot.id)
         else:
@@ -530,15 +726,58 @@ def studyspot_detail(request, spot_id):
     else:
         form = ReviewForm()
 
+    page = _review_page(spot.id, request.GET.get("cursor"))
     return render(
         request,
         "studyspot_detail.html",
-        {"spot": spot, "reviews": reviews, "form": form},
+        {
+            "spot": spot,
+            "reviews": page.items,
+            "next_reviews_url": _next_reviews_url(spot.id, page),
+            "form": form,
+        },
     )
 
 
+def studyspot_reviews(request, spot_id):
+    """Next page of a spot's reviews for "load more" (HTML fragment)."""
+    page = _review_page(spot_id, request.GET.get("cursor"))
+    response = render(request, "partials/review_cards.html", {"reviews": page.items})
+    response["X-Next-Page"] = _next_reviews_url(spot_id, page) or ""
+    return response
+
+
+def _review_page(spot_id, cursor):
+    reviews = Review.objects.filter(spot_id=spot_id).select_related("user")
+    return keyset_page(reviews, REVIEW_ORDERING, cursor, page_size=REVIEWS_PAGE_SIZE)
+
+
+def _next_reviews_url(spot_id, page):
+    if not page.has_next:
+        return None
+    url = reverse("core:studyspot_reviews", args=[spot_id])
+    return f"{url}?cursor={page.next_cursor}"
+
+
+@login_required(login_url="core:login")
+def spot_ratings_api(request, spot_id):
+    """Average, count and star histogram from the spot's stored counters."""
+    spot = get_object_or_404(
+        StudySpot.objects.only("id", "average_rating", "rating_count", *ratings.BUCKET_FIELDS),
+        id=spot_id,
+    )
+    return JsonResponse({
+        "id": spot.id,
+        "average": float(spot.average_rating),
+        "count": spot.rating_count,
+        "histogram": {
+            str(stars): count for stars, count, _ in reversed(spot.rating_histogram)
+        },
+    })
+
+
 def trending_studyspots(request):
-    trending_spots = StudySpot.objects.filter(is_trending=True)
+    trending_spots = StudySpot.objects.filter(is_trending=True).order_by("-trending_score")
     return render(
         request,
         "core/trending.html",
@@ -589,3 +828,36 @@ def check_username_uniqueness(request):
         return JsonResponse(
             {"error": "Database error during availability check."}, status=500
         )
+
+
+# ---------- HEALTH ----------
+
+def health_check_allowed(request):
+    """Staff, or a monitor with the HEALTH_CHECK_TOKEN bearer token."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = settings.HEALTH_CHECK_TOKEN
+    header = request.headers.get("Authorization", "")
+    return bool(token) and constant_time_compare(header, f"Bearer {token}")
+
+
+@never_cache
+def storage_health(request):
+    """Storage circuit state and upload backlog, for monitoring."""
+    if not health_check_allowed(request):
+        raise PermissionDenied
+    health = storage.health()
+    backlog = PendingUpload.objects.exclude(status=PendingUpload.DONE)
+    oldest = backlog.filter(status=PendingUpload.PENDING).order_by("created_at").first()
+    return JsonResponse(
+        {
+            "storage": health,
+            "uploads": {
+                "pending": backlog.filter(status=PendingUpload.PENDING).count(),
+                "uploading": backlog.filter(status=PendingUpload.UPLOADING).count(),
+                "failed": backlog.filter(status=PendingUpload.FAILED).count(),
+                "oldest_pending": oldest.created_at.isoformat() if oldest else None,
+            },
+        },
+        status=503 if health["state"] == "open" else 200,
+    )
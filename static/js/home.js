@@ -73,31 +73,80 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 });
+// ======================================
+// SEARCH SUGGESTIONS (TYPEAHEAD)
+// ======================================
+
+if (mainSearch && mainSearch.dataset.suggestUrl) {
+  const suggestionList = document.getElementById('spotSuggestions');
+  let suggestTimer = null;
+  let suggestions = [];
+
+  mainSearch.addEventListener('input', () => {
+    clearTimeout(suggestTimer);
+    const prefix = mainSearch.value.trim();
+    if (prefix.length < 2) return;
+
+    suggestTimer = setTimeout(async () => {
+      try {
+        const response = await fetch(`${mainSearch.dataset.suggestUrl}?prefix=${encodeURIComponent(prefix)}`);
+        if (!response.ok) return;
+        suggestions = (await response.json()).results;
+        suggestionList.innerHTML = '';
+        suggestions.forEach(item => {
+          const option = document.createElement('option');
+          option.value = item.text;
+          option.label = item.type === 'spot' ? item.location : 'Location';
+          suggestionList.appendChild(option);
+        });
+      } catch (err) {
+        console.error('Could not load suggestions:', err);
+      }
+    }, 150);
+  });
+
+  // Picking a spot name goes straight to that spot
+  mainSearch.addEventListener('change', () => {
+    const picked = suggestions.find(item => item.type === 'spot' && item.text === mainSearch.value);
+    if (picked) window.location.href = picked.url;
+  });
+}
+
 // ======================================
 // FILTER BUTTON BACKEND LINKING
 // ======================================
 
 document.addEventListener("DOMContentLoaded", function () {
   const tags = document.querySelectorAll(".filter-tags .tag");
+  const params = new URLSearchParams(window.location.search);
+
+  // Active amenities come from ?amenities=wifi,outlets (or the older ?filter=wifi)
+  const active = new Set((params.get("amenities") || "").split(",").filter(Boolean));
+  const legacyFilter = params.get("filter");
+  if (legacyFilter && legacyFilter !== "all") active.add(legacyFilter);
 
   tags.forEach(tag => {
     tag.addEventListener("click", () => {
       const filter = tag.getAttribute("data-filter");
-      const baseUrl = window.location.pathname;
 
-      if (filter === "all") {
-        window.location.href = baseUrl;
-      } else {
-        window.location.href = `${baseUrl}?filter=${filter}`;
-      }
+      // Tags combine: clicking one toggles it, "All" clears them
+      if (filter === "all") active.clear();
+      else if (active.has(filter)) active.delete(filter);
+      else active.add(filter);
+
+      params.delete("filter");
+      if (active.size > 0) params.set("amenities", Array.from(active).join(","));
+      else params.delete("amenities");
+
+      const query = params.toString();
+      window.location.href = query ? `${window.location.pathname}?${query}` : window.location.pathname;
     });
   });
 
-  // Highlight active tag based on current ?filter param
-  const currentFilter = new URLSearchParams(window.location.search).get("filter") || "all";
+  // Highlight active tags
   tags.forEach(btn => {
-    if (btn.dataset.filter === currentFilter) btn.classList.add("active");
-    else btn.classList.remove("active");
+    const isActive = btn.dataset.filter === "all" ? active.size === 0 : active.has(btn.dataset.filter);
+    btn.classList.toggle("active", isActive);
   });
 });
 
@@ -108,9 +157,33 @@ document.addEventListener("DOMContentLoaded", function () {
 const sortSelect = document.getElementById('sortSelect');
 const cardsGrid = document.getElementById('cardsGrid');
 
+// "Nearest to You" and "Newest" are server-side listings: reload the feed
+// with or without ?near=lat,lng, keeping the other filters.
+function reloadFeed(near) {
+  const params = new URLSearchParams(window.location.search);
+  params.delete('cursor');
+  if (near) params.set('near', near);
+  else params.delete('near');
+  const query = params.toString();
+  window.location.href = query ? `${window.location.pathname}?${query}` : window.location.pathname;
+}
+
 if (sortSelect && cardsGrid) {
   sortSelect.addEventListener('change', (e) => {
     const sortValue = e.target.value;
+
+    if (sortValue === 'nearest') {
+      if (!navigator.geolocation) return;
+      navigator.geolocation.getCurrentPosition(
+        (position) => reloadFeed(`${position.coords.latitude.toFixed(5)},${position.coords.longitude.toFixed(5)}`),
+        (err) => console.error('Could not get location:', err),
+      );
+      return;
+    }
+    if (sortValue === 'newest') {
+      reloadFeed(null);
+      return;
+    }
     const cardsArray = Array.from(spotCards);
     
     cardsArray.sort((a, b) => {
@@ -125,10 +198,6 @@ if (sortSelect && cardsGrid) {
           const ratingB = parseFloat(b.querySelector('.card-badge').textContent);
           return ratingB - ratingA;
           
-        case 'nearest':
-          // For now, just reverse order as placeholder
-          return 0;
-          
         case 'popular':
           // Placeholder for popular sorting
           return 0;
@@ -424,33 +493,66 @@ document.addEventListener("DOMContentLoaded", () => {
 // ======================================
 // OWNER SPOT CONTROLS TOGGLE
 // ======================================
+// Delegated so cards appended by infinite scroll work too
+document.addEventListener('click', (e) => {
+  const settingsButton = e.target.closest('.ctrl-btn-settings');
+  const cancelButton = e.target.closest('.ctrl-btn.cancel');
+  const button = settingsButton || cancelButton;
+  if (!button) return;
+
+  const controlsContainer = button.closest('.card-controls');
+  const defaultControls = controlsContainer.querySelector('.owner-controls-default');
+  const editControls = controlsContainer.querySelector('.owner-controls-edit');
+  if (!defaultControls || !editControls) return;
+
+  if (settingsButton) {
+    defaultControls.style.display = 'none';
+    editControls.style.display = 'flex';
+  } else {
+    editControls.style.display = 'none';
+    defaultControls.style.display = 'flex';
+  }
+});
+
+// ======================================
+// INFINITE SCROLL
+// ======================================
+// The server renders the first page; further pages come from the
+// home/cards/ fragment endpoint, which returns the next URL in X-Next-Page.
 document.addEventListener('DOMContentLoaded', () => {
-  const allControls = document.querySelectorAll('.card-controls');
-
-  allControls.forEach(controlsContainer => {
-    const settingsButton = controlsContainer.querySelector('.ctrl-btn-settings');
-    const cancelButton = controlsContainer.querySelector('.ctrl-btn.cancel');
-    const defaultControls = controlsContainer.querySelector('.owner-controls-default');
-    const editControls = controlsContainer.querySelector('.owner-controls-edit');
-
-    // Handle click on the settings (gear) icon
-    if (settingsButton) {
-      settingsButton.addEventListener('click', () => {
-        if (defaultControls && editControls) {
-          defaultControls.style.display = 'none';
-          editControls.style.display = 'flex';
-        }
-      });
+  const sentinel = document.getElementById('feedSentinel');
+  const grid = document.getElementById('cardsGrid');
+  if (!sentinel || !grid) return;
+
+  let loading = false;
+
+  const feedObserver = new IntersectionObserver(async (entries) => {
+    if (!entries.some(entry => entry.isIntersecting) || loading) return;
+    const nextUrl = sentinel.dataset.nextUrl;
+    if (!nextUrl) return;
+
+    loading = true;
+    try {
+      const response = await fetch(nextUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } });
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+      grid.insertAdjacentHTML('beforeend', await response.text());
+      const following = response.headers.get('X-Next-Page');
+      if (following) {
+        sentinel.dataset.nextUrl = following;
+        // Re-observe so a sentinel that is still on screen loads the next page
+        feedObserver.unobserve(sentinel);
+        feedObserver.observe(sentinel);
+      } else {
+        feedObserver.disconnect();
+        sentinel.remove();
+      }
+    } catch (err) {
+      console.error('Could not load more study spots:', err);
+    } finally {
+      loading = false;
     }
+  }, { rootMargin: '400px 0px' });
 
-    // Handle click on the new cancel button
-    if (cancelButton) {
-      cancelButton.addEventListener('click', () => {
-        if (defaultControls && editControls) {
-          editControls.style.display = 'none';
-          defaultControls.style.display = 'flex';
-        }
-      });
-    }
-  });
+  feedObserver.observe(sentinel);
 });
@@ -375,7 +375,8 @@ function applyFilters() {
 function updateMarkerVisibility() {
   const searchTerm = searchSpot ? searchSpot.value.toLowerCase() : ""
 
-  mapMarkers.forEach((marker) => {
+  // Markers are (re)created by loadClusters, so look them up each time
+  document.querySelectorAll(".map-marker[data-spot-id]").forEach((marker) => {
     const spotId = marker.dataset.spotId
     const card = document.querySelector(`.map-card-link[data-spot-id="${spotId}"]`)
     if (!card) return
@@ -629,17 +630,107 @@ spotCards.forEach((card) => {
   })
 })
 
-mapMarkers.forEach((marker) => {
-  marker.addEventListener("click", () => {
+// ===== Clustered Markers =====
+// Markers come from api/map/tiles/<zoom>/<x>/<y>/, one request per 256px
+// Web Mercator tile in view, so the payload depends on the viewport and
+// not on how many spots exist.
+const mapContainer = document.querySelector(".map-container")
+const markersLayer = document.getElementById("mapMarkers")
+const TILE_SIZE = 256
+
+function projectToWorld(lat, lng, zoom) {
+  const sinLat = Math.sin((Math.max(-85.05, Math.min(85.05, lat)) * Math.PI) / 180)
+  const scale = TILE_SIZE * 2 ** zoom
+  return {
+    x: ((lng + 180) / 360) * scale,
+    y: (0.5 - Math.log((1 + sinLat) / (1 - sinLat)) / (4 * Math.PI)) * scale,
+  }
+}
+
+function createMarker(marker, left, top) {
+  const el = document.createElement("div")
+  el.className = "map-marker visible"
+  el.style.left = `${left}%`
+  el.style.top = `${top}%`
+
+  if (marker.count > 1) {
+    el.classList.add("cluster")
+    el.innerHTML = `<div class="marker-pin"><span class="marker-count">${marker.count}</span><div class="marker-shadow"></div></div>`
+    el.title = `${marker.count} study spots`
+  } else {
+    el.dataset.spotId = String(marker.id)
+    el.dataset.detailUrl = marker.detail_url
+    el.innerHTML = '<div class="marker-pin"><i class="fas fa-book-open"></i><div class="marker-shadow"></div></div>'
+    el.title = marker.name
+  }
+  return el
+}
+
+async function loadClusters() {
+  if (!mapContainer || !markersLayer) return
+
+  const { tileUrl, centerLat, centerLng, zoom } = mapContainer.dataset
+  const z = Number.parseInt(zoom, 10)
+  const width = mapContainer.clientWidth
+  const height = mapContainer.clientHeight
+  const center = projectToWorld(Number.parseFloat(centerLat), Number.parseFloat(centerLng), z)
+  const left = center.x - width / 2
+  const top = center.y - height / 2
+  const maxTile = 2 ** z - 1
+
+  const requests = []
+  for (let x = Math.max(0, Math.floor(left / TILE_SIZE)); x <= Math.min(maxTile, Math.floor((left + width) / TILE_SIZE)); x++) {
+    for (let y = Math.max(0, Math.floor(top / TILE_SIZE)); y <= Math.min(maxTile, Math.floor((top + height) / TILE_SIZE)); y++) {
+      const url = tileUrl.replace(/0\/0\/0\/$/, `${z}/${x}/${y}/`)
+      requests.push(fetch(url).then((response) => (response.ok ? response.json() : { results: [] })))
+    }
+  }
+
+  try {
+    const tiles = await Promise.all(requests)
+    markersLayer.innerHTML = ""
+    tiles.forEach((tile) => {
+      tile.results.forEach((marker) => {
+        const point = projectToWorld(marker.latitude, marker.longitude, z)
+        const x = ((point.x - left) / width) * 100
+        const y = ((point.y - top) / height) * 100
+        if (x < 0 || x > 100 || y < 0 || y > 100) return
+        markersLayer.appendChild(createMarker(marker, x, y))
+      })
+    })
+    updateMarkerVisibility()
+  } catch (err) {
+    console.error("Could not load map markers:", err)
+  }
+}
+
+if (markersLayer) {
+  markersLayer.addEventListener("click", (event) => {
+    const marker = event.target.closest(".map-marker[data-spot-id]")
+    if (!marker) return
+
     const spotId = marker.dataset.spotId
+    // Spots outside the sidebar page have no preview data; open them directly
+    if (!spotDataMap.has(spotId)) {
+      window.location.href = marker.dataset.detailUrl
+      return
+    }
     showPreviewCard(spotId)
-    
+
     // Scroll sidebar to the card
     const cardElement = document.querySelector(`.map-card-link[data-spot-id="${spotId}"]`)
     if (cardElement) {
         cardElement.scrollIntoView({ behavior: "smooth", block: "center" })
     }
   })
+}
+
+loadClusters()
+
+let clusterResizeTimer
+window.addEventListener("resize", () => {
+  clearTimeout(clusterResizeTimer)
+  clusterResizeTimer = setTimeout(loadClusters, 250)
 })
 
 if (previewCloseBtn) {
@@ -713,12 +804,59 @@ if (searchAsMove) {
   })
 }
 
-// ===== Location Button =====
+// ===== Location Button / Distance Filter =====
+// Asks api/spots/nearby/ for the closest spots within the slider's radius
+const nearbyApiUrl = document.querySelector(".map-wrapper")?.dataset.nearbyApi
+let userPosition = null
+
+async function applyDistanceFilter() {
+  if (!nearbyApiUrl || !userPosition) return
+
+  const params = new URLSearchParams({
+    lat: userPosition.lat,
+    lng: userPosition.lng,
+    radius: activeFilters.distance,
+    k: 200,
+  })
+  // Keep the page's amenity filters in "near me" results
+  const pageAmenities = new URLSearchParams(window.location.search).get("amenities")
+  if (pageAmenities) params.set("amenities", pageAmenities)
+
+  try {
+    const response = await fetch(`${nearbyApiUrl}?${params}`)
+    if (!response.ok) throw new Error(`HTTP ${response.status}`)
+    const data = await response.json()
+
+    const nearbyIds = new Set(data.results.map((spot) => String(spot.id)))
+    spotCards.forEach((card) => {
+      card.style.display = nearbyIds.has(card.dataset.spotId) ? "block" : "none"
+    })
+    updateMarkerVisibility()
+  } catch (err) {
+    console.error("Could not load nearby spots:", err)
+  }
+}
+
+if (distanceSlider) {
+  distanceSlider.addEventListener("input", (e) => {
+    activeFilters.distance = Number.parseFloat(e.target.value)
+    if (distanceValue) distanceValue.textContent = `${activeFilters.distance} km`
+  })
+  distanceSlider.addEventListener("change", applyDistanceFilter)
+}
+
 const locationBtn = document.querySelector(".location-btn .control-btn")
 if (locationBtn) {
   locationBtn.addEventListener("click", () => {
-    console.log("Centering on user location...")
-    // Add geolocation logic here
+    if (!navigator.geolocation) return
+
+    navigator.geolocation.getCurrentPosition(
+      (position) => {
+        userPosition = { lat: position.coords.latitude, lng: position.coords.longitude }
+        applyDistanceFilter()
+      },
+      (err) => console.error("Could not get location:", err),
+    )
   })
 }
 
@@ -786,6 +924,45 @@ document.addEventListener("DOMContentLoaded", function () {
 })
 
 
+// ===== Search Suggestions (Typeahead) =====
+if (searchSpot && searchSpot.dataset.suggestUrl) {
+  const suggestionList = document.getElementById("spotSuggestions")
+  let suggestTimer = null
+  let suggestions = []
+
+  searchSpot.addEventListener("input", () => {
+    clearTimeout(suggestTimer)
+    const prefix = searchSpot.value.trim()
+    if (prefix.length < 2) return
+
+    suggestTimer = setTimeout(async () => {
+      try {
+        const response = await fetch(`${searchSpot.dataset.suggestUrl}?prefix=${encodeURIComponent(prefix)}`)
+        if (!response.ok) return
+        suggestions = (await response.json()).results
+        suggestionList.innerHTML = ""
+        suggestions.forEach((item) => {
+          const option = document.createElement("option")
+          option.value = item.text
+          option.label = item.type === "spot" ? item.location : "Location"
+          suggestionList.appendChild(option)
+        })
+      } catch (err) {
+        console.error("Could not load suggestions:", err)
+      }
+    }, 150)
+  })
+
+  // Picking a spot name previews it if it's in the sidebar, else opens it
+  searchSpot.addEventListener("change", () => {
+    const picked = suggestions.find((item) => item.type === "spot" && item.text === searchSpot.value)
+    if (!picked) return
+    if (spotDataMap.has(String(picked.id))) showPreviewCard(String(picked.id))
+    else window.location.href = picked.url
+  })
+}
+
+
 // ===== Smart Search Integration =====
 document.addEventListener("DOMContentLoaded", function () {
   const searchInput = document.getElementById("searchSpot")